@@ -9,10 +9,12 @@ from esani_pantportal.models import (
     City,
     Company,
     CompanyBranch,
+    ConsumerSessionCheckpoint,
     DepositPayout,
     DepositPayoutItem,
     ERPCreditNoteExport,
     ERPProductMapping,
+    IngestedFile,
     Kiosk,
     Product,
 )
@@ -57,6 +59,32 @@ class ERPCreditNoteExportAdmin(admin.ModelAdmin):
     ordering = ["-to_date"]
 
 
+class IngestedFileAdmin(admin.ModelAdmin):
+    _fields: list = [
+        "name",
+        "status",
+        "size",
+        "mtime",
+        "sha256",
+        "item_count",
+        "duration",
+        "message",
+        "deposit_payout",
+        "created_at",
+        "updated_at",
+    ]
+    list_display = ["name", "status", "item_count", "duration", "updated_at"]
+    list_filter = ["status"]
+    search_fields = ["name", "sha256"]
+    readonly_fields = _fields
+    ordering = ["-updated_at"]
+
+
+class ConsumerSessionCheckpointAdmin(admin.ModelAdmin):
+    list_display = ["from_date", "to_date", "page_count", "updated_at"]
+    readonly_fields = ["from_date", "to_date", "next", "page_count", "updated_at"]
+
+
 class ERPProductMappingAdmin(admin.ModelAdmin):
     list_display = [
         "item_number",
@@ -169,8 +197,10 @@ class CityAdmin(admin.ModelAdmin):
 
 
 admin.site.register(DepositPayout, DepositPayoutAdmin)
+admin.site.register(ConsumerSessionCheckpoint, ConsumerSessionCheckpointAdmin)
 admin.site.register(ERPCreditNoteExport, ERPCreditNoteExportAdmin)
 admin.site.register(ERPProductMapping, ERPProductMappingAdmin)
+admin.site.register(IngestedFile, IngestedFileAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(City, CityAdmin)
 admin.site.register(Company)
@@ -3,14 +3,17 @@
 # SPDX-License-Identifier: MPL-2.0
 from datetime import datetime
 
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, QuerySet, Subquery
 from django.http import Http404, HttpRequest
 from django.shortcuts import get_object_or_404
-from ninja import FilterSchema, ModelSchema, Query, Schema
+from django.utils import timezone
+from ninja import Field, FilterSchema, ModelSchema, Query, Schema
 from ninja_extra import ControllerBase, api_controller, permissions, route
 from ninja_extra.pagination import paginate
 from ninja_extra.schemas import NinjaPaginationResponseSchema
-from ninja_jwt.authentication import JWTAuth
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 from esani_pantportal.models import HistoricalQRBag  # type: ignore[attr-defined]
 from esani_pantportal.models import (
@@ -21,6 +24,7 @@ from esani_pantportal.models import (
     QRCodeGenerator,
     QRStatus,
 )
+from esani_pantportal.principals import PrincipalJWTAuth
 
 
 class DjangoPermission(permissions.BasePermission):
@@ -31,14 +35,16 @@ class DjangoPermission(permissions.BasePermission):
         "DELETE": "delete",
     }
 
-    def __init__(self, appname, modelname):
+    def __init__(self, appname, modelname, operation=None):
         super().__init__()
         self.appname = appname
         self.modelname = modelname
+        # The operation to check, if it does not follow from the request method
+        self.operation = operation
 
     def has_permission(self, request: HttpRequest, controller: ControllerBase) -> bool:
         method = str(request.method)
-        operation = self.method_map[method]
+        operation = self.operation or self.method_map[method]
         return request.user.has_perm(f"{self.appname}.{operation}_{self.modelname}")
 
 
@@ -81,6 +87,19 @@ class ApprovedProductsAPI:  # type: ignore[call-arg]
         return list(qs)
 
 
+def _get_qr_bag_queryset() -> QuerySet[QRBag]:
+    """Return QR bags with everything needed by `QRBagOut`, so serializing them does
+    not require further queries."""
+    latest_history_date = (
+        HistoricalQRBag.objects.filter(id=OuterRef("pk"))
+        .order_by("-history_date")
+        .values("history_date")[:1]
+    )
+    return QRBag.objects.select_related("owner", "company_branch", "kiosk").annotate(
+        latest_history_date=Subquery(latest_history_date)
+    )
+
+
 class QRBagIn(ModelSchema):
     class Config:
         model = QRBag
@@ -123,8 +142,14 @@ class QRBagOut(ModelSchema):
 
     @staticmethod
     def resolve_updated(obj: QRBag):
-        history = obj.history.order_by("-history_date")
-        return history[0].history_date if history.exists() else None
+        if hasattr(obj, "latest_history_date"):
+            # Annotated by `_get_qr_bag_queryset`
+            return obj.latest_history_date
+        return (
+            obj.history.order_by("-history_date")
+            .values_list("history_date", flat=True)
+            .first()
+        )
 
 
 class QRBagHistoryOut(QRBagOut):
@@ -135,6 +160,30 @@ class QRBagHistoryOut(QRBagOut):
         return obj.history_date
 
 
+class QRBagBatchItemIn(QRBagIn):
+    qr: str
+
+
+class QRBagBatchIn(Schema):
+    items: list[QRBagBatchItemIn] = Field(max_length=settings.QR_BAG_BATCH_SIZE)
+
+
+class QRBagBatchLookupIn(Schema):
+    qrs: list[str] = Field(max_length=settings.QR_BAG_BATCH_SIZE)
+
+
+class QRBagBatchResult(Schema):
+    qr: str
+    # The status code the corresponding single-item request would have returned
+    status_code: int
+    item: QRBagOut | None = None
+    error: str | None = None
+
+
+class QRBagBatchOut(Schema):
+    results: list[QRBagBatchResult]
+
+
 @api_controller(
     "/qrbag",
     tags=["QR-Pose"],
@@ -146,20 +195,20 @@ class QRBagHistoryOut(QRBagOut):
 class QRBagAPI:  # type: ignore[call-arg]
     @route.get(
         "/{qr}",
-        auth=JWTAuth(),
+        auth=PrincipalJWTAuth(),
         response=QRBagOut,
         url_name="qrbag_get",
         summary="QR-pose ud fra kode",
     )
     def get(self, qr: str):
         try:
-            return get_object_or_404(QRBag, qr=qr)
+            return get_object_or_404(_get_qr_bag_queryset(), qr=qr)
         except Http404:
             raise
 
     @route.post(
         "/{qr}",
-        auth=JWTAuth(),
+        auth=PrincipalJWTAuth(),
         url_name="qrbag_create",
         summary="Opret QR-pose",
         response={
@@ -193,7 +242,7 @@ class QRBagAPI:  # type: ignore[call-arg]
 
     @route.patch(
         "/{qr}",
-        auth=JWTAuth(),
+        auth=PrincipalJWTAuth(),
         url_name="qrbag_update",
         summary="Opdatér QR-pose",
         response={
@@ -206,7 +255,7 @@ class QRBagAPI:  # type: ignore[call-arg]
     def update(self, qr: str, payload: QRBagIn):
         # Create QR bag if it does not exist
         try:
-            item = QRBag.objects.get(qr=qr)
+            item = _get_qr_bag_queryset().get(qr=qr)
         except QRBag.DoesNotExist:
             return self.create(qr, payload)  # returns 201 or 400
 
@@ -229,21 +278,147 @@ class QRBagAPI:  # type: ignore[call-arg]
         item.owner = user
 
         if changed:
+            # Use a known history date, so it can be returned without querying the
+            # history
+            now = timezone.now()
+            item._history_date = now  # type: ignore[attr-defined]
             item.save()  # adds history item
+            item.latest_history_date = now  # type: ignore[attr-defined]
             return 200, item
         else:
             return 204, item
 
+    @staticmethod
+    def _get_qr_bags(qrs: list[str], lock: bool = False) -> dict[str, QRBag]:
+        qs = _get_qr_bag_queryset()
+        if lock:
+            qs = qs.select_for_update(of=("self",))
+        return {bag.qr: bag for bag in qs.filter(qr__in=qrs)}
+
+    @route.post(
+        "/batch/lookup",
+        auth=PrincipalJWTAuth(),
+        response=QRBagBatchOut,
+        url_name="qrbag_batch_get",
+        summary="QR-poser ud fra koder",
+        permissions=[
+            permissions.IsAuthenticatedOrReadOnly,
+            DjangoPermission("esani_pantportal", "qrbag", operation="view"),
+        ],
+    )
+    def batch_get(self, payload: QRBagBatchLookupIn):
+        qr_bags = self._get_qr_bags(payload.qrs)
+        results = []
+        for qr in payload.qrs:
+            if qr in qr_bags:
+                results.append({"qr": qr, "status_code": 200, "item": qr_bags[qr]})
+            else:
+                results.append(
+                    {"qr": qr, "status_code": 404, "error": f"qr {qr} not found"}
+                )
+        return {"results": results}
+
+    @route.patch(
+        "/batch/upsert",
+        auth=PrincipalJWTAuth(),
+        url_name="qrbag_batch_update",
+        summary="Opret eller opdatér flere QR-poser",
+        response={
+            200: QRBagBatchOut,  # Meaning: see the status code of each item
+            400: QRBagError,  # Meaning: no QR bags were created or updated
+        },
+    )
+    def batch_update(self, payload: QRBagBatchIn):
+        """Create or update each of the QR bags in the payload, as `update` does.
+
+        All changes are saved in one transaction, and the result of each item is
+        reported with the status code `update` would have returned for it.
+        """
+        user = self.context.request.user  # type: ignore
+        branch = user.branch
+        company_branch = branch if isinstance(branch, CompanyBranch) else None
+        kiosk = branch if isinstance(branch, Kiosk) else None
+
+        try:
+            with transaction.atomic():
+                qr_bags = self._get_qr_bags(
+                    [item.qr for item in payload.items], lock=True
+                )
+                created: list[QRBag] = []
+                updated: list[QRBag] = []
+                results: list[dict] = []
+                seen: set[str] = set()
+                for item in payload.items:
+                    qr = item.qr
+                    data = item.dict(exclude={"qr"}, exclude_unset=True)
+                    bag = qr_bags.get(qr)
+                    if qr in seen:
+                        error = f"qr {qr} occurs more than once"
+                        results.append({"qr": qr, "status_code": 400, "error": error})
+                    elif bag is None and not QRCodeGenerator.qr_code_exists(qr):
+                        error = f"invalid QR code {qr}"
+                        results.append({"qr": qr, "status_code": 400, "error": error})
+                    elif bag is None and data.get("status") is None:
+                        error = f"status is required to create qr {qr}"
+                        results.append({"qr": qr, "status_code": 400, "error": error})
+                    elif bag is None:
+                        bag = QRBag(
+                            qr=qr,
+                            owner=user,
+                            company_branch=company_branch,
+                            kiosk=kiosk,
+                            **data,
+                        )
+                        bag.set_qr_parts()
+                        created.append(bag)
+                        results.append({"qr": qr, "status_code": 201, "item": bag})
+                    else:
+                        changed = bag.owner_id != user.pk or any(
+                            getattr(bag, attr) != value for attr, value in data.items()
+                        )
+                        for attr, value in data.items():
+                            setattr(bag, attr, value)
+                        bag.owner = user
+                        if changed:
+                            updated.append(bag)
+                        status_code = 200 if changed else 204
+                        results.append(
+                            {"qr": qr, "status_code": status_code, "item": bag}
+                        )
+                    seen.add(qr)
+
+                # Use the same history date for all changes, so it can be returned
+                # without querying the history
+                now = timezone.now()
+                bulk_create_with_history(
+                    created, QRBag, default_user=user, default_date=now
+                )
+                bulk_update_with_history(
+                    updated,
+                    QRBag,
+                    ["active", "status", "owner"],
+                    default_user=user,
+                    default_date=now,
+                )
+                for bag in created + updated:
+                    bag.latest_history_date = now  # type: ignore[attr-defined]
+        except IntegrityError:
+            # E.g. a QR bag was created by another request in the meantime
+            return 400, QRBagError(error="could not save QR bags, please try again")
+        return 200, {"results": results}
+
     @route.get(
         "/{qr}/history",
         response=NinjaPaginationResponseSchema[QRBagHistoryOut],
-        auth=JWTAuth(),
+        auth=PrincipalJWTAuth(),
         url_name="qrbag_history",
     )
     @paginate()  # https://eadwincode.github.io/django-ninja-extra/tutorial/pagination/
     def history(self, qr: str):
-        item = get_object_or_404(QRBag, qr=qr)
-        return list(item.history.order_by("history_date"))
+        item = get_object_or_404(QRBag.objects.only("pk"), qr=qr)
+        return item.history.select_related("owner", "company_branch", "kiosk").order_by(
+            "history_date"
+        )
 
 
 class QRStatusOut(ModelSchema):
@@ -7,3 +7,10 @@ from django.apps import AppConfig
 
 class EsaniPantportalConfig(AppConfig):
     name = "esani_pantportal"
+
+    def ready(self):
+        from esani_pantportal import backends, principals, reference_data
+
+        backends.connect_signals()
+        principals.connect_signals()
+        reference_data.connect_signals()
@@ -0,0 +1,155 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+from collections.abc import Iterable
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+from django.contrib.postgres.expressions import ArraySubquery
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from project.cache import bump_namespace_version, get_or_set_versioned, get_version_key
+
+from esani_pantportal.models import (
+    ADMIN_GROUPS,
+    BRANCH_USER,
+    COMPANY_USER,
+    ESANI_USER,
+    KIOSK_USER,
+    BranchUser,
+    CompanyUser,
+    EsaniUser,
+    KioskUser,
+    User,
+)
+
+# The permissions of each user are cached along with the version of this namespace
+# they were read at, so changing the permissions of a group invalidates the cached
+# permissions of all users at once
+PERMISSIONS_NAMESPACE = "permissions"
+PERMISSIONS_VERSION_KEY = get_version_key(PERMISSIONS_NAMESPACE)
+
+# The reverse relation from `User` to the user profile of each user type
+_profile_relations = {
+    ESANI_USER: "esaniuser",
+    BRANCH_USER: "branchuser",
+    COMPANY_USER: "companyuser",
+    KIOSK_USER: "kioskuser",
+}
+
+
+def get_user_with_profile(user_id) -> User | None:
+    """Return the user with the given ID, with its user profile, branch, company and
+    admin status loaded by a single query. Returns None if there is no such user."""
+    group_names = Group.objects.filter(user=OuterRef("pk")).values("name")
+    user = (
+        User.objects.select_related(
+            "esaniuser",
+            "branchuser__branch__company",
+            "companyuser__company",
+            "kioskuser__branch",
+        )
+        .annotate(group_names=ArraySubquery(group_names))
+        .filter(pk=user_id)
+        .first()
+    )
+    if user is None:
+        return None
+
+    # Set the cached properties of `User`, so they are not looked up separately
+    profile = getattr(user, _profile_relations.get(user.user_type, ""), None)
+    user.user_profile = profile
+    user.branch = getattr(profile, "branch", None)
+    if user.user_type == BRANCH_USER:
+        user.company = getattr(user.branch, "company", None)
+    else:
+        user.company = getattr(profile, "company", None)
+    user.is_esani_admin = "EsaniAdmins" in user.group_names
+    user.is_admin = any(name in ADMIN_GROUPS for name in user.group_names)
+    return user
+
+
+def _get_permissions_key(user_id: int) -> str:
+    # The key used by `get_or_set_versioned`
+    return f"{PERMISSIONS_NAMESPACE}:{user_id}"
+
+
+def bump_permissions_version():
+    """Invalidate the cached permissions of all users"""
+    bump_namespace_version(PERMISSIONS_NAMESPACE)
+
+
+def invalidate_permissions(user_ids: Iterable[int]):
+    """Invalidate the cached permissions of the given users"""
+    keys = [_get_permissions_key(user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class ProfileModelBackend(ModelBackend):
+    """`ModelBackend` which loads the user profile along with the user of each
+    request (see `get_user_with_profile`), and which caches the permissions of each
+    user across requests"""
+
+    def get_user(self, user_id):
+        user = get_user_with_profile(user_id)
+        return user if self.user_can_authenticate(user) else None
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if (
+            user_obj.is_active
+            and not user_obj.is_anonymous
+            and obj is None
+            and not hasattr(user_obj, "_perm_cache")
+        ):
+            user_obj._perm_cache = get_or_set_versioned(
+                PERMISSIONS_NAMESPACE,
+                str(user_obj.pk),
+                lambda: super(ProfileModelBackend, self).get_all_permissions(user_obj),
+                settings.PERMISSIONS_CACHE_TIMEOUT,
+            )
+        return super().get_all_permissions(user_obj, obj)
+
+
+def _invalidate_user(sender, instance, **kwargs):
+    # `User.is_superuser` grants all permissions
+    invalidate_permissions([instance.pk])
+
+
+def _invalidate_user_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # `User.groups` or `User.user_permissions` was changed
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidate_permissions([instance.pk])
+    elif pk_set:
+        invalidate_permissions(pk_set)
+    else:
+        # The group or permission was removed from all users
+        bump_permissions_version()
+
+
+def _invalidate_group_permissions(sender, action, **kwargs):
+    # `Group.permissions` was changed
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_permissions_version()
+
+
+def _invalidate_all(sender, **kwargs):
+    bump_permissions_version()
+
+
+def connect_signals():
+    # Each user model sends its own signals
+    for user_model in (User, EsaniUser, BranchUser, CompanyUser, KioskUser):
+        post_save.connect(_invalidate_user, sender=user_model)
+    m2m_changed.connect(_invalidate_user_m2m, sender=User.groups.through)
+    m2m_changed.connect(_invalidate_user_m2m, sender=User.user_permissions.through)
+    m2m_changed.connect(_invalidate_group_permissions, sender=Group.permissions.through)
+    post_delete.connect(_invalidate_all, sender=Group)
+    post_delete.connect(_invalidate_all, sender=Permission)
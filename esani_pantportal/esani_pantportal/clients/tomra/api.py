@@ -27,17 +27,32 @@ To (re)generate the data models, run the following:
         --reuse-model \
         --allow-population-by-field-name \
         --strict-nullable
+
+To test the client and the import against a local simulator instead of the actual
+Tomra API, see `simulator.py`.
+
+The client itself decodes consumer sessions into the slim models in `projections.py`,
+which only contain the fields used by `import_deposit_payouts_qrbag`. To compare the
+decoding speed of the two, run `python manage.py benchmark_tomra_decoding`.
 """
 
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
 
+import orjson
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
-from pydantic import parse_obj_as
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
-from .data_models import ConsumerSessionQueryResponse, Datum
+from .projections import DatumProjection, consumer_session_page_adapter
 
 
 @dataclass
@@ -51,7 +66,9 @@ class ConsumerSessionCollection:
     url: str | None
     from_date: datetime
     to_date: datetime
-    data: list[Datum]
+    data: list[DatumProjection]
+    next: str | None = None
+    """Continuation token of the following page, if this is a single page"""
 
 
 class TomraAPI:
@@ -63,6 +80,24 @@ class TomraAPI:
         "scope": "tomra-apis/external",
     }
 
+    _retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    """Retry policy for all Tomra API requests (including access token requests.)
+    Failed requests are retried with exponential backoff, unless the response has a
+    `Retry-After` header, which is then respected."""
+
+    _pool_maxsize = 10
+    """Maximum number of keep-alive connections kept open per host"""
+
+    _access_token_expiry_margin = 60
+    """Number of seconds before its actual expiry that an access token is renewed"""
+
     @classmethod
     def from_settings(cls):
         if all(
@@ -78,6 +113,7 @@ class TomraAPI:
                 settings.TOMRA_API_KEY,
                 settings.TOMRA_API_CLIENT_ID,
                 settings.TOMRA_API_CLIENT_SECRET,
+                url=settings.TOMRA_API_URL or None,
             )
         else:
             raise ImproperlyConfigured(
@@ -86,42 +122,118 @@ class TomraAPI:
                 "from settings."
             )
 
-    def __init__(self, env: str, api_key: str, client_id: str, client_secret: str):
+    def __init__(
+        self,
+        env: str,
+        api_key: str,
+        client_id: str,
+        client_secret: str,
+        url: str | None = None,
+    ):
         self._env = env
+        self._url = url
         self._api_key = api_key
         self._client_id = client_id
         self._client_secret = client_secret
+        self._access_token: tuple[str, float] | None = None
+        self._access_token_lock = threading.Lock()
+        self._session = self._get_session()
+
+    def close(self):
+        self._session.close()
+
+    def _get_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self._pool_maxsize, max_retries=self._retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = self._user_agent
+        return session
 
     def _get_url(self, path: str, subdomain: str = "api") -> str:
+        if self._url is not None:
+            # All endpoints are served from the same URL (e.g. by the simulator)
+            return f"{self._url}{path}"
         return f"https://{self._env}.{subdomain}.developer.tomra.cloud{path}"
 
+    def _get_access_token_cache_key(self) -> str:
+        return f"tomra_api_access_token:{self._env}:{self._client_id}"
+
     def _get_access_token(self) -> str:
-        response = requests.post(
+        """Return a valid access token.
+
+        Access tokens are kept until shortly before they expire, both on this instance
+        and in the Django cache, so other processes can reuse them.
+        """
+        # Threads sharing this instance wait for a single access token request
+        with self._access_token_lock:
+            return self._get_access_token_unlocked()
+
+    def _get_access_token_unlocked(self) -> str:
+        if self._access_token is not None:
+            token, expires_at = self._access_token
+            if time.monotonic() < expires_at:
+                return token
+
+        cached = cache.get(self._get_access_token_cache_key())
+        if cached is not None:
+            token, expires_at = cached
+            timeout = expires_at - time.time()
+        else:
+            token, timeout = self._request_access_token()
+            cache.set(
+                self._get_access_token_cache_key(),
+                (token, time.time() + timeout),
+                timeout=timeout,
+            )
+
+        self._access_token = (token, time.monotonic() + timeout)
+        return token
+
+    def _request_access_token(self) -> tuple[str, float]:
+        response = self._session.post(
             self._get_url("/oauth2/token", subdomain="auth"),
             auth=(self._client_id, self._client_secret),
             data=self._oauth2_scope_and_grant,
-            headers={"User-Agent": self._user_agent},
         )
         response.raise_for_status()
-        return response.json()["access_token"]
+        doc = response.json()
+        # Tomra access tokens are valid for 1 hour, unless stated otherwise
+        expires_in = doc.get("expires_in", 3600)
+        return doc["access_token"], max(
+            expires_in - self._access_token_expiry_margin, 0
+        )
+
+    def _clear_access_token(self):
+        self._access_token = None
+        cache.delete(self._get_access_token_cache_key())
 
     def _api_request(
         self, method: str, resource: str, query: dict | None = None
     ) -> _APIResponse:
-        # TODO: don't request a new access token on every API request.
-        # (Tomra access tokens are valid for 1 hour.)
-        response = requests.request(
+        response = self._send_api_request(method, resource, query)
+        if response.status_code == 401:
+            # The (cached) access token may have been revoked. Get a new one and try
+            # again once.
+            self._clear_access_token()
+            response = self._send_api_request(method, resource, query)
+        response.raise_for_status()
+        return _APIResponse(
+            url=response.request.url, doc=orjson.loads(response.content)
+        )
+
+    def _send_api_request(
+        self, method: str, resource: str, query: dict | None
+    ) -> requests.Response:
+        return self._session.request(
             method,
             self._get_url(resource),
             params=query,
             headers={
                 "X-Api-Key": self._api_key,
                 "Authorization": f"Bearer {self._get_access_token()}",
-                "User-Agent": self._user_agent,
             },
         )
-        response.raise_for_status()
-        return _APIResponse(url=response.request.url, doc=response.json())
 
     def _to_iso8601_in_utc(self, val: datetime) -> str:
         return val.astimezone().isoformat(timespec="seconds")
@@ -132,33 +244,115 @@ class TomraAPI:
         before: datetime,
         rvm_serials: list[int] | None = None,
     ) -> ConsumerSessionCollection:
-        data: list[Datum] = []
-        continuation_token: str | None = "initial"
-        initial_url: str | None
+        """Return all consumer sessions in the given period as one collection.
 
-        while continuation_token is not None:
-            next = None if continuation_token == "initial" else continuation_token
+        Use `get_consumer_session_pages` to process large periods page by page.
+        """
+        data: list[DatumProjection] = []
+        for page in self.get_consumer_session_pages(after, before, rvm_serials):
+            data.extend(page.data)
+        return ConsumerSessionCollection(
+            url=page.url,
+            from_date=after,
+            to_date=before,
+            data=data,
+        )
+
+    def get_consumer_session_pages(
+        self,
+        after: datetime,
+        before: datetime,
+        rvm_serials: list[int] | None = None,
+        next: str | None = None,
+    ) -> Iterator[ConsumerSessionCollection]:
+        """Yield the consumer sessions in the given period, one page at a time.
+
+        Each page carries the continuation token (`next`) of the following page. Pass
+        it as `next` to resume from that page.
+        """
+        query = {
+            "receivedBefore": self._to_iso8601_in_utc(before),
+            "receivedAfter": self._to_iso8601_in_utc(after),
+            "serialNumbers": rvm_serials,
+        }
+        # URL without continuation token (`next`)
+        url = (
+            requests.Request("GET", self._get_url("/consumer-sessions"), params=query)
+            .prepare()
+            .url
+        )
+
+        while True:
             response: _APIResponse = self._api_request(
                 "GET",
                 "/consumer-sessions",
-                query={
-                    "receivedBefore": self._to_iso8601_in_utc(before),
-                    "receivedAfter": self._to_iso8601_in_utc(after),
-                    "serialNumbers": rvm_serials,
-                    "next": next,
-                },
+                query={**query, "next": next},
+            )
+            next = response.doc.get("next")
+            parsed = consumer_session_page_adapter.validate_python(response.doc)
+            yield ConsumerSessionCollection(
+                url=url,
+                from_date=after,
+                to_date=before,
+                data=parsed.data or [],
+                next=next,
             )
-            continuation_token = response.doc.get("next")
-            parsed = parse_obj_as(ConsumerSessionQueryResponse, response.doc)
-            if parsed.data:
-                data.extend(parsed.data)
             if next is None:
-                initial_url = response.url
+                break
 
-        return ConsumerSessionCollection(
-            # URL without continuation token (`next`)
-            url=initial_url,
-            from_date=after,
-            to_date=before,
-            data=data,
-        )
+    def get_consumer_session_shards(
+        self,
+        after: datetime,
+        before: datetime,
+        shard_size: timedelta = timedelta(days=1),
+        max_workers: int = 4,
+        rvm_serials: list[int] | None = None,
+    ) -> Iterator[ConsumerSessionCollection]:
+        """Yield the consumer sessions in the given period, split into consecutive
+        sub-periods ("shards") of `shard_size`.
+
+        Up to `max_workers` shards are retrieved concurrently, but the shards are
+        yielded in chronological order. A consumer session received on the boundary
+        between two shards is only yielded in the first of them.
+        """
+        windows = iter(self._split_window(after, before, shard_size))
+        seen: set = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit(window):
+                return executor.submit(self.get_consumer_sessions, *window, rvm_serials)
+
+            # Only retrieve `max_workers` shards ahead of the caller, to bound memory
+            pending = deque(
+                submit(window) for _, window in zip(range(max_workers), windows)
+            )
+            while pending:
+                shard = pending.popleft().result()
+                window = next(windows, None)
+                if window is not None:
+                    pending.append(submit(window))
+                shard.data = [
+                    datum for datum in shard.data if self._is_unseen(datum, seen)
+                ]
+                yield shard
+
+    def _split_window(
+        self, after: datetime, before: datetime, shard_size: timedelta
+    ) -> list[tuple[datetime, datetime]]:
+        windows = []
+        start = after
+        while True:
+            end = min(start + shard_size, before)
+            windows.append((start, end))
+            if end >= before:
+                return windows
+            start = end
+
+    def _is_unseen(self, datum: DatumProjection, seen: set) -> bool:
+        session_id = getattr(datum.consumer_session, "id", None)
+        if session_id is None:
+            return True
+        if session_id in seen:
+            return False
+        seen.add(session_id)
+        return True
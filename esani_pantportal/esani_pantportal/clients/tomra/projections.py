@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Slim versions of the autogenerated models in `data_models.py`.
+
+These only declare the fields used by `import_deposit_payouts_qrbag` (the session ID,
+identity, metadata, items and start time.) All other fields in the API responses (e.g.
+rejected items, bulk information and donations) are skipped without being validated,
+which makes decoding large responses considerably faster.
+"""
+
+from uuid import UUID
+
+from pydantic import AwareDatetime, BaseModel, ConfigDict, Field, TypeAdapter
+
+from .data_models import Identity, Metadata
+
+
+class ItemProjection(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    product_code: str | None = Field(None, alias="productCode")
+    count: int
+
+
+class ConsumerSessionProjection(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    id: UUID | None = None
+    started_at: AwareDatetime | None = Field(None, alias="startedAt")
+    identity: Identity | None = None
+    items: list[ItemProjection] | None = None
+    metadata: Metadata | None = None
+
+
+class DatumProjection(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    consumer_session: ConsumerSessionProjection | None = Field(
+        None, alias="consumerSession"
+    )
+
+
+class ConsumerSessionPageProjection(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    data: list[DatumProjection] | None = None
+    next: str | None = None
+
+
+consumer_session_page_adapter = TypeAdapter(ConsumerSessionPageProjection)
+"""Validator for a decoded page of consumer sessions. Building the validator is
+relatively expensive, so it is only done once."""
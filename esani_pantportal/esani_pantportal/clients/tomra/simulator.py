@@ -0,0 +1,330 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+A local stand-in for the Tomra consumer session API, for load and regression testing.
+
+The simulator implements the two endpoints used by `TomraAPI`: `/oauth2/token` and
+`/consumer-sessions`. Consumer sessions are generated on the fly from their position in
+time, so arbitrarily large periods can be served without keeping them in memory, and
+the same session is always returned with the same contents.
+
+To import from the simulator, run `python manage.py run_tomra_simulator` and set
+`TOMRA_API_URL` to the URL it is listening on.
+"""
+
+import base64
+import math
+import random
+import secrets
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import cast
+from urllib.parse import parse_qs, urlsplit
+
+import orjson
+
+_epoch = datetime(2020, 1, 1, tzinfo=UTC)
+
+
+@dataclass
+class SimulatorConfig:
+    sessions_per_day: int = 1000
+    """Number of consumer sessions generated per day"""
+
+    items_per_session: int = 10
+    """Maximum number of items in each consumer session"""
+
+    bags: int = 1000
+    """Number of distinct QR bags. Bag number N has the QR code `<prefix><N:09>`."""
+
+    bag_prefix: int = 0
+    """Prefix of the QR codes of the generated QR bags"""
+
+    rvms: int = 100
+    """Number of distinct RVMs (reverse vending machines)"""
+
+    products: int = 100
+    """Number of distinct product barcodes"""
+
+    page_size: int = 500
+    """Maximum number of consumer sessions per page"""
+
+    latency: float = 0.0
+    """Number of seconds each response is delayed"""
+
+    rate_limit: float = 0.0
+    """Maximum number of requests per second (0 means unlimited.) Requests above the
+    limit get a "429 Too Many Requests" response."""
+
+    error_rate: float = 0.0
+    """Fraction of `/consumer-sessions` requests that fail with `error_status`"""
+
+    error_status: int = HTTPStatus.SERVICE_UNAVAILABLE
+    """Status code of injected errors"""
+
+    token_lifetime: int = 3600
+    """Number of seconds access tokens are valid"""
+
+    seed: int = 0
+    """Seed of the generated data. Changing it changes all consumer sessions."""
+
+
+class ConsumerSessionGenerator:
+    """Deterministic generator of synthetic consumer sessions.
+
+    Consumer session number K is started at `K * interval` after `_epoch`, where the
+    interval is chosen so each day contains `sessions_per_day` sessions.
+    """
+
+    def __init__(self, config: SimulatorConfig):
+        self.config = config
+        self.interval = 86400 / config.sessions_per_day
+        self.barcodes = [
+            f"{5700000000000 + number:013}" for number in range(config.products)
+        ]
+
+    def get_range(self, after: datetime, before: datetime) -> range:
+        """Return the numbers of the consumer sessions started in the given period"""
+        first = math.ceil((after - _epoch).total_seconds() / self.interval)
+        stop = math.ceil((before - _epoch).total_seconds() / self.interval)
+        return range(max(first, 0), max(stop, 0))
+
+    def get_session(self, number: int) -> dict:
+        config = self.config
+        rng = random.Random(f"{config.seed}:{number}")
+        bag = rng.randrange(config.bags)
+        rvm = rng.randrange(config.rvms)
+        started_at = _epoch + timedelta(seconds=number * self.interval)
+        return {
+            "consumerSession": {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "startedAt": started_at.isoformat(timespec="seconds"),
+                "completedAt": (started_at + timedelta(seconds=30)).isoformat(
+                    timespec="seconds"
+                ),
+                "refund": 0,
+                "identity": {"consumerIdentity": f"{config.bag_prefix}{bag:09}"},
+                "items": [
+                    {
+                        "productCode": rng.choice(self.barcodes),
+                        "count": rng.randint(1, 24),
+                        "type": "single",
+                        "manual": False,
+                    }
+                    for _ in range(rng.randint(1, config.items_per_session))
+                ],
+                "metadata": {
+                    "location": {"customerId": str(1000 + rvm % 100)},
+                    "rvm": {"serialNumber": str(100000 + rvm)},
+                },
+            }
+        }
+
+    def get_page(
+        self,
+        after: datetime,
+        before: datetime,
+        next: str | None = None,
+        rvm_serials: set[str] | None = None,
+    ) -> dict:
+        """Return a page of consumer sessions, and the continuation token of the
+        following page (if any.)"""
+        numbers = self.get_range(after, before)
+        start = numbers.start if next is None else decode_token(next)
+        stop = min(start + self.config.page_size, numbers.stop)
+        data = [self.get_session(number) for number in range(start, stop)]
+        if rvm_serials:
+            data = [
+                datum
+                for datum in data
+                if datum["consumerSession"]["metadata"]["rvm"]["serialNumber"]
+                in rvm_serials
+            ]
+        page: dict = {"data": data}
+        if stop < numbers.stop:
+            page["next"] = encode_token(stop)
+        return page
+
+
+def encode_token(number: int) -> str:
+    return base64.urlsafe_b64encode(str(number).encode()).decode()
+
+
+def decode_token(token: str) -> int:
+    return int(base64.urlsafe_b64decode(token.encode()))
+
+
+class _RateLimiter:
+    """Token bucket allowing `rate` requests per second on average"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.rate, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class TomraSimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: SimulatorConfig):
+        super().__init__(address, TomraSimulatorHandler)
+        self.config = config
+        self.generator = ConsumerSessionGenerator(config)
+        self.rate_limiter = (
+            _RateLimiter(config.rate_limit) if config.rate_limit else None
+        )
+        self.rng = random.Random(config.seed)
+        self.access_tokens: dict[str, float] = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = cast(tuple[str, int], self.server_address[:2])
+        return f"http://{host}:{port}"
+
+    def issue_access_token(self) -> str:
+        token = secrets.token_urlsafe(32)
+        with self.lock:
+            self.access_tokens[token] = time.monotonic() + self.config.token_lifetime
+        return token
+
+    def is_valid_access_token(self, token: str) -> bool:
+        with self.lock:
+            return self.access_tokens.get(token, 0) > time.monotonic()
+
+    def inject_error(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.config.error_rate
+
+
+class TomraSimulatorHandler(BaseHTTPRequestHandler):
+    server: TomraSimulatorServer
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self._handle(self._get_access_token)
+
+    def do_GET(self):
+        self._handle(self._get_consumer_sessions)
+
+    def log_message(self, format, *args):
+        # Logging every request slows down the simulator considerably
+        pass
+
+    def _handle(self, handler):
+        with self.server.lock:
+            self.server.request_count += 1
+        # Read the request body, so the connection can be reused
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.server.config.latency:
+            time.sleep(self.server.config.latency)
+        if self.server.rate_limiter and not self.server.rate_limiter.acquire():
+            self._respond(
+                HTTPStatus.TOO_MANY_REQUESTS,
+                {"message": "Too many requests"},
+                headers={"Retry-After": "1"},
+            )
+            return
+        url = urlsplit(self.path)
+        handler(url.path, parse_qs(url.query))
+
+    def _get_access_token(self, path: str, query: dict):
+        if path != "/oauth2/token":
+            self._respond(HTTPStatus.NOT_FOUND, {"message": "Not found"})
+        elif not self.headers.get("Authorization", "").startswith("Basic "):
+            self._respond(HTTPStatus.UNAUTHORIZED, {"error": "invalid_client"})
+        else:
+            self._respond(
+                HTTPStatus.OK,
+                {
+                    "access_token": self.server.issue_access_token(),
+                    "expires_in": self.server.config.token_lifetime,
+                    "token_type": "Bearer",
+                },
+            )
+
+    def _get_consumer_sessions(self, path: str, query: dict):
+        authorization = self.headers.get("Authorization", "")
+        if path != "/consumer-sessions":
+            self._respond(HTTPStatus.NOT_FOUND, {"message": "Not found"})
+        elif not self.headers.get("X-Api-Key"):
+            self._respond(HTTPStatus.FORBIDDEN, {"message": "Forbidden"})
+        elif not self.server.is_valid_access_token(
+            authorization.removeprefix("Bearer ")
+        ):
+            self._respond(HTTPStatus.UNAUTHORIZED, {"message": "Unauthorized"})
+        elif self.server.inject_error():
+            self._respond(
+                HTTPStatus(self.server.config.error_status),
+                {"message": "Injected error"},
+            )
+        else:
+            try:
+                after = datetime.fromisoformat(query["receivedAfter"][0])
+                before = datetime.fromisoformat(query["receivedBefore"][0])
+                page = self.server.generator.get_page(
+                    after,
+                    before,
+                    next=query["next"][0] if "next" in query else None,
+                    rvm_serials=set(query.get("serialNumbers", [])),
+                )
+            except (KeyError, ValueError):
+                self._respond(HTTPStatus.BAD_REQUEST, {"message": "Bad request"})
+            else:
+                self._respond(HTTPStatus.OK, page)
+
+    def _respond(self, status: HTTPStatus, doc: dict, headers: dict | None = None):
+        content = orjson.dumps(doc)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class TomraSimulator:
+    """Runs a `TomraSimulatorServer` in a background thread.
+
+    >>> with TomraSimulator(SimulatorConfig(sessions_per_day=10)) as simulator:
+    ...     api = TomraAPI("env", "key", "id", "secret", url=simulator.url)
+    """
+
+    def __init__(self, config: SimulatorConfig, host: str = "127.0.0.1", port: int = 0):
+        self.server = TomraSimulatorServer((host, port), config)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return self.server.url
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
@@ -0,0 +1,204 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Export of newly generated QR codes to CSV, Excel and zipped CSV files.
+
+The QR codes are generated in chunks, which are computed in parallel by a pool of
+processes for large print runs, and written to the files as they are completed. Only a
+few chunks are kept in memory at any time, regardless of the number of QR codes.
+"""
+
+import csv
+import io
+import multiprocessing
+import os
+import zipfile
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from datetime import date
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from project.util import lazy_import
+
+from esani_pantportal.models import QRCodeGenerator, QRCodeInterval
+
+if TYPE_CHECKING:
+    import xlsxwriter
+    from xlsxwriter.worksheet import Worksheet
+else:
+    xlsxwriter = lazy_import("xlsxwriter")
+
+FORMAT_CSV = "csv"
+FORMAT_XLSX = "xlsx"
+FORMAT_ZIP = "zip"
+FORMATS = (FORMAT_CSV, FORMAT_XLSX, FORMAT_ZIP)
+
+HEADER = ("QR-kode", "Id", "Kontrolkode")
+
+CHUNK_SIZE = 100_000
+"""Number of QR codes computed by each task in the process pool"""
+
+XLSX_MAX_ROWS = 1_048_576
+"""Maximum number of rows in an Excel worksheet (including the header)"""
+
+Row = tuple[str, str, str]
+
+
+def _get_rows(prefix: int, salt: str, start: int, stop: int) -> list[Row]:
+    """Return a (QR code, ID, control code) row for each of the sequence numbers from
+    `start` to `stop`. This runs in the worker processes, so it must not use the
+    database."""
+    url_prefix = f"{settings.QR_URL_PREFIX}{prefix}"
+    id_end = len(url_prefix) + settings.QR_ID_LENGTH
+    rows = []
+    for qr_seqno in range(start, stop):
+        qr_code = QRCodeGenerator._generate_qr(qr_seqno, salt, prefix)
+        rows.append((qr_code, qr_code[len(url_prefix) : id_end], qr_code[id_end:]))
+    return rows
+
+
+def iter_rows(
+    interval: QRCodeInterval,
+    chunk_size: int = CHUNK_SIZE,
+    max_workers: int | None = None,
+) -> Iterator[list[Row]]:
+    """Yield the rows of all QR codes in the interval, in order, one chunk at a time.
+
+    If the interval spans more than one chunk, the chunks are computed by a pool of
+    `max_workers` processes (by default, one per CPU.) Daemonic processes, such as the
+    workers of `manage.py test --parallel`, cannot start a pool and compute the chunks
+    themselves.
+    """
+    prefix, salt = interval.generator.prefix, interval.salt
+    start, stop = interval.start, interval.start + interval.increment
+    chunks = [(i, min(i + chunk_size, stop)) for i in range(start, stop, chunk_size)]
+    if len(chunks) <= 1 or max_workers == 1 or multiprocessing.current_process().daemon:
+        for chunk in chunks:
+            yield _get_rows(prefix, salt, *chunk)
+        return
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # Only compute a few chunks ahead of the writer, to bound memory
+        pending: deque = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_get_rows, prefix, salt, *chunk))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _CSVWriter:
+    def __init__(self, f):
+        self._writer = csv.writer(f, delimiter=";")
+        self._writer.writerow(HEADER)
+
+    def write(self, rows: list[Row]):
+        self._writer.writerows(rows)
+
+
+class _XLSXWriter:
+    """Writes rows to an Excel file, continuing on a new worksheet when a worksheet is
+    full. Rows are flushed to disk as they are written."""
+
+    def __init__(self, path: str, sheet_name: str):
+        self._workbook = xlsxwriter.Workbook(
+            path, {"constant_memory": True, "strings_to_urls": False}
+        )
+        self._sheet_name = sheet_name
+        self._worksheet: "Worksheet | None" = None
+        self._row = 0
+
+    def _add_worksheet(self) -> "Worksheet":
+        number = len(self._workbook.worksheets()) + 1
+        suffix = f" ({number})" if number > 1 else ""
+        # Worksheet names are limited to 31 characters
+        name = self._sheet_name[: 31 - len(suffix)] + suffix
+        self._worksheet = worksheet = self._workbook.add_worksheet(name)
+        worksheet.set_column(0, 0, 45)
+        worksheet.set_column(1, 1, 10)
+        worksheet.set_column(2, 2, 15)
+        worksheet.write_row(0, 0, HEADER)
+        self._row = 1
+        return worksheet
+
+    def write(self, rows: list[Row]):
+        worksheet = self._worksheet
+        for row in rows:
+            if worksheet is None or self._row >= XLSX_MAX_ROWS:
+                worksheet = self._add_worksheet()
+            worksheet.write_row(self._row, 0, row)
+            self._row += 1
+
+    def close(self):
+        if self._worksheet is None:
+            self._add_worksheet()
+        self._workbook.close()
+
+
+def get_filename(bag_type: str, generator: QRCodeGenerator, increment: int) -> str:
+    today = date.today().isoformat()
+    return f"{bag_type}-{today}_{increment}-codes_of_{generator.count}"
+
+
+def export_qr_codes(
+    bag_type: str,
+    number_of_codes: int,
+    formats: list[str] | tuple[str, ...] = (FORMAT_CSV,),
+    max_workers: int | None = None,
+) -> dict[str, str]:
+    """Generate `number_of_codes` new QR codes for the given bag type, and write them
+    to a file in `QR_OUTPUT_DIR` in each of the given formats.
+
+    The QR codes are reserved before any of them are generated, and are only
+    generated once, regardless of the number of formats. Returns the path of the file
+    written in each format.
+    """
+    series = settings.QR_GENERATOR_SERIES[bag_type]
+    generator, _ = QRCodeGenerator.objects.get_or_create(
+        name=series["name"], prefix=series["prefix"]
+    )
+    interval = generator.reserve_interval(number_of_codes)
+
+    filename = get_filename(bag_type, generator, number_of_codes)
+    paths = {
+        format: os.path.join(settings.QR_OUTPUT_DIR, f"{filename}.{format}")
+        for format in formats
+    }
+
+    with ExitStack() as stack:
+        writers: list[_CSVWriter | _XLSXWriter] = []
+        for format, path in paths.items():
+            if format == FORMAT_CSV:
+                f = stack.enter_context(open(path, "w", newline=""))
+                writers.append(_CSVWriter(f))
+            elif format == FORMAT_ZIP:
+                archive = stack.enter_context(
+                    zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+                )
+                f = stack.enter_context(
+                    io.TextIOWrapper(
+                        archive.open(f"{filename}.csv", "w", force_zip64=True),
+                        encoding="utf-8",
+                        newline="",
+                    )
+                )
+                writers.append(_CSVWriter(f))
+            elif format == FORMAT_XLSX:
+                xlsx_writer = _XLSXWriter(path, f"{series['name']} x {number_of_codes}")
+                stack.callback(xlsx_writer.close)
+                writers.append(xlsx_writer)
+            else:
+                raise ValueError(f"Unknown format {format!r}")
+
+        for rows in iter_rows(interval, max_workers=max_workers):
+            for writer in writers:
+                writer.write(rows)
+
+    return paths
@@ -3,9 +3,8 @@
 # SPDX-License-Identifier: MPL-2.0
 import datetime
 import os
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import pandas as pd
 from betterforms.multiform import MultiModelForm
 from captcha.fields import CaptchaField
 from django import forms
@@ -22,6 +21,7 @@ from django.utils.safestring import mark_safe
 from django.utils.translation import gettext as _
 from phonenumber_field.widgets import RegionalPhoneNumberWidget
 from phonenumbers import country_code_for_region
+from project.util import lazy_import
 from two_factor.forms import AuthenticationTokenForm
 
 from esani_pantportal.form_mixins import BootstrapForm, MaxSizeFileField
@@ -32,7 +32,6 @@ from esani_pantportal.models import (
     PRODUCT_SHAPE_CHOICES,
     USER_TYPE_CHOICES,
     BranchUser,
-    City,
     Company,
     CompanyBranch,
     CompanyUser,
@@ -45,12 +44,12 @@ from esani_pantportal.models import (
     Product,
     ProductState,
     QRBag,
-    QRStatus,
     ReverseVendingMachine,
     User,
     validate_barcode_length,
     validate_digit,
 )
+from esani_pantportal.reference_data import get_city_names, get_qr_status_names
 from esani_pantportal.util import (
     join_strings_human_readable,
     make_valid_choices_str,
@@ -58,6 +57,11 @@ from esani_pantportal.util import (
     read_excel,
 )
 
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
 EMPTY_CHOICE: tuple[Any, str] = (None, "-" * 10)
 
 
@@ -875,7 +879,7 @@ class CityChoiceMixin:
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["city"].choices = [("", "-")] + [
-            (city.name, city.name) for city in City.objects.order_by("name")
+            (name, name) for name in get_city_names()
         ]
 
 
@@ -955,7 +959,7 @@ class QRBagFilterForm(CityChoiceMixin, SortPaginateForm):
         # Make widget height match the number of available
         # QR bag statuses (plus one "empty" choice.)
         self.fields["status"].widget.attrs.update(
-            {"size": QRStatus.objects.count() + 1}
+            {"size": len(get_qr_status_names()) + 1}
         )
 
     def clean_kiosk__name(self):
@@ -964,9 +968,7 @@ class QRBagFilterForm(CityChoiceMixin, SortPaginateForm):
 
     def get_status_choices(self) -> list[tuple[str, str]]:
         # Map status codes to friendly names
-        names: dict[str, str] = {
-            code: name for code, name in QRStatus.objects.values_list("code", "name_da")
-        }
+        names: dict[str, str] = get_qr_status_names()
         # Figure out what `QRBag` objects the given user has access to, which determines
         # what statuses they can filter on.
         qs = QRBag.objects.all()
@@ -1411,7 +1413,15 @@ class GenerateQRForm(BootstrapForm):
         ],
         label=_("Sækketype"),
     )
-    number_of_codes = forms.IntegerField(label=_("Antal koder"))
+    number_of_codes = forms.IntegerField(
+        label=_("Antal koder"),
+        min_value=1,
+        max_value=settings.QR_GENERATE_MAX_CODES,
+        help_text=_(
+            "Større antal koder genereres med kommandoen "
+            "`manage.py generate_qr_codes --workers`"
+        ),
+    )
 
 
 class DepositPayoutForm(forms.ModelForm, BootstrapForm):
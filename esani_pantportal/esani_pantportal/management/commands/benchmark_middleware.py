@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import io
+import time
+
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.core.management.base import BaseCommand, CommandError
+from project.handlers import RoutingWSGIHandler
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the time spent handling a request through the full middleware of the "
+        "portal, and through the lean middleware used for the API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default="/metrics/health/database",
+            help="Path to request (must be one of `settings.LEAN_MIDDLEWARE_PATHS`)",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host to request (must be allowed by `settings.ALLOWED_HOSTS`)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Number of requests per round",
+        )
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=5,
+            help="Number of times the requests are made",
+        )
+
+    def handle(
+        self,
+        path="/metrics/health/database",
+        host="localhost",
+        requests=1000,
+        rounds=5,
+        **kwargs,
+    ):
+        environ = self._get_environ(path, host)
+        self.stdout.write(f"Requesting {path}, {requests} time(s) in {rounds} round(s)")
+
+        full = self._measure(WSGIHandler(), environ, requests, rounds)
+        lean = self._measure(RoutingWSGIHandler(), environ, requests, rounds)
+
+        self.stdout.write(f"Full middleware: {full * 1e6:10.1f} µs/request")
+        self.stdout.write(f"Lean middleware: {lean * 1e6:10.1f} µs/request")
+        self.stdout.write(
+            f"Saved: {(full - lean) * 1e6:.1f} µs/request "
+            f"({(full - lean) / full:.0%})"
+        )
+
+    def _get_environ(self, path: str, host: str) -> dict:
+        return {
+            "REQUEST_METHOD": "GET",
+            "PATH_INFO": path,
+            "SCRIPT_NAME": "",
+            "QUERY_STRING": "",
+            "SERVER_NAME": host,
+            "SERVER_PORT": "80",
+            "HTTP_HOST": host,
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(),
+        }
+
+    def _measure(
+        self, handler: BaseHandler, environ: dict, requests: int, rounds: int
+    ) -> float:
+        # Request signals are not sent, so e.g. database connections are not closed
+        # between requests
+        response = handler.get_response(WSGIRequest(environ))
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{environ['PATH_INFO']} returned status {response.status_code}"
+            )
+
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(requests):
+                handler.get_response(WSGIRequest(environ))
+            best = min(best, time.perf_counter() - start)
+        return best / requests
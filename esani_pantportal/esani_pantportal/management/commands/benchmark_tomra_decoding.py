@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import json
+import os
+import time
+
+import orjson
+from django.core.management.base import BaseCommand, CommandError
+
+from esani_pantportal.clients.tomra.data_models import ConsumerSessionQueryResponse
+from esani_pantportal.clients.tomra.projections import consumer_session_page_adapter
+
+DEFAULT_PAYLOAD = os.path.join(
+    os.path.dirname(__file__),
+    os.pardir,
+    os.pardir,
+    "clients",
+    "tomra",
+    "fixtures",
+    "consumer_sessions_page.json",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how fast pages of Tomra consumer sessions are decoded, using the "
+        "full data models and the slim projection models"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--payload",
+            default=DEFAULT_PAYLOAD,
+            help="JSON file containing a page from the `/consumer-sessions` endpoint",
+        )
+        parser.add_argument(
+            "--sessions",
+            type=int,
+            default=10_000,
+            help="Number of consumer sessions per page (repeating those in the file)",
+        )
+        parser.add_argument(
+            "--rounds",
+            type=int,
+            default=5,
+            help="Number of times each page is decoded",
+        )
+
+    def handle(self, payload=DEFAULT_PAYLOAD, sessions=10_000, rounds=5, **kwargs):
+        content = self._get_page(payload, sessions)
+        self.stdout.write(
+            f"Decoding {sessions} consumer sessions ({len(content)} bytes), "
+            f"{rounds} time(s)"
+        )
+
+        baseline = self._measure(self._decode_full, content, sessions, rounds)
+        projected = self._measure(self._decode_projected, content, sessions, rounds)
+
+        self.stdout.write(f"json + full models:        {baseline:12,.0f} sessions/s")
+        self.stdout.write(f"orjson + projection models: {projected:11,.0f} sessions/s")
+        self.stdout.write(f"Speedup: {projected / baseline:.1f}x")
+
+    def _get_page(self, path: str, sessions: int) -> bytes:
+        with open(path, "rb") as f:
+            doc = orjson.loads(f.read())
+        data = doc.get("data") or []
+        if not data:
+            raise CommandError(f"{path} contains no consumer sessions")
+        doc["data"] = [data[i % len(data)] for i in range(sessions)]
+        return orjson.dumps(doc)
+
+    def _measure(self, decode, content: bytes, sessions: int, rounds: int) -> float:
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            decode(content)
+            best = min(best, time.perf_counter() - start)
+        return sessions / best
+
+    def _decode_full(self, content: bytes):
+        return ConsumerSessionQueryResponse.model_validate(json.loads(content))
+
+    def _decode_projected(self, content: bytes):
+        return consumer_session_page_adapter.validate_python(orjson.loads(content))
@@ -6,6 +6,8 @@ from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.management.base import BaseCommand
 
+from esani_pantportal.backends import bump_permissions_version
+
 from esani_pantportal.models import (  # isort: skip
     BranchUser,
     CompanyUser,
@@ -251,3 +253,7 @@ class Command(BaseCommand):
             ("view", erp_credit_note_export_model),
         ):
             esani_admins.permissions.add(get_permission(action, model))
+
+        # The permissions may have been changed without sending any signals, e.g. by
+        # a data migration
+        bump_permissions_version()
@@ -1,13 +1,10 @@
 # SPDX-FileCopyrightText: 2023 Magenta ApS <info@magenta.dk>
 #
 # SPDX-License-Identifier: MPL-2.0
-import csv
-from datetime import date
-
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 
-from esani_pantportal.models import QRCodeGenerator
+from esani_pantportal.exports.qr_codes import FORMAT_CSV, FORMATS, export_qr_codes
 
 
 class Command(BaseCommand):
@@ -22,13 +19,24 @@ class Command(BaseCommand):
             type=int,
             help="Number of QR codes to generate",
         )
+        parser.add_argument(
+            "--format",
+            dest="formats",
+            action="append",
+            choices=FORMATS,
+            help=(
+                "Format of the output file. Can be given more than once to write "
+                f"several files (default: {FORMAT_CSV})"
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Number of processes computing QR codes (default: one per CPU)",
+        )
 
-    def handle(self, bag_type, number_of_codes, **kwargs):
-        try:
-            qr_generator, _ = QRCodeGenerator.objects.get_or_create(
-                **settings.QR_GENERATOR_SERIES[bag_type]
-            )
-        except KeyError:
+    def handle(self, bag_type, number_of_codes, formats=None, workers=None, **kwargs):
+        if bag_type not in settings.QR_GENERATOR_SERIES:
             available_types = [key for key in settings.QR_GENERATOR_SERIES.keys()]
             raise CommandError(
                 f"Bag type {bag_type} does not exist.\n"
@@ -36,22 +44,14 @@ class Command(BaseCommand):
             )
         if number_of_codes <= 0:
             raise CommandError("Number of codes to generate must be > 0")
-
-        qr_codes = qr_generator.generate_qr_codes(number_of_codes)
-
-        today = date.today().isoformat()
-        count = qr_generator.count
-        filename = f"{bag_type}-{today}_{number_of_codes}-codes_of_{count}.csv"
-        output_path = f"{settings.QR_OUTPUT_DIR}/{filename}"
-        with open(output_path, "w") as f:
-            writer = csv.writer(f, delimiter=";")
-            writer.writerow(["QR-kode", "Id", "Kontrolkode"])
-            for qr_code in qr_codes:
-                id_and_cc = qr_code.removeprefix(
-                    f"{settings.QR_URL_PREFIX}{qr_generator.prefix}"
-                )
-                qr_id = id_and_cc[0 : settings.QR_ID_LENGTH]
-                control_code = id_and_cc[settings.QR_ID_LENGTH :]
-                writer.writerow([qr_code, qr_id, control_code])
-
-        return output_path
+        if workers is not None and workers < 1:
+            raise CommandError("Number of workers must be >= 1")
+
+        paths = export_qr_codes(
+            bag_type,
+            number_of_codes,
+            formats=formats or [FORMAT_CSV],
+            max_workers=workers,
+        )
+        # Return the path of the first file written
+        return next(iter(paths.values()))
@@ -2,25 +2,38 @@
 #
 # SPDX-License-Identifier: MPL-2.0
 import csv
+import hashlib
+import io
+import logging
 import os
+import stat
+import time
 from abc import ABC, abstractmethod
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing
 from dataclasses import dataclass
-from datetime import date, datetime
+from datetime import date, datetime, timezone
+from functools import partial
 from urllib.parse import urlparse
 
 import paramiko
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils.timezone import now
 
 from esani_pantportal.models import (
     DepositPayout,
     DepositPayoutItem,
+    IngestedFile,
     Product,
     ProductState,
     ReverseVendingMachine,
 )
 
+logger = logging.getLogger(__name__)
+
 
 def parse_csv_date(val, format="%Y%m%d") -> date:
     return datetime.strptime(val, format).date()
@@ -53,22 +66,207 @@ class TomraCSVFileLine:
         )
 
 
+@dataclass
+class ImportResult:
+    """Outcome of importing a single Tomra CSV file"""
+
+    STATUS_IMPORTED = "imported"
+    STATUS_SKIPPED = "skipped"
+    STATUS_FAILED = "failed"
+
+    filename: str
+    status: str
+    item_count: int = 0
+    duration: float = 0.0
+    message: str = ""
+
+
+def _import_file_in_worker(
+    source: "Source", filename: str, ingested_file_id: int
+) -> ImportResult:
+    """Entry point for worker processes started by `Command._import_in_pool`"""
+    return Command().import_file(source, filename, ingested_file_id)
+
+
 class Command(BaseCommand):
     help = "Import deposit payout CSV files from Tomra"
 
     csv_delimiter = ";"
 
-    def handle(self, **kwargs):
-        source = LocalFilesystem(settings.TOMRA_PATH)
+    lock_namespace = "import_deposit_payouts"
+    """Prefix of the Postgres advisory lock key taken while importing a file"""
 
-        for new_file in source.get_new_files():
-            self.stdout.write(f"Processing new file {new_file}")
-            with source.open(new_file) as input_stream:
-                tomra_file = self._read_csv(input_stream)
-                self._import_data(new_file, tomra_file)
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of worker processes used to import files in parallel",
+        )
+        parser.add_argument(
+            "--source",
+            choices=["local", "sftp"],
+            default=settings.TOMRA_SOURCE,
+            help=(
+                "Read files from the local folder `TOMRA_PATH`, or from the SFTP "
+                "server at `TOMRA_SFTP_URL`"
+            ),
+        )
+
+    def handle(self, workers=1, source=None, **kwargs):
+        if workers < 1:
+            raise CommandError("Number of workers must be >= 1")
+
+        with closing(self._get_source(source or settings.TOMRA_SOURCE)) as src:
+            new_files = dict(sorted(src.get_new_files(max_workers=workers).items()))
+
+            if workers > 1 and len(new_files) > 1:
+                # Worker processes cannot share a remote connection, so read the new
+                # files from the local folder they were staged in when hashed.
+                local_src = src.stage(list(new_files), max_workers=workers)
+                results = self._import_in_pool(local_src, new_files, workers)
+            else:
+                results = []
+                for new_file, ingested_file_id in new_files.items():
+                    self.stdout.write(f"Processing new file {new_file}")
+                    results.append(self.import_file(src, new_file, ingested_file_id))
+
+        self._write_summary(results)
+
+        failed = [r for r in results if r.status == ImportResult.STATUS_FAILED]
+        if failed:
+            raise CommandError(f"{len(failed)} file(s) could not be imported")
 
         self.stdout.write("All done!")
 
+    def _get_source(self, name: str) -> "Source":
+        if name == "sftp":
+            return SFTP(settings.TOMRA_SFTP_URL, settings.TOMRA_SFTP_STAGING_PATH)
+        return LocalFilesystem(settings.TOMRA_PATH)
+
+    def _import_in_pool(self, source, new_files, workers) -> list[ImportResult]:
+        self.stdout.write(
+            f"Processing {len(new_files)} new files using {workers} workers"
+        )
+        # Forked worker processes must not share the database connection of this
+        # process, so close it before forking. Each worker opens its own connection.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _import_file_in_worker, source, new_file, ingested_file_id
+                )
+                for new_file, ingested_file_id in new_files.items()
+            ]
+            return [future.result() for future in futures]
+
+    def import_file(self, source, filename, ingested_file_id=None) -> ImportResult:
+        """Import a single file in its own transaction.
+
+        The file is skipped if another process is already importing it (i.e. holds
+        its advisory lock), or if it was imported after `get_new_files` was called.
+        The outcome is recorded in the `IngestedFile` ledger entry
+        `ingested_file_id`, i.e. the entry of the version of the file which was
+        hashed by `get_new_files`.
+        """
+        start = time.monotonic()
+        try:
+            with transaction.atomic():
+                if not self._acquire_lock(filename):
+                    return ImportResult(
+                        filename,
+                        ImportResult.STATUS_SKIPPED,
+                        duration=time.monotonic() - start,
+                        message="file is being imported by another process",
+                    )
+                if self._is_imported(filename):
+                    return ImportResult(
+                        filename,
+                        ImportResult.STATUS_SKIPPED,
+                        duration=time.monotonic() - start,
+                        message="file has already been imported",
+                    )
+                with source.open(filename) as input_stream:
+                    tomra_file = self._read_csv(input_stream)
+                deposit_payout = self._import_data(filename, tomra_file)
+                result = ImportResult(
+                    filename,
+                    ImportResult.STATUS_IMPORTED,
+                    item_count=len(tomra_file.items),
+                    duration=time.monotonic() - start,
+                )
+                self._update_ledger(
+                    ingested_file_id,
+                    status=IngestedFile.STATUS_IMPORTED,
+                    item_count=result.item_count,
+                    duration=result.duration,
+                    deposit_payout=deposit_payout,
+                    message="",
+                )
+        except Exception as e:
+            result = ImportResult(
+                filename,
+                ImportResult.STATUS_FAILED,
+                duration=time.monotonic() - start,
+                message=repr(e),
+            )
+            self._update_ledger(
+                ingested_file_id,
+                status=IngestedFile.STATUS_FAILED,
+                duration=result.duration,
+                message=result.message,
+            )
+        return result
+
+    def _update_ledger(self, ingested_file_id, **fields):
+        if ingested_file_id is not None:
+            IngestedFile.objects.filter(pk=ingested_file_id).update(
+                updated_at=now(), **fields
+            )
+
+    def _acquire_lock(self, filename) -> bool:
+        # The lock is released automatically when the transaction ends
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_try_advisory_xact_lock(hashtext(%s))",
+                [f"{self.lock_namespace}:{filename}"],
+            )
+            return cursor.fetchone()[0]
+
+    def _is_imported(self, filename) -> bool:
+        return DepositPayout.objects.filter(
+            source_type=DepositPayout.SOURCE_TYPE_CSV,
+            source_identifier=filename,
+        ).exists()
+
+    def _write_summary(self, results: list[ImportResult]):
+        for result in results:
+            line = (
+                f"{result.filename}: {result.status} "
+                f"({result.item_count} items, {result.duration:.2f}s)"
+            )
+            if result.message:
+                line += f" - {result.message}"
+            if result.status == ImportResult.STATUS_FAILED:
+                self.stderr.write(line)
+            else:
+                self.stdout.write(line)
+
+        counts = {
+            status: len([r for r in results if r.status == status])
+            for status in (
+                ImportResult.STATUS_IMPORTED,
+                ImportResult.STATUS_SKIPPED,
+                ImportResult.STATUS_FAILED,
+            )
+        }
+        self.stdout.write(
+            f"Imported {counts[ImportResult.STATUS_IMPORTED]} file(s) "
+            f"({sum(r.item_count for r in results)} items), "
+            f"skipped {counts[ImportResult.STATUS_SKIPPED]}, "
+            f"failed {counts[ImportResult.STATUS_FAILED]}"
+        )
+
     def _read_csv(self, input_stream):
         reader = csv.reader(input_stream, delimiter=self.csv_delimiter)
 
@@ -129,6 +327,7 @@ class Command(BaseCommand):
                 for item in tomra_file.items
             ]
         )
+        return deposit_payout
 
     def _get_rvm_from_rvm_serial(self, rvm_serial):
         try:
@@ -166,19 +365,127 @@ class Source(ABC):
     def open(self, filename):
         pass  # pragma: nocover
 
-    def get_new_files(self):
-        filenames = set(self.listdir())
-        known_filenames = set(
+    @abstractmethod
+    def listdir_stat(self) -> dict[str, tuple[int, datetime]]:
+        """Return the size and modification time of each file"""
+        pass  # pragma: nocover
+
+    @abstractmethod
+    def sha256(self, filename) -> str:
+        pass  # pragma: nocover
+
+    @abstractmethod
+    def stage(self, filenames, max_workers=1) -> "LocalFilesystem":
+        """Return a local source containing (at least) the given files"""
+        pass  # pragma: nocover
+
+    def prefetch(self, filenames, max_workers=1):
+        """Prepare the given files for being hashed and read"""
+        pass
+
+    def close(self):
+        pass
+
+    def get_new_files(self, max_workers=1) -> dict[str, int]:
+        """Return the files which have not been imported yet.
+
+        The names of the files are mapped to the primary key of the `IngestedFile`
+        entry of their current contents.
+
+        Files whose size and modification time match a settled entry in the
+        `IngestedFile` ledger are skipped without being read, as are the files of the
+        entries created from the deposit payouts imported before the ledger existed.
+        The remaining files are prefetched, hashed, and recorded in the ledger. A file
+        which has been imported, and is then re-delivered with different contents, is
+        marked as "changed" and is not imported again.
+
+        This is only a snapshot. `Command.import_file` checks each file again while
+        holding its advisory lock, so concurrent imports never import a file twice.
+        """
+        stats = self.listdir_stat()
+
+        ledger = defaultdict(list)
+        for entry in IngestedFile.objects.filter(name__in=stats.keys()):
+            ledger[entry.name].append(entry)
+
+        # Entries created from deposit payouts get the size and modification time of
+        # their file when it is first seen
+        seeded = []
+        for name, (size, mtime) in stats.items():
+            for entry in ledger[name]:
+                if entry.size is None:
+                    entry.size = size
+                    entry.mtime = mtime
+                    seeded.append(entry)
+        IngestedFile.objects.bulk_update(seeded, ["size", "mtime"])
+
+        candidates = [
+            name
+            for name, (size, mtime) in stats.items()
+            if not any(
+                entry.status in IngestedFile.SETTLED_STATUSES
+                and entry.size == size
+                and entry.mtime == mtime
+                for entry in ledger[name]
+            )
+        ]
+        self.prefetch(candidates, max_workers=max_workers)
+
+        # Files imported before the ledger was introduced only have a deposit payout
+        imported_without_ledger = set(
             DepositPayout.objects.filter(
-                source_type=DepositPayout.SOURCE_TYPE_CSV
+                source_type=DepositPayout.SOURCE_TYPE_CSV,
+                source_identifier__in=[name for name in candidates if not ledger[name]],
             ).values_list("source_identifier", flat=True)
         )
-        unknown_filenames = filenames - known_filenames
-        return unknown_filenames
+
+        new_files = {}
+        for name in candidates:
+            size, mtime = stats[name]
+            entry, created = IngestedFile.objects.get_or_create(
+                name=name,
+                sha256=self.sha256(name),
+                defaults={
+                    "size": size,
+                    "mtime": mtime,
+                    "status": self._get_initial_status(
+                        name, ledger[name], imported_without_ledger
+                    ),
+                },
+            )
+            if not created and (entry.size, entry.mtime) != (size, mtime):
+                entry.size = size
+                entry.mtime = mtime
+                entry.save(update_fields=["size", "mtime", "updated_at"])
+            if entry.status in IngestedFile.PENDING_STATUSES:
+                new_files[name] = entry.pk
+        return new_files
+
+    def _get_initial_status(self, name, entries, imported_without_ledger) -> str:
+        if name in imported_without_ledger:
+            return IngestedFile.STATUS_IMPORTED
+        if any(entry.status == IngestedFile.STATUS_IMPORTED for entry in entries):
+            logger.warning(
+                "File %r has already been imported, but its contents have changed",
+                name,
+            )
+            return IngestedFile.STATUS_CHANGED
+        return IngestedFile.STATUS_NEW
+
+    @staticmethod
+    def _to_stat(size, mtime) -> tuple[int, datetime]:
+        return size, datetime.fromtimestamp(mtime, tz=timezone.utc)
 
 
 class SFTP(Source):
-    def __init__(self, sftp_url: str):
+    """Reads files from an SFTP server, using a single connection.
+
+    If `staging_dir` is given, a local copy of each file is kept there as it is read
+    or downloaded. Files already present in `staging_dir` are read from there instead
+    of the server.
+    """
+
+    def __init__(self, sftp_url: str, staging_dir: str | None = None):
         url = urlparse(sftp_url)
         ssh = self._get_ssh_client()
         # Automatically add keys without requiring human intervention
@@ -191,18 +498,119 @@ class SFTP(Source):
         )
         ftp = ssh.open_sftp()
         ftp.chdir(url.path)
+        self._ssh = ssh
         self._ftp = ftp
+        self._staging_dir = staging_dir
+        if staging_dir is not None:
+            os.makedirs(staging_dir, exist_ok=True)
 
     def listdir(self):
         return self._ftp.listdir()
 
+    def listdir_stat(self):
+        # Fetches the names and attributes of all files in a single request
+        return {
+            attr.filename: self._to_stat(attr.st_size, attr.st_mtime)
+            for attr in self._ftp.listdir_attr()
+            if not stat.S_ISDIR(attr.st_mode)
+        }
+
+    def sha256(self, filename):
+        if self._staging_dir is None:
+            with self._open_remote(filename) as remote:
+                return hashlib.file_digest(remote, "sha256").hexdigest()
+        # Hash the staged copy, so the import reads the same contents as the ones
+        # hashed here
+        self._download(filename)
+        return LocalFilesystem(self._staging_dir).sha256(filename)
+
     def open(self, filename):
-        return self._ftp.open(filename)
+        if self._staging_dir is None:
+            remote = self._open_remote(filename)
+        else:
+            staged_path = os.path.join(self._staging_dir, filename)
+            if os.path.exists(staged_path):
+                return open(staged_path)
+            remote = _StagingReader(self._open_remote(filename), staged_path)
+        return io.TextIOWrapper(io.BufferedReader(remote), encoding="utf-8")
+
+    def prefetch(self, filenames, max_workers=1):
+        """Download the given files to the staging folder, if any, replacing older
+        staged copies.
+
+        The downloads run concurrently, but share the connection of this instance.
+        """
+        if self._staging_dir is not None:
+            self._download_all(filenames, max_workers, replace=True)
+
+    def stage(self, filenames, max_workers=1) -> "LocalFilesystem":
+        """Download the given files to the staging folder, unless already staged"""
+        if self._staging_dir is None:
+            raise ValueError("Staging files requires a staging folder")
+        self._download_all(filenames, max_workers)
+        return LocalFilesystem(self._staging_dir)
+
+    def close(self):
+        self._ftp.close()
+        self._ssh.close()
+
+    def _open_remote(self, filename):
+        remote = self._ftp.open(filename, "rb")
+        # Request all blocks of the file up front, rather than waiting for the
+        # response to each read before sending the next request.
+        remote.prefetch()
+        return remote
+
+    def _download_all(self, filenames, max_workers, replace=False):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(partial(self._download, replace=replace), filenames))
+
+    def _download(self, filename, replace=False):
+        staged_path = os.path.join(self._staging_dir, filename)
+        if replace or not os.path.exists(staged_path):
+            partial_path = f"{staged_path}.part"
+            self._ftp.get(filename, partial_path, prefetch=True)
+            os.replace(partial_path, staged_path)
 
     def _get_ssh_client(self):
         return paramiko.SSHClient()  # pragma: nocover
 
 
+class _StagingReader(io.RawIOBase):
+    """Reads a remote file, writing a local copy of the data as it is read.
+
+    The local copy is only kept if the remote file has been read to the end.
+    """
+
+    def __init__(self, remote, staged_path: str):
+        self._remote = remote
+        self._staged_path = staged_path
+        self._partial_path = f"{staged_path}.part"
+        self._staged = open(self._partial_path, "wb")
+        self._complete = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._remote.read(len(buffer))
+        if not data:
+            self._complete = True
+        buffer[: len(data)] = data
+        self._staged.write(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._remote.close()
+            self._staged.close()
+            if self._complete:
+                os.replace(self._partial_path, self._staged_path)
+            else:
+                os.remove(self._partial_path)
+        super().close()
+
+
 class LocalFilesystem(Source):
     def __init__(self, path: str):
         self._path = path
@@ -210,5 +618,20 @@ class LocalFilesystem(Source):
     def listdir(self):
         return os.listdir(self._path)
 
+    def listdir_stat(self):
+        with os.scandir(self._path) as entries:
+            return {
+                entry.name: self._to_stat(entry.stat().st_size, entry.stat().st_mtime)
+                for entry in entries
+                if entry.is_file()
+            }
+
+    def sha256(self, filename):
+        with open(os.path.join(self._path, filename), "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
     def open(self, filename):
         return open(os.path.join(self._path, filename))
+
+    def stage(self, filenames, max_workers=1) -> "LocalFilesystem":
+        return self
@@ -3,23 +3,26 @@
 # SPDX-License-Identifier: MPL-2.0
 import re
 from collections import defaultdict
+from collections.abc import Mapping
+from contextlib import closing
+from dataclasses import dataclass, field
 from datetime import date, datetime, timedelta
-from functools import cache
+from types import MappingProxyType
 from uuid import UUID
 
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 from django.db.models import Q
 from django.db.models.functions import Substr
 from simple_history.utils import bulk_update_with_history
 
 from esani_pantportal.clients.tomra.api import ConsumerSessionCollection, TomraAPI
-from esani_pantportal.clients.tomra.data_models import ConsumerSession, Identity
+from esani_pantportal.clients.tomra.data_models import Identity
+from esani_pantportal.clients.tomra.projections import ConsumerSessionProjection
 from esani_pantportal.models import (
-    AbstractCompany,
     CompanyBranch,
+    ConsumerSessionCheckpoint,
     DepositPayout,
     DepositPayoutItem,
     Kiosk,
@@ -29,6 +32,40 @@ from esani_pantportal.models import (
 )
 
 
+@dataclass(frozen=True)
+class ResolvedSource:
+    """The QR bag and source (a `CompanyBranch` or a `Kiosk`) of a consumer identity"""
+
+    qr_bag: QRBag | None = None
+    company_branch: CompanyBranch | None = None
+    kiosk: Kiosk | None = None
+
+
+@dataclass(frozen=True)
+class ResolvedPage:
+    """Database objects referenced by a page of consumer sessions, looked up in bulk.
+
+    `sources` is keyed by consumer identity, and `products` maps barcodes to product
+    IDs.
+    """
+
+    sources: Mapping[str, ResolvedSource] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    products: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+
+    def get_source(self, consumer_identity: str | None) -> ResolvedSource:
+        if consumer_identity is None:
+            return _unresolved_source
+        return self.sources.get(consumer_identity, _unresolved_source)
+
+
+_unresolved_source = ResolvedSource()
+
+
+_external_customer_id_pattern = re.compile(r"[8|9]000(?P<ext_id>[1|2|3]\d{5})")
+
+
 class Command(BaseCommand):
     help = "Import deposit payouts for 'QR bags' from Tomra 'consumer sessions' API"
 
@@ -41,18 +78,119 @@ class Command(BaseCommand):
             "--to-date",
             help="Override default 'to date'",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help=(
+                "Number of days of consumer sessions retrieved concurrently. By "
+                "default, the whole period is retrieved page by page."
+            ),
+        )
 
     def handle(self, *args, **options):
-        from_date = self._get_previous_to_date(options["from_date"])
-        to_date = self._get_todays_to_date(options["to_date"])
+        workers = options["workers"]
+        if workers < 1:
+            raise CommandError("Number of workers must be >= 1")
 
-        api = TomraAPI.from_settings()
+        from_date, to_date, checkpoint = self._get_window(
+            options["from_date"], options["to_date"]
+        )
 
         self.stdout.write(f"Retrieving consumer sessions, {from_date=}, {to_date=} ...")
-        consumer_sessions = api.get_consumer_sessions(
+        if checkpoint is not None:
+            self.stdout.write(
+                f"Resuming after {checkpoint.page_count} previously imported page(s)"
+            )
+
+        with closing(TomraAPI.from_settings()) as api:
+            # A continuation token can only be followed page by page
+            if workers > 1 and not (checkpoint and checkpoint.next):
+                imported = self._import_shards(api, from_date, to_date, workers)
+            else:
+                imported = self._import_pages(api, from_date, to_date, checkpoint)
+
+        if imported:
+            self.stdout.write("Done.")
+        else:
+            self.stdout.write("Not importing anything.")
+
+    def _import_pages(
+        self,
+        api: TomraAPI,
+        from_date: date,
+        to_date: date,
+        checkpoint: ConsumerSessionCheckpoint | None,
+    ) -> bool:
+        imported = False
+        pages = api.get_consumer_session_pages(
             self._to_datetime(from_date),
             self._to_datetime(to_date),
+            next=(checkpoint.next or None) if checkpoint is not None else None,
         )
+        for page in pages:
+            with transaction.atomic():
+                imported |= self._import_page(page, from_date, to_date)
+                self._save_checkpoint(from_date, to_date, page.next)
+        return imported
+
+    def _import_shards(
+        self, api: TomraAPI, from_date: date, to_date: date, workers: int
+    ) -> bool:
+        """Retrieve the period one day at a time, using `workers` concurrent threads.
+
+        The days are imported in order, each in its own transaction. After each day,
+        the checkpoint is moved to the start of the following day, counting the day
+        as one page.
+        """
+        imported = False
+        shards = api.get_consumer_session_shards(
+            self._to_datetime(from_date),
+            self._to_datetime(to_date),
+            shard_size=timedelta(days=1),
+            max_workers=workers,
+        )
+        for shard in shards:
+            shard_from, shard_to = shard.from_date.date(), shard.to_date.date()
+            with transaction.atomic():
+                imported |= self._import_page(shard, shard_from, shard_to)
+                if shard_to < to_date:
+                    self._advance_checkpoint(from_date, shard_to, to_date)
+                else:
+                    self._save_checkpoint(from_date, to_date, None)
+            from_date = shard_to
+        return imported
+
+    def _get_window(
+        self, from_date: str | None, to_date: str | None
+    ) -> tuple[date, date, ConsumerSessionCheckpoint | None]:
+        """Return the period to import, and the checkpoint to resume from (if any.)
+
+        If no dates are given, an unfinished run is resumed. Otherwise, a checkpoint is
+        only used if it matches the given period exactly.
+        """
+        if from_date is None and to_date is None:
+            checkpoint = ConsumerSessionCheckpoint.objects.order_by(
+                "-updated_at"
+            ).first()
+            if checkpoint is not None:
+                return checkpoint.from_date, checkpoint.to_date, checkpoint
+
+        window = (
+            self._get_previous_to_date(from_date),
+            self._get_todays_to_date(to_date),
+        )
+        checkpoint = ConsumerSessionCheckpoint.objects.filter(
+            from_date=window[0], to_date=window[1]
+        ).first()
+        return window[0], window[1], checkpoint
+
+    def _import_page(
+        self,
+        consumer_sessions: ConsumerSessionCollection,
+        from_date: date,
+        to_date: date,
+    ) -> bool:
         self.stdout.write(
             f"Retrieved {len(consumer_sessions.data)} consumer sessions "
             f"({from_date=}, {to_date=})"
@@ -61,6 +199,7 @@ class Command(BaseCommand):
         consumer_sessions_normal, consumer_sessions_manual = (
             self._preprocess_consumer_sessions(consumer_sessions)
         )
+        resolved = self._resolve(consumer_sessions_normal + consumer_sessions_manual)
         if consumer_sessions_normal:
             self.stdout.write(
                 f"Importing {len(consumer_sessions_normal)} valid, normal consumer "
@@ -71,6 +210,7 @@ class Command(BaseCommand):
                 from_date,
                 to_date,
                 consumer_sessions_normal,
+                resolved,
             )
         if consumer_sessions_manual:
             self.stdout.write(
@@ -82,67 +222,163 @@ class Command(BaseCommand):
                 from_date,
                 to_date,
                 consumer_sessions_manual,
+                resolved,
             )
 
-        if consumer_sessions_normal or consumer_sessions_manual:
-            self.stdout.write("Done.")
+        return bool(consumer_sessions_normal or consumer_sessions_manual)
+
+    def _save_checkpoint(self, from_date: date, to_date: date, next: str | None):
+        if next is None:
+            # The last page has been imported
+            ConsumerSessionCheckpoint.objects.filter(
+                from_date=from_date, to_date=to_date
+            ).delete()
         else:
-            self.stdout.write("Not importing anything.")
+            checkpoint, _ = ConsumerSessionCheckpoint.objects.get_or_create(
+                from_date=from_date, to_date=to_date, defaults={"next": next}
+            )
+            checkpoint.next = next
+            checkpoint.page_count += 1
+            checkpoint.save()
+
+    def _advance_checkpoint(self, from_date: date, new_from_date: date, to_date: date):
+        """Move the checkpoint of the period to `new_from_date`, after a day of
+        consumer sessions has been imported.
+        """
+        checkpoints = ConsumerSessionCheckpoint.objects.filter(to_date=to_date)
+        checkpoint = checkpoints.filter(from_date=from_date).first()
+        if checkpoint is None:
+            checkpoint = ConsumerSessionCheckpoint(from_date=from_date, to_date=to_date)
+        # Replace a checkpoint left behind at the new start date by an earlier run
+        checkpoints.filter(from_date=new_from_date).delete()
+        checkpoint.from_date = new_from_date
+        # An empty continuation token resumes from the start of the period
+        checkpoint.next = ""
+        checkpoint.page_count += 1
+        checkpoint.save()
 
     def _preprocess_consumer_sessions(
         self, consumer_sessions: ConsumerSessionCollection
-    ) -> tuple[list[ConsumerSession], list[ConsumerSession]]:
+    ) -> tuple[list[ConsumerSessionProjection], list[ConsumerSessionProjection]]:
         # Step 1: filter out previously imported consumer sessions, based on their
-        # "consumer session ID."
-        result: list[ConsumerSession] = [
+        # "consumer session ID." Sessions without an ID cannot be recognized when they
+        # are retrieved again, so they are skipped.
+        result: list[ConsumerSessionProjection] = [
             datum.consumer_session
             for datum in consumer_sessions.data
-            if isinstance(datum.consumer_session, ConsumerSession)
-            and not self._session_is_already_imported(datum.consumer_session.id)
+            if datum.consumer_session is not None
+            and datum.consumer_session.id is not None
+        ]
+        imported_ids = self._get_imported_session_ids(
+            {consumer_session.id for consumer_session in result}
+        )
+        result = [
+            consumer_session
+            for consumer_session in result
+            if consumer_session.id not in imported_ids
         ]
 
         # Step 2: split the list into two lists: the first list contains the "normal"
         # consumer sessions that we have not yet imported, and the second list contains
         # the consumer sessions that already exist as manually created deposit payout
         # items.
-        normal: list[ConsumerSession] = []
-        manual: list[ConsumerSession] = []
-        for consumer_session in result:
-            if isinstance(consumer_session.identity, Identity):
-                consumer_identity: str = (
-                    f"{consumer_session.identity.consumer_identity or ''}"
-                    f"{consumer_session.identity.bag_identity or ''}"
-                )
-                if self._session_is_known_manual(consumer_identity):
-                    manual.append(consumer_session)
-                    continue
+        manual_identities = self._get_manual_identities(
+            {
+                self._get_identity_key(consumer_session.identity)
+                for consumer_session in result
+                if consumer_session.identity is not None
+            }
+        )
 
-            normal.append(consumer_session)
+        normal: list[ConsumerSessionProjection] = []
+        manual: list[ConsumerSessionProjection] = []
+        for consumer_session in result:
+            if (
+                consumer_session.identity is not None
+                and self._get_identity_key(consumer_session.identity)
+                in manual_identities
+            ):
+                manual.append(consumer_session)
+            else:
+                normal.append(consumer_session)
 
         return normal, manual
 
-    @cache
-    def _session_is_already_imported(self, consumer_session_id: UUID) -> bool:
-        return DepositPayoutItem.objects.filter(
-            deposit_payout__source_type=DepositPayout.SOURCE_TYPE_API,
-            consumer_session_id=consumer_session_id,
-        ).exists()
-
-    @cache
-    def _session_is_known_manual(self, consumer_identity: str) -> bool:
-        return DepositPayoutItem.objects.filter(
-            deposit_payout__source_type=DepositPayout.SOURCE_TYPE_API,
-            consumer_identity=consumer_identity,
-            rvm_serial=0,  # marks manually created QR bag deposit payout items
-        ).exists()
+    def _get_identity_key(self, identity: Identity) -> str:
+        return f"{identity.consumer_identity or ''}{identity.bag_identity or ''}"
 
-    @transaction.atomic
-    def _import_data(self, url, from_date, to_date, consumer_sessions):
-        def get_qr_bag(consumer_session: ConsumerSession):
+    def _get_imported_session_ids(
+        self, consumer_session_ids: set[UUID | None]
+    ) -> set[UUID | None]:
+        return set(
+            DepositPayoutItem.objects.filter(
+                deposit_payout__source_type=DepositPayout.SOURCE_TYPE_API,
+                consumer_session_id__in=consumer_session_ids,
+            ).values_list("consumer_session_id", flat=True)
+        )
+
+    def _get_manual_identities(self, consumer_identities: set[str]) -> set[str | None]:
+        return set(
+            DepositPayoutItem.objects.filter(
+                deposit_payout__source_type=DepositPayout.SOURCE_TYPE_API,
+                consumer_identity__in=consumer_identities,
+                rvm_serial=0,  # marks manually created QR bag deposit payout items
+            ).values_list("consumer_identity", flat=True)
+        )
+
+    def _resolve(
+        self, consumer_sessions: list[ConsumerSessionProjection]
+    ) -> ResolvedPage:
+        """Look up the QR bags, sources and products of all the consumer sessions.
+
+        This is done using a handful of queries per page, so the deposit payout items
+        can be built without any further database access.
+        """
+        consumer_identities: set[str] = set()
+        barcodes: set[str] = set()
+        for consumer_session in consumer_sessions:
             consumer_identity = self._get_consumer_identity(consumer_session)
-            if consumer_identity is not None:
-                return self._get_qr_bag_from_qr(consumer_identity)
+            if consumer_identity:
+                consumer_identities.add(consumer_identity)
+            else:
+                self.stdout.write(
+                    f"No `identity` in {consumer_session.id} "
+                    f"({consumer_session.metadata=})"
+                )
+            for item in consumer_session.items or []:
+                if item.product_code is not None:
+                    barcodes.add(item.product_code)
+
+        qr_bags = self._get_qr_bags(consumer_identities)
+        direct = self._get_direct_sources(consumer_identities)
+
+        sources = {}
+        for consumer_identity in consumer_identities:
+            qr_bag = qr_bags.get(consumer_identity)
+            # An external customer ID encoded directly in the consumer identity takes
+            # precedence over the source of the matching QR bag.
+            source = direct.get(consumer_identity)
+            sources[consumer_identity] = ResolvedSource(
+                qr_bag=qr_bag,
+                company_branch=(
+                    source
+                    if isinstance(source, CompanyBranch)
+                    else getattr(qr_bag, "company_branch", None)
+                ),
+                kiosk=(
+                    source
+                    if isinstance(source, Kiosk)
+                    else getattr(qr_bag, "kiosk", None)
+                ),
+            )
+
+        return ResolvedPage(
+            sources=MappingProxyType(sources),
+            products=MappingProxyType(self._get_products(barcodes)),
+        )
 
+    @transaction.atomic
+    def _import_data(self, url, from_date, to_date, consumer_sessions, resolved):
         deposit_payout = DepositPayout.objects.create(
             source_type=DepositPayout.SOURCE_TYPE_API,
             source_identifier=url,
@@ -157,24 +393,9 @@ class Command(BaseCommand):
             ),
         )
 
-        deposit_payout_items = [
-            DepositPayoutItem(
-                deposit_payout=deposit_payout,
-                qr_bag=get_qr_bag(consumer_session),
-                company_branch=self._get_source(consumer_session, CompanyBranch),
-                kiosk=self._get_source(consumer_session, Kiosk),
-                product=self._get_product_from_barcode(item.product_code),
-                barcode=item.product_code,
-                count=item.count,
-                location_id=consumer_session.metadata.location.customer_id,
-                rvm_serial=consumer_session.metadata.rvm.serial_number,
-                date=consumer_session.started_at,
-                consumer_session_id=consumer_session.id,
-                consumer_identity=self._get_consumer_identity(consumer_session),
-            )
-            for consumer_session in consumer_sessions
-            for item in consumer_session.items
-        ]
+        deposit_payout_items = self._build_deposit_payout_items(
+            deposit_payout, consumer_sessions, resolved
+        )
         DepositPayoutItem.objects.bulk_create(deposit_payout_items)
 
         # Update status of all related QR bags to `esani_optalt`
@@ -189,18 +410,39 @@ class Command(BaseCommand):
             qr_bag.status = "esani_optalt"
         bulk_update_with_history(qr_bags, QRBag, ["status"], batch_size=500)
 
+    def _build_deposit_payout_items(self, deposit_payout, consumer_sessions, resolved):
+        deposit_payout_items = []
+        for consumer_session in consumer_sessions:
+            consumer_identity = self._get_consumer_identity(consumer_session)
+            source = resolved.get_source(consumer_identity)
+            for item in consumer_session.items:
+                deposit_payout_items.append(
+                    DepositPayoutItem(
+                        deposit_payout=deposit_payout,
+                        qr_bag=source.qr_bag,
+                        company_branch=source.company_branch,
+                        kiosk=source.kiosk,
+                        product_id=resolved.products.get(item.product_code),
+                        barcode=item.product_code,
+                        count=item.count,
+                        location_id=consumer_session.metadata.location.customer_id,
+                        rvm_serial=consumer_session.metadata.rvm.serial_number,
+                        date=consumer_session.started_at,
+                        consumer_session_id=consumer_session.id,
+                        consumer_identity=consumer_identity,
+                    )
+                )
+        return deposit_payout_items
+
     @transaction.atomic
     def _process_sessions_with_manual_data(
-        self, url, from_date, to_date, consumer_sessions
+        self, url, from_date, to_date, consumer_sessions, resolved
     ):
         # Create dictionary mapping each `consumer_identity` to a list of consumer
         # sessions.
         keyed_by_identity = defaultdict(list)
         for consumer_session in consumer_sessions:
-            key = (
-                f"{consumer_session.identity.consumer_identity or ''}"
-                f"{consumer_session.identity.bag_identity or ''}"
-            )
+            key = self._get_identity_key(consumer_session.identity)
             keyed_by_identity[key].append(consumer_session)
 
         # Go through each unique consumer identity (== QR code) and verify if the data
@@ -230,9 +472,13 @@ class Command(BaseCommand):
                 )
                 self._log_consumer_sessions(consumer_session_subset)
                 # Create deposit payout items from the new API data
-                self._import_data(url, from_date, to_date, consumer_session_subset)
+                self._import_data(
+                    url, from_date, to_date, consumer_session_subset, resolved
+                )
 
-    def _log_consumer_sessions(self, consumer_sessions: list[ConsumerSession]):
+    def _log_consumer_sessions(
+        self, consumer_sessions: list[ConsumerSessionProjection]
+    ):
         for consumer_session in consumer_sessions:
             self.stdout.write(f"- Consumer session: {consumer_session.id}")
             if consumer_session.items is not None:
@@ -267,116 +513,181 @@ class Command(BaseCommand):
     def _to_datetime(self, val: date) -> datetime:
         return datetime(val.year, val.month, val.day)
 
-    @cache
-    def _get_qr_bag_from_qr(
-        self,
-        consumer_identity: str,
-        qr_bag_model=QRBag,
-    ) -> QRBag | None:
+    def _get_qr_lookup(self, bag_qr: str) -> dict[str, str | int] | None:
         """
-        Find the matching `QRBag` instance for the given `consumer_identity`,
-        and return either a `CompanyBranch`, a `Kiosk`, or None in case of no match.
+        Return the `QRBag` field values matching the given QR code, or None if the QR
+        code is neither 18, 10 or 9 digits long.
         """
-
         long = 1 + settings.QR_ID_LENGTH + settings.QR_HASH_LENGTH
         short = 1 + settings.QR_ID_LENGTH
 
-        qs = qr_bag_model.objects.annotate(
-            qr_prefix=Substr("qr", 1, 1),
-            qr_id=Substr("qr", 2, settings.QR_ID_LENGTH),
-            qr_hash=Substr("qr", 2 + settings.QR_ID_LENGTH, settings.QR_HASH_LENGTH),
-        )
-
-        bag_qr = consumer_identity
-
         if len(bag_qr) == long:
             # 18-digit QR code (prefix + ID + hash.)
             # Exact match on entire QR.
-            lookup = Q(qr=bag_qr)
+            return {"qr": bag_qr}
+        elif not (bag_qr.isascii() and bag_qr.isdigit()):
+            return None
         elif len(bag_qr) == short:
             # 10-digit QR code (prefix + ID.)
             # Exact match on QR prefix and ID only.
-            lookup = Q(qr_prefix=bag_qr[0], qr_id=bag_qr[1:])
+            return {"qr_prefix": int(bag_qr[0]), "qr_seq": int(bag_qr[1:])}
         elif len(bag_qr) == settings.QR_ID_LENGTH:
             # 9-digit QR code (ID only.)
             # Exact match on QR ID.
-            lookup = Q(qr_id=bag_qr)
+            return {"qr_seq": int(bag_qr)}
         else:
-            # The provided QR code is neither 18, 10 or 9 digits long.
-            self.stdout.write(
-                f"Not looking up `QRBag` for code of unexpected length: "
-                f"{bag_qr=} (length={len(bag_qr)})"
-            )
             return None
 
-        try:
-            qr_bag = qs.get(lookup)
-        except QRBag.DoesNotExist:
-            self.stdout.write(f"No QRBag objects match '{lookup}'")
-        except QRBag.MultipleObjectsReturned:
-            self.stdout.write(f"Multiple QRBag objects match '{lookup}'")
-        else:
-            return qr_bag
-        return None
+    def _get_qr_bags(self, consumer_identities: set[str]) -> dict[str, QRBag]:
+        """
+        Find the matching `QRBag` instance for each of the given consumer identities,
+        using a single query.
+        """
+        lookups = {}
+        for consumer_identity in consumer_identities:
+            lookup = self._get_qr_lookup(consumer_identity)
+            if lookup is None:
+                self.stdout.write(
+                    f"Not looking up `QRBag` for code of unexpected length: "
+                    f"{consumer_identity=} (length={len(consumer_identity)})"
+                )
+            else:
+                lookups[consumer_identity] = lookup
+        if not lookups:
+            return {}
+
+        qrs = {lookup["qr"] for lookup in lookups.values() if "qr" in lookup}
+        seqs = {lookup["qr_seq"] for lookup in lookups.values() if "qr_seq" in lookup}
+        qr_bags = QRBag.objects.select_related("company_branch", "kiosk").filter(
+            Q(qr__in=qrs) | Q(qr_seq__in=seqs)
+        )
 
-    def _get_from_qr(
+        by_qr: dict[str, QRBag] = {}
+        by_seq: dict[int | None, list[QRBag]] = defaultdict(list)
+        for qr_bag in qr_bags:
+            by_qr[qr_bag.qr] = qr_bag
+            by_seq[qr_bag.qr_seq].append(qr_bag)
+
+        result = {}
+        for consumer_identity, lookup in lookups.items():
+            if "qr" in lookup:
+                match = by_qr.get(str(lookup["qr"]))
+                candidates = [match] if match is not None else []
+            else:
+                candidates = [
+                    qr_bag
+                    for qr_bag in by_seq.get(int(lookup["qr_seq"]), [])
+                    if all(getattr(qr_bag, k) == v for k, v in lookup.items())
+                ]
+            if not candidates:
+                self.stdout.write(f"No QRBag objects match {lookup}")
+            elif len(candidates) > 1:
+                self.stdout.write(f"Multiple QRBag objects match {lookup}")
+            else:
+                result[consumer_identity] = candidates[0]
+        return result
+
+    def _get_qr_bag_from_qr(
         self,
         consumer_identity: str,
-        source_type: type[CompanyBranch] | type[Kiosk],
         qr_bag_model=QRBag,
-    ) -> CompanyBranch | Kiosk | None:
-        qr_bag = self._get_qr_bag_from_qr(consumer_identity, qr_bag_model=qr_bag_model)
-        if qr_bag is None:
+    ) -> QRBag | None:
+        """
+        Find the matching `QRBag` instance for a single `consumer_identity`.
+
+        This is used by the migration `0046_backfill_deposit_payout_item_qr_bag`, whose
+        historical `QRBag` model predates the `qr_prefix` and `qr_seq` fields, so the QR
+        code parts are extracted from `qr` instead. The import itself looks up QR bags
+        in bulk using `_get_qr_bags`.
+        """
+        lookup = self._get_qr_lookup(consumer_identity)
+        if lookup is None:
             return None
-        if source_type is CompanyBranch:
-            return qr_bag.company_branch
-        elif source_type is Kiosk:
-            return qr_bag.kiosk
+        qs = qr_bag_model.objects.annotate(
+            qr_prefix_str=Substr("qr", 1, 1),
+            qr_id=Substr("qr", 2, settings.QR_ID_LENGTH),
+        )
+        if "qr" in lookup:
+            qs = qs.filter(qr=lookup["qr"])
         else:
-            raise ValueError(f"Unknown source type {source_type=}")
+            qs = qs.filter(qr_id=consumer_identity[-settings.QR_ID_LENGTH :])
+            if "qr_prefix" in lookup:
+                qs = qs.filter(qr_prefix_str=consumer_identity[0])
+        try:
+            return qs.get()
+        except (QRBag.DoesNotExist, QRBag.MultipleObjectsReturned):
+            return None
 
-    @cache
-    def _get_direct(
-        self,
-        consumer_identity: str,
-        source_type: type[CompanyBranch] | type[Kiosk],
-    ) -> CompanyBranch | Kiosk | None:
+    def _get_external_customer_id(self, consumer_identity: str) -> str | None:
         """
-        Find the `CompanyBranch` or `Kiosk` whose external customer ID is encoded
-        directly in the `consumer_identity` given.
+        Return the external customer ID encoded directly in the `consumer_identity`
+        given, if any.
         """
-
         # Look for strings starting with "8" or "9", followed by three zeroes, followed
         # by an external customer ID (6 digits, starting with either "1", "2" or "3".)
-        pattern = re.compile(r"[8|9]000(?P<ext_id>[1|2|3]\d{5})")
-        match = pattern.match(consumer_identity)
-
+        match = _external_customer_id_pattern.match(consumer_identity)
         if match:
             # Convert "200002" into "2-00002", etc.
             ext_id = match.group("ext_id")
-            ext_id_with_separator = re.sub(r"(\d)(\d{5})", r"\g<1>-\g<2>", ext_id)
+            return f"{ext_id[0]}-{ext_id[1:]}"
+        return None
 
-            # Try to look up object based on `ext_id_with_separator`
-            try:
-                obj = AbstractCompany.get_from_id(ext_id_with_separator)
-            except ObjectDoesNotExist:
+    def _get_direct_sources(
+        self, consumer_identities: set[str]
+    ) -> dict[str, CompanyBranch | Kiosk]:
+        """
+        Find the `CompanyBranch` or `Kiosk` whose external customer ID is encoded
+        directly in each of the given consumer identities, using one query per type.
+        """
+        source_types: dict[str, type[CompanyBranch] | type[Kiosk]] = {
+            CompanyBranch.customer_id_prefix: CompanyBranch,
+            Kiosk.customer_id_prefix: Kiosk,
+        }
+
+        ext_ids = {}
+        for consumer_identity in consumer_identities:
+            ext_id = self._get_external_customer_id(consumer_identity)
+            if ext_id is None:
+                continue
+            if ext_id.split("-")[0] in source_types:
+                ext_ids[consumer_identity] = ext_id
+            else:
                 self.stdout.write(
-                    f"No matching object for external customer ID: "
-                    f"{ext_id_with_separator}"
+                    f"Unexpected external customer ID (expected `CompanyBranch` or "
+                    f"`Kiosk`): {ext_id}"
                 )
+
+        objects = {}
+        for prefix, source_type in source_types.items():
+            pks = [
+                int(ext_id.split("-")[1])
+                for ext_id in ext_ids.values()
+                if ext_id.split("-")[0] == prefix
+            ]
+            if pks:
+                for obj in source_type.objects.filter(pk__in=pks):
+                    objects[obj.external_customer_id] = obj
+
+        result = {}
+        for consumer_identity, ext_id in ext_ids.items():
+            if ext_id in objects:
+                result[consumer_identity] = objects[ext_id]
             else:
-                if isinstance(obj, (CompanyBranch, Kiosk)) and isinstance(
-                    obj, source_type
-                ):
-                    return obj
-                else:
-                    self.stdout.write(
-                        f"Unexpected match on `{obj.__class__.__name__}` "
-                        f"(expected `{source_type.__name__}`): {ext_id_with_separator}"
-                    )
-        return None
+                self.stdout.write(
+                    f"No matching object for external customer ID: {ext_id}"
+                )
+        return result
+
+    def _get_products(self, barcodes: set[str]) -> dict[str, int]:
+        return dict(
+            Product.objects.exclude(state=ProductState.DELETED)
+            .filter(barcode__in=barcodes)
+            .values_list("barcode", "pk")
+        )
 
-    def _get_consumer_identity(self, consumer_session: ConsumerSession) -> str | None:
+    def _get_consumer_identity(
+        self, consumer_session: ConsumerSessionProjection
+    ) -> str | None:
         # This contains a 10- or 18-digit value, depending on which bulk machine that
         # has scanned the bag.
         consumer_identity = getattr(
@@ -394,41 +705,6 @@ class Command(BaseCommand):
             # Return 10- or 18-digit value, or None
             return consumer_identity
 
-    def _get_source(
-        self,
-        consumer_session: ConsumerSession,
-        source_type: type[CompanyBranch] | type[Kiosk],
-    ) -> CompanyBranch | Kiosk | None:
-        """
-        Find the "source" of the given `consumer_session` - either a `CompanyBranch`,
-        a `Kiosk`, or None.
-        """
-        consumer_identity = self._get_consumer_identity(consumer_session)
-        if consumer_identity and isinstance(consumer_identity, str):
-            # First, try looking for an external customer ID encoded directly in the
-            # `consumer_identity`.
-            source = self._get_direct(consumer_identity, source_type)
-            if source is None:
-                # Then, look for a `QRBag` matching `consumer_identity`
-                source = self._get_from_qr(consumer_identity, source_type)
-            return source
-        else:
-            self.stdout.write(
-                f"No `identity` in {consumer_session.id} ({consumer_session.metadata=})"
-            )
-            return None
-
-    @cache
-    def _get_product_from_barcode(self, barcode) -> Product | None:
-        try:
-            product = Product.objects.exclude(state=ProductState.DELETED).get(
-                barcode=barcode
-            )
-        except Product.DoesNotExist:
-            return None
-        else:
-            return product
-
     def _get_qr_bag(self, consumer_identity, qr_bag_model=None):
         """
         Dummy implementation to keep the migration `0041_backfill_short_qr_codes`
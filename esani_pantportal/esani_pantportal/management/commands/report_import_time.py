@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Line written by `python -X importtime`, e.g.
+# "import time:       564 |     313087 |     pandas"
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+    @property
+    def package(self) -> str:
+        return self.module.split(".")[0]
+
+
+def parse_import_times(output: str) -> list[ImportTime]:
+    import_times = []
+    for line in output.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            import_times.append(
+                ImportTime(module, int(self_us), int(cumulative_us), len(indent) // 2)
+            )
+    return import_times
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the time spent importing the project when it starts, and fail if it "
+        "imports any of `settings.IMPORT_TIME_DEFERRED_PACKAGES`, or if it exceeds "
+        "the budget given by `--budget` or `settings.IMPORT_TIME_BUDGET`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--module",
+            default=settings.ROOT_URLCONF,
+            help="Module to import after setting up Django",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=settings.IMPORT_TIME_BUDGET,
+            help="Maximum number of milliseconds spent importing (default: no limit)",
+        )
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=15,
+            help="Number of packages to list",
+        )
+
+    def handle(
+        self,
+        module=settings.ROOT_URLCONF,
+        budget=settings.IMPORT_TIME_BUDGET,
+        top=15,
+        **kwargs,
+    ):
+        import_times = self._get_import_times(module)
+
+        total_us = sum(t.cumulative_us for t in import_times if t.depth == 0)
+        package_us: dict[str, int] = defaultdict(int)
+        for import_time in import_times:
+            package_us[import_time.package] += import_time.self_us
+
+        self.stdout.write(f"Importing {module}: {total_us / 1000:.1f} ms")
+        for package, self_us in sorted(
+            package_us.items(), key=lambda item: item[1], reverse=True
+        )[:top]:
+            self.stdout.write(f"{self_us / 1000:10.1f} ms  {package}")
+
+        errors = []
+        deferred = sorted(
+            {
+                import_time.package
+                for import_time in import_times
+                if import_time.package in settings.IMPORT_TIME_DEFERRED_PACKAGES
+            }
+        )
+        if deferred:
+            errors.append(f"Deferred packages are imported: {', '.join(deferred)}")
+        if budget is not None and total_us > budget * 1000:
+            errors.append(
+                f"Importing took {total_us / 1000:.1f} ms, "
+                f"exceeding the budget of {budget} ms"
+            )
+        if errors:
+            raise CommandError("\n".join(errors))
+
+    def _get_import_times(self, module: str) -> list[ImportTime]:
+        # Imports are measured in a new interpreter, as most of the project is already
+        # imported by this one
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-X",
+                "importtime",
+                "-c",
+                f"import django; django.setup(); import {module}",
+            ],
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Could not import {module}:\n{result.stderr}")
+        return parse_import_times(result.stderr)
@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from esani_pantportal.clients.tomra.simulator import (
+    SimulatorConfig,
+    TomraSimulatorServer,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve synthetic consumer sessions from a local simulator of the Tomra API. "
+        "Point `TOMRA_API_URL` at the simulator to import from it."
+    )
+
+    def add_arguments(self, parser):
+        defaults = SimulatorConfig()
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8102)
+        parser.add_argument(
+            "--sessions-per-day",
+            type=int,
+            default=defaults.sessions_per_day,
+            help="Number of consumer sessions generated per day",
+        )
+        parser.add_argument(
+            "--items-per-session",
+            type=int,
+            default=defaults.items_per_session,
+            help="Maximum number of items in each consumer session",
+        )
+        parser.add_argument(
+            "--bags",
+            type=int,
+            default=defaults.bags,
+            help="Number of distinct QR bags",
+        )
+        parser.add_argument(
+            "--bag-prefix",
+            type=int,
+            default=defaults.bag_prefix,
+            help="Prefix of the QR codes of the QR bags",
+        )
+        parser.add_argument(
+            "--rvms",
+            type=int,
+            default=defaults.rvms,
+            help="Number of distinct RVMs",
+        )
+        parser.add_argument(
+            "--products",
+            type=int,
+            default=defaults.products,
+            help="Number of distinct product barcodes",
+        )
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=defaults.page_size,
+            help="Maximum number of consumer sessions per page",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=defaults.latency,
+            help="Number of seconds each response is delayed",
+        )
+        parser.add_argument(
+            "--rate-limit",
+            type=float,
+            default=defaults.rate_limit,
+            help="Maximum number of requests per second (0 means unlimited)",
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=defaults.error_rate,
+            help="Fraction of consumer session requests that fail",
+        )
+        parser.add_argument(
+            "--error-status",
+            type=int,
+            default=defaults.error_status,
+            help="Status code of failed consumer session requests",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=defaults.seed,
+            help="Seed of the generated consumer sessions",
+        )
+
+    def handle(self, *args, **options):
+        if settings.ENVIRONMENT in ("production", "staging"):
+            raise CommandError(
+                f"Will not run the Tomra API simulator in {settings.ENVIRONMENT}"
+            )
+        if options["sessions_per_day"] < 1 or options["page_size"] < 1:
+            raise CommandError("Number of sessions per day and page size must be >= 1")
+
+        config = SimulatorConfig(
+            sessions_per_day=options["sessions_per_day"],
+            items_per_session=options["items_per_session"],
+            bags=options["bags"],
+            bag_prefix=options["bag_prefix"],
+            rvms=options["rvms"],
+            products=options["products"],
+            page_size=options["page_size"],
+            latency=options["latency"],
+            rate_limit=options["rate_limit"],
+            error_rate=options["error_rate"],
+            error_status=options["error_status"],
+            seed=options["seed"],
+        )
+        server = TomraSimulatorServer((options["host"], options["port"]), config)
+        self.stdout.write(f"Serving the Tomra API simulator on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("esani_pantportal", "0073_historicalqrbag_hidden_reason_qrbag_hidden_reason"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestedFile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255, verbose_name="Filnavn")),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(verbose_name="Størrelse (bytes)"),
+                ),
+                ("mtime", models.DateTimeField(verbose_name="Senest ændret")),
+                ("sha256", models.CharField(max_length=64, verbose_name="SHA-256")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("new", "Ny"),
+                            ("imported", "Importeret"),
+                            ("failed", "Fejlet"),
+                            ("changed", "Ændret efter import"),
+                        ],
+                        default="new",
+                        max_length=10,
+                        verbose_name="Status",
+                    ),
+                ),
+                (
+                    "item_count",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Antal linjer"
+                    ),
+                ),
+                (
+                    "duration",
+                    models.FloatField(
+                        blank=True, null=True, verbose_name="Importtid (sekunder)"
+                    ),
+                ),
+                (
+                    "message",
+                    models.TextField(blank=True, default="", verbose_name="Besked"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "deposit_payout",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="ingested_files",
+                        to="esani_pantportal.depositpayout",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["name", "size", "mtime"],
+                        name="esani_pantp_name_a3ba0e_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("name", "sha256"),
+                        name="ingestedfile_unique_name_sha256",
+                    )
+                ],
+            },
+        ),
+    ]
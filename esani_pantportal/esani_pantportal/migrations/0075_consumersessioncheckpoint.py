@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("esani_pantportal", "0074_ingestedfile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConsumerSessionCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("from_date", models.DateField(verbose_name="Fra dato")),
+                ("to_date", models.DateField(verbose_name="Til dato")),
+                ("next", models.TextField(verbose_name="Fortsættelsestoken")),
+                (
+                    "page_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Antal importerede sider"
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("from_date", "to_date"),
+                        name="consumersessioncheckpoint_unique_window",
+                    )
+                ],
+            },
+        ),
+    ]
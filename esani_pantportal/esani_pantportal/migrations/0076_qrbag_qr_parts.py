@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("esani_pantportal", "0075_consumersessioncheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="historicalqrbag",
+            name="qr_hash",
+            field=models.CharField(editable=False, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name="historicalqrbag",
+            name="qr_prefix",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="historicalqrbag",
+            name="qr_seq",
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="qrbag",
+            name="qr_hash",
+            field=models.CharField(editable=False, max_length=8, null=True),
+        ),
+        migrations.AddField(
+            model_name="qrbag",
+            name="qr_prefix",
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="qrbag",
+            name="qr_seq",
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="qrbag",
+            index=models.Index(
+                fields=["qr_seq", "qr_prefix"], name="qrbag_qr_seq_prefix"
+            ),
+        ),
+    ]
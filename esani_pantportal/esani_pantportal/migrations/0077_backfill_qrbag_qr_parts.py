@@ -0,0 +1,48 @@
+from django.db import migrations
+
+# The values of `settings.QR_ID_LENGTH` and `settings.QR_HASH_LENGTH` when this
+# migration was written
+QR_ID_LENGTH = 9
+QR_HASH_LENGTH = 8
+
+
+def parse_qr(qr):
+    """Split a QR code into its prefix, sequence number and control code, like
+    `QRBag.parse_qr` did when this migration was written.
+    """
+    id_end = 1 + QR_ID_LENGTH
+    id_part = qr[:id_end]
+    if len(qr) != id_end + QR_HASH_LENGTH or not (
+        id_part.isascii() and id_part.isdigit()
+    ):
+        return None, None, None
+    return int(qr[0]), int(id_part[1:]), qr[id_end:]
+
+
+def backfill_qr_parts(apps, schema_editor):
+    QRBag = apps.get_model("esani_pantportal", "QRBag")
+
+    batch = []
+    updated = 0
+    for qr_bag in QRBag.objects.only("pk", "qr").iterator(chunk_size=2000):
+        qr_bag.qr_prefix, qr_bag.qr_seq, qr_bag.qr_hash = parse_qr(qr_bag.qr)
+        batch.append(qr_bag)
+        if len(batch) == 2000:
+            QRBag.objects.bulk_update(batch, ["qr_prefix", "qr_seq", "qr_hash"])
+            updated += len(batch)
+            batch = []
+    QRBag.objects.bulk_update(batch, ["qr_prefix", "qr_seq", "qr_hash"])
+    updated += len(batch)
+
+    print(f"Completed backfill: {updated=}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("esani_pantportal", "0076_qrbag_qr_parts"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_qr_parts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('esani_pantportal', '0077_backfill_qrbag_qr_parts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingestedfile',
+            name='mtime',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Senest ændret'),
+        ),
+        migrations.AlterField(
+            model_name='ingestedfile',
+            name='sha256',
+            field=models.CharField(blank=True, max_length=64, verbose_name='SHA-256'),
+        ),
+        migrations.AlterField(
+            model_name='ingestedfile',
+            name='size',
+            field=models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Størrelse (bytes)'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+def seed_ingested_files(apps, schema_editor):
+    """Add the files imported before the ledger was introduced to the ledger, so
+    `import_deposit_payouts` does not read them again"""
+    DepositPayout = apps.get_model("esani_pantportal", "DepositPayout")
+    IngestedFile = apps.get_model("esani_pantportal", "IngestedFile")
+
+    known = set(IngestedFile.objects.values_list("name", flat=True))
+    batch = {}
+    for pk, name in (
+        DepositPayout.objects.filter(source_type="csv")
+        .order_by("pk")
+        .values_list("pk", "source_identifier")
+        .iterator(chunk_size=2000)
+    ):
+        if name not in known and name not in batch:
+            batch[name] = IngestedFile(
+                name=name,
+                status="imported",
+                deposit_payout_id=pk,
+            )
+    IngestedFile.objects.bulk_create(batch.values(), batch_size=2000)
+
+    print(f"Completed seed: created={len(batch)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("esani_pantportal", "0078_alter_ingestedfile_mtime_alter_ingestedfile_sha256_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_ingested_files, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,10 @@ import hashlib
 import logging
 import random
 import string
+import threading
+import time
+from bisect import bisect_right
+from dataclasses import dataclass
 from typing import Union
 
 from django.apps import apps
@@ -778,18 +782,22 @@ class QRCodeGenerator(models.Model):
     )
     prefix = models.PositiveIntegerField(unique=True)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        qr_code_index.invalidate()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        qr_code_index.invalidate()
+        return result
+
     def _get_salt(self, qr_seqno):
         """Return salt used for this sequence number if available"""
 
-        salt = ""
         if 0 <= qr_seqno < self.count:
             # Code is in range.
-            for i in self.intervals.all():
-                # This could be done more elegantly with an interval dictionary
-                # but performance-wise it's not going to matter.
-                if i.start <= qr_seqno < i.start + i.increment:
-                    salt = i.salt
-        return salt
+            return qr_code_index.get_salt(self.prefix, qr_seqno)
+        return ""
 
     @staticmethod
     def _generate_qr(qr_seqno, salt, prefix):
@@ -801,28 +809,40 @@ class QRCodeGenerator(models.Model):
 
         return f"{url_prefix}{prefix}{id_str}{control_code}"
 
-    def generate_qr_codes(self, increment, salt=None):
-        """Generate a new batch of QR codes"""
+    def reserve_interval(self, increment, salt=None) -> "QRCodeInterval":
+        """Reserve the next `increment` sequence numbers of this generator.
+
+        The generator row is locked while the interval is created, so concurrent
+        reservations never overlap. The QR codes themselves can then be generated
+        outside the transaction (see `QRCodeInterval.get_qr_codes`.)
+        """
 
         with transaction.atomic():
             if not salt:
                 # Generate random string to use as salt.
                 salt = "".join(random.choice(string.ascii_letters) for i in range(128))
 
+            self.count = (
+                QRCodeGenerator.objects.select_for_update()
+                .values_list("count", flat=True)
+                .get(pk=self.pk)
+            )
             new_interval = QRCodeInterval(
                 generator=self, start=self.count, increment=increment, salt=salt
             )
-            # The necessary data are in place - now generate list of QR codes.
-            qr_codes = [
-                self._generate_qr(self.count + i, salt, self.prefix)
-                for i in range(increment)
-            ]
             # Save changes
             self.count = self.count + increment
             self.save()
             new_interval.save()
-        # And return
-        return qr_codes
+            # Other threads may have reloaded the index before the new interval was
+            # committed
+            transaction.on_commit(qr_code_index.invalidate)
+        return new_interval
+
+    def generate_qr_codes(self, increment, salt=None):
+        """Generate a new batch of QR codes"""
+
+        return self.reserve_interval(increment, salt=salt).get_qr_codes()
 
     def check_qr_code(self, qr_code):
         """Parse QR code, return ID if successful"""
@@ -863,13 +883,19 @@ class QRCodeGenerator(models.Model):
     @staticmethod
     def qr_code_exists(qr):
         # Check if we issued this QR code.
-        url_prefix = settings.QR_URL_PREFIX
-        qr_url = f"{url_prefix}{qr}"
-        found = any(
-            (True for g in QRCodeGenerator.objects.all() if g.check_qr_code(qr_url))
-        )
-
-        return found
+        id_length = settings.QR_ID_LENGTH
+        prefix = qr[: len(qr) - id_length - settings.QR_HASH_LENGTH]
+        if not (prefix.isascii() and prefix.isdigit()) or prefix != str(int(prefix)):
+            return False
+        qr_id = qr[len(prefix) : len(prefix) + id_length]
+        if not (qr_id.isascii() and qr_id.isdigit()):
+            return False
+
+        salt = qr_code_index.get_salt(int(prefix), int(qr_id))
+        if salt is None:
+            return False
+        check_qr = QRCodeGenerator._generate_qr(int(qr_id), salt, prefix)
+        return check_qr == f"{settings.QR_URL_PREFIX}{qr}"
 
     def __str__(self):
         return f"{self.name} - {self.prefix} ({self.count})"
@@ -891,6 +917,26 @@ class QRCodeInterval(models.Model):
     increment = models.PositiveIntegerField()
     salt = models.CharField(max_length=200)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        qr_code_index.invalidate()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        qr_code_index.invalidate()
+        return result
+
+    def get_qr_codes(self, start=None, stop=None) -> list[str]:
+        """Return the QR codes of this interval (or of the sequence numbers from
+        `start` to `stop` within it.)"""
+        start = self.start if start is None else start
+        stop = self.start + self.increment if stop is None else stop
+        prefix = self.generator.prefix
+        return [
+            QRCodeGenerator._generate_qr(qr_seqno, self.salt, prefix)
+            for qr_seqno in range(start, stop)
+        ]
+
     def __str__(self):
         gen_name = self.generator.name
         start = self.start
@@ -898,6 +944,89 @@ class QRCodeInterval(models.Model):
         return f"{gen_name}[{start}:{end}] - {self.salt}"
 
 
+@dataclass(frozen=True)
+class _IndexedQRCodeGenerator:
+    count: int
+    starts: list[int]
+    ends: list[int]
+    salts: list[str]
+
+
+class QRCodeIndex:
+    """Process-level index of the QR code generators and their intervals.
+
+    The index is loaded on first use, and reloaded after the generators or intervals
+    have been changed in this process. Intervals are only ever added, so if another
+    process has generated new QR codes, the index is reloaded when a sequence number
+    beyond the indexed ones is looked up (at most once per `reload_interval` seconds,
+    so invalid QR codes cannot cause a query per lookup.)
+    """
+
+    reload_interval = 1.0
+
+    def __init__(self):
+        self._generators: dict[int, _IndexedQRCodeGenerator] | None = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._generators = None
+
+    def load(self) -> dict[int, _IndexedQRCodeGenerator]:
+        """Load the index now, e.g. in the gunicorn master before the workers are
+        forked (see `project.warm_start`)"""
+        with self._lock:
+            generators = self._generators = self._load()
+            self._loaded_at = time.monotonic()
+        return generators
+
+    def _load(self) -> dict[int, _IndexedQRCodeGenerator]:
+        generators = {}
+        for generator in QRCodeGenerator.objects.prefetch_related("intervals"):
+            intervals = sorted(generator.intervals.all(), key=lambda i: i.start)
+            generators[generator.prefix] = _IndexedQRCodeGenerator(
+                count=generator.count,
+                starts=[i.start for i in intervals],
+                ends=[i.start + i.increment for i in intervals],
+                salts=[i.salt for i in intervals],
+            )
+        return generators
+
+    def _get_generators(
+        self, reload: bool = False
+    ) -> dict[int, _IndexedQRCodeGenerator]:
+        generators = self._generators
+        if generators is None or (
+            reload and time.monotonic() - self._loaded_at >= self.reload_interval
+        ):
+            generators = self.load()
+        return generators
+
+    def get_salt(self, prefix: int, qr_seqno: int) -> str | None:
+        """Return the salt used for the given QR code prefix and sequence number.
+
+        Returns an empty string if no QR code has been generated with this sequence
+        number, and None if there is no generator with this prefix.
+        """
+        generators = self._get_generators()
+        generator = generators.get(prefix)
+        if generator is None or qr_seqno >= generator.count:
+            # The QR code may have been generated by another process
+            generator = self._get_generators(reload=True).get(prefix)
+            if generator is None:
+                return None
+
+        if not 0 <= qr_seqno < generator.count:
+            return ""
+        i = bisect_right(generator.starts, qr_seqno) - 1
+        if i >= 0 and qr_seqno < generator.ends[i]:
+            return generator.salts[i]
+        return ""
+
+
+qr_code_index = QRCodeIndex()
+
+
 class User(
     AbstractUser,
 ):
@@ -1309,6 +1438,113 @@ class DepositPayoutItem(models.Model):
         return f"{self.count}x {self.barcode}"
 
 
+class IngestedFile(models.Model):
+    """Ledger of the Tomra CSV files seen by `import_deposit_payouts`.
+
+    A file is identified by its name and the SHA-256 of its contents, so a file which
+    is re-delivered with different contents gets a new entry.
+
+    Entries for the files imported before the ledger was introduced are created from
+    their deposit payouts, and have no size, modification time or SHA-256.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "sha256"],
+                name="ingestedfile_unique_name_sha256",
+            )
+        ]
+        indexes = [
+            models.Index(fields=["name", "size", "mtime"]),
+        ]
+
+    STATUS_NEW = "new"
+    STATUS_IMPORTED = "imported"
+    STATUS_FAILED = "failed"
+    STATUS_CHANGED = "changed"
+
+    STATUSES = [
+        (STATUS_NEW, _("Ny")),
+        (STATUS_IMPORTED, _("Importeret")),
+        (STATUS_FAILED, _("Fejlet")),
+        (STATUS_CHANGED, _("Ændret efter import")),
+    ]
+
+    PENDING_STATUSES = [STATUS_NEW, STATUS_FAILED]
+    """Files with these statuses are (re)tried by the next import"""
+
+    SETTLED_STATUSES = [STATUS_IMPORTED, STATUS_CHANGED]
+
+    name = models.CharField(_("Filnavn"), max_length=255)
+
+    size = models.PositiveBigIntegerField(_("Størrelse (bytes)"), null=True, blank=True)
+
+    mtime = models.DateTimeField(_("Senest ændret"), null=True, blank=True)
+
+    sha256 = models.CharField(_("SHA-256"), max_length=64, blank=True)
+
+    status = models.CharField(
+        _("Status"),
+        max_length=10,
+        choices=STATUSES,
+        default=STATUS_NEW,
+    )
+
+    item_count = models.PositiveIntegerField(_("Antal linjer"), null=True, blank=True)
+
+    duration = models.FloatField(_("Importtid (sekunder)"), null=True, blank=True)
+
+    message = models.TextField(_("Besked"), blank=True, default="")
+
+    deposit_payout = models.ForeignKey(
+        DepositPayout,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ingested_files",
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
+
+
+class ConsumerSessionCheckpoint(models.Model):
+    """Progress of an unfinished `import_deposit_payouts_qrbag` run.
+
+    Each page of consumer sessions is imported in its own transaction, together with
+    the continuation token (`next`) of the following page. A restarted run resumes
+    from that page. The checkpoint is deleted when the last page has been imported.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["from_date", "to_date"],
+                name="consumersessioncheckpoint_unique_window",
+            )
+        ]
+
+    from_date = models.DateField(_("Fra dato"))
+
+    to_date = models.DateField(_("Til dato"))
+
+    next = models.TextField(_("Fortsættelsestoken"))
+
+    page_count = models.PositiveIntegerField(_("Antal importerede sider"), default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.from_date} - {self.to_date} ({self.page_count})"
+
+
 class QRBag(models.Model):
     class Meta:
         constraints = [
@@ -1317,6 +1553,9 @@ class QRBag(models.Model):
                 name="has_only_company_branch_or_kiosk",
             )
         ]
+        indexes = [
+            models.Index(fields=["qr_seq", "qr_prefix"], name="qrbag_qr_seq_prefix"),
+        ]
         ordering = ["qr"]
 
     history = HistoricalRecords()
@@ -1325,6 +1564,13 @@ class QRBag(models.Model):
         unique=True,
         max_length=200,  # TODO: Hvor lange er vores QR-koder?
     )
+    # The parts of `qr` (prefix, sequence number and control code), for looking up QR
+    # bags from partial QR codes. These are set automatically when saving.
+    qr_prefix = models.PositiveSmallIntegerField(null=True, editable=False)
+    qr_seq = models.PositiveBigIntegerField(null=True, editable=False)
+    qr_hash = models.CharField(
+        max_length=settings.QR_HASH_LENGTH, null=True, editable=False
+    )
     owner = models.ForeignKey(
         User,
         null=True,
@@ -1354,6 +1600,29 @@ class QRBag(models.Model):
         null=True,
     )
 
+    def save(self, *args, **kwargs):
+        self.set_qr_parts()
+        super().save(*args, **kwargs)
+
+    def set_qr_parts(self):
+        """Set the QR code parts from `qr`. This is done automatically by `save`, but
+        must be done explicitly before using `bulk_create`."""
+        self.qr_prefix, self.qr_seq, self.qr_hash = self.parse_qr(self.qr)
+
+    @staticmethod
+    def parse_qr(qr: str) -> tuple[int | None, int | None, str | None]:
+        """Split a QR code into its prefix, sequence number and control code.
+
+        Returns a tuple of `None` if the QR code does not have the expected format.
+        """
+        id_end = 1 + settings.QR_ID_LENGTH
+        id_part = qr[:id_end]
+        if len(qr) != id_end + settings.QR_HASH_LENGTH or not (
+            id_part.isascii() and id_part.isdigit()
+        ):
+            return None, None, None
+        return int(qr[0]), int(id_part[1:]), qr[id_end:]
+
 
 class QRStatus(models.Model):
     code = models.CharField(
@@ -0,0 +1,199 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Cache of the users ("principals") authenticated by the API.
+
+An API request authenticated by a JWT would otherwise load the user, the user profile,
+the branch and the permissions of the user from the database on every request. The
+cache holds the fields of the user needed by the API, its branch and company, its admin
+status and its permissions, from which `get_principal` builds a `User`, so
+authenticating and authorizing a request takes a single cache lookup. Other fields of
+the user, such as its password hash, are not cached, and are loaded from the database
+if they are accessed.
+
+Cached principals are deleted whenever the user, the groups or permissions of the
+user, or the branch or company of the user is changed.
+"""
+
+from collections.abc import Iterable
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.utils.translation import gettext_lazy as _
+from ninja_jwt.authentication import JWTAuth
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.settings import api_settings
+
+from esani_pantportal.backends import get_user_with_profile
+from esani_pantportal.models import (
+    BranchUser,
+    Company,
+    CompanyBranch,
+    CompanyUser,
+    EsaniUser,
+    Kiosk,
+    KioskUser,
+    User,
+)
+
+PRINCIPAL_VERSION = 2
+"""Version of the cached principals. Must be increased whenever the data loaded by
+`_load_principal` is changed, so principals cached by an older release are not used."""
+
+PRINCIPAL_FIELDS = [
+    "id",
+    "username",
+    "user_type",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+]
+"""Fields of the user stored in the cached principals"""
+
+
+def _get_key(user_id: int) -> str:
+    return f"principal:v{PRINCIPAL_VERSION}:{user_id}"
+
+
+def _load_principal(user_id: int) -> dict | None:
+    # The branch, company and admin status are loaded along with the user
+    user = get_user_with_profile(user_id)
+    if user is None:
+        return None
+    return {
+        "fields": {name: getattr(user, name) for name in PRINCIPAL_FIELDS},
+        "branch": user.branch,
+        "company": user.company,
+        "is_esani_admin": user.is_esani_admin,
+        "is_admin": user.is_admin,
+        "permissions": user.get_all_permissions(),
+    }
+
+
+def _build_principal(principal: dict) -> User:
+    # The other fields are deferred, and are loaded when accessed
+    fields = principal["fields"]
+    names = [f.attname for f in User._meta.concrete_fields if f.attname in fields]
+    user = User.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+    # Set the cached properties of `User`, and the permission cache of `ModelBackend`
+    user.branch = principal["branch"]
+    user.company = principal["company"]
+    user.is_esani_admin = principal["is_esani_admin"]
+    user.is_admin = principal["is_admin"]
+    user._perm_cache = principal["permissions"]  # type: ignore[attr-defined]
+    return user
+
+
+def get_principal(user_id: int) -> User | None:
+    """Return the user with the given ID, with its branch, company and permissions
+    loaded. Returns None if there is no such user."""
+    key = _get_key(user_id)
+    principal = cache.get(key)
+    if principal is None:
+        principal = _load_principal(user_id)
+        if principal is None:
+            return None
+        cache.set(key, principal, settings.PRINCIPAL_CACHE_TIMEOUT)
+    return _build_principal(principal)
+
+
+def invalidate_principals(user_ids: Iterable[int]):
+    keys = [_get_key(user_id) for user_id in user_ids]
+    if keys:
+        cache.delete_many(keys)
+        # A request may have cached the old principal again before the change was
+        # committed
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+class PrincipalJWTAuth(JWTAuth):
+    """JWT authentication using the cached principals"""
+
+    def get_user(self, validated_token) -> User:
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(
+                _("Token contained no recognizable user identification")
+            ) from e
+
+        user = get_principal(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"))
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"))
+        return user
+
+
+def _invalidate_user(sender, instance, **kwargs):
+    invalidate_principals([instance.pk])
+
+
+def _invalidate_group(sender, instance, **kwargs):
+    invalidate_principals(instance.user_set.values_list("pk", flat=True))
+
+
+def _invalidate_branch(sender, instance, **kwargs):
+    invalidate_principals(instance.users.values_list("pk", flat=True))
+
+
+def _invalidate_company(sender, instance, **kwargs):
+    invalidate_principals(
+        list(instance.users.values_list("pk", flat=True))
+        + list(
+            BranchUser.objects.filter(branch__company=instance).values_list(
+                "pk", flat=True
+            )
+        )
+    )
+
+
+def _invalidate_user_m2m(sender, instance, action, reverse, model, pk_set, **kwargs):
+    # `User.groups` or `User.user_permissions` was changed
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        invalidate_principals([instance.pk])
+    elif pk_set:
+        invalidate_principals(pk_set)
+    else:
+        # The group or permission is being removed from all users
+        field = "groups" if isinstance(instance, Group) else "user_permissions"
+        users = User.objects.filter(**{field: instance})
+        invalidate_principals(users.values_list("pk", flat=True))
+
+
+def _invalidate_group_permissions(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    # `Group.permissions` was changed
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+    if not reverse:
+        users = User.objects.filter(groups=instance)
+    elif pk_set:
+        users = User.objects.filter(groups__in=pk_set)
+    else:
+        users = User.objects.filter(groups__permissions=instance)
+    invalidate_principals(users.values_list("pk", flat=True).distinct())
+
+
+def connect_signals():
+    # Each user model sends its own signals
+    for user_model in (User, EsaniUser, BranchUser, CompanyUser, KioskUser):
+        post_save.connect(_invalidate_user, sender=user_model)
+        post_delete.connect(_invalidate_user, sender=user_model)
+    # Group names are used by `User.is_admin` and `User.is_esani_admin`
+    post_save.connect(_invalidate_group, sender=Group)
+    pre_delete.connect(_invalidate_group, sender=Group)
+    for branch_model in (CompanyBranch, Kiosk):
+        post_save.connect(_invalidate_branch, sender=branch_model)
+    post_save.connect(_invalidate_company, sender=Company)
+    m2m_changed.connect(_invalidate_user_m2m, sender=User.groups.through)
+    m2m_changed.connect(_invalidate_user_m2m, sender=User.user_permissions.through)
+    m2m_changed.connect(_invalidate_group_permissions, sender=Group.permissions.through)
@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Cache of reference data, i.e. rarely changed lookup tables such as cities and QR bag
+statuses, which are read when rendering most filter forms.
+
+All reference data is cached in the same namespace, which is invalidated whenever any
+of it is changed.
+"""
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from project.cache import bump_namespace_version, get_or_set_versioned
+
+from esani_pantportal.models import City, QRStatus
+
+REFERENCE_DATA_NAMESPACE = "reference_data"
+
+
+def get_city_names() -> list[str]:
+    return get_or_set_versioned(
+        REFERENCE_DATA_NAMESPACE,
+        "city_names",
+        lambda: list(City.objects.order_by("name").values_list("name", flat=True)),
+        settings.REFERENCE_DATA_CACHE_TIMEOUT,
+    )
+
+
+def get_qr_status_names() -> dict[str, str]:
+    """Return the Danish name of each QR bag status, by status code"""
+    return get_or_set_versioned(
+        REFERENCE_DATA_NAMESPACE,
+        "qr_status_names",
+        lambda: dict(QRStatus.objects.values_list("code", "name_da")),
+        settings.REFERENCE_DATA_CACHE_TIMEOUT,
+    )
+
+
+def _invalidate_reference_data(sender, **kwargs):
+    bump_namespace_version(REFERENCE_DATA_NAMESPACE)
+
+
+def connect_signals():
+    for model in (City, QRStatus):
+        post_save.connect(_invalidate_reference_data, sender=model)
+        post_delete.connect(_invalidate_reference_data, sender=model)
@@ -1,14 +1,18 @@
 # SPDX-FileCopyrightText: 2023 Magenta ApS <info@magenta.dk>
 #
 # SPDX-License-Identifier: MPL-2.0
+from functools import cache
 from urllib.parse import quote
 
 from django.conf import settings
 from django.core.exceptions import FieldDoesNotExist
-from django.db.models import BooleanField
+from django.db.models import BooleanField, Field
 from django.template.defaultfilters import register, yesno
+from django.utils.translation import get_language
 from django.utils.translation import gettext_lazy as _
+from project.cache import get_namespace_versions
 
+from esani_pantportal.backends import PERMISSIONS_NAMESPACE
 from esani_pantportal.models import (
     BRANCH_TYPE_CHOICES,
     COMPANY_TYPE_CHOICES,
@@ -17,6 +21,7 @@ from esani_pantportal.models import (
     PRODUCT_SHAPE_CHOICES,
     USER_TYPE_CHOICES,
 )
+from esani_pantportal.reference_data import REFERENCE_DATA_NAMESPACE
 from esani_pantportal.util import add_parameters_to_url
 
 
@@ -43,6 +48,16 @@ def quote_url(url):
     return quote(url)
 
 
+@cache
+def _get_annotation_fields(model) -> dict[str, Field]:
+    # Building the queryset of the default manager is expensive, and its annotations
+    # do not change
+    query = model._meta.default_manager.get_queryset().query
+    return {
+        name: annotation.output_field for name, annotation in query.annotations.items()
+    }
+
+
 @register.filter
 def get_display_name(obj, attr):
     """
@@ -59,9 +74,7 @@ def get_display_name(obj, attr):
         except FieldDoesNotExist:
             try:
                 # Look for field in annotations
-                query = obj._meta.default_manager.get_queryset().query
-                annotation = query.annotations[attr]
-                field = annotation.output_field
+                field = _get_annotation_fields(type(obj))[attr]
             except (AttributeError, KeyError):
                 pass
         if isinstance(field, BooleanField):
@@ -129,7 +142,44 @@ def truefalse(boolean):
 
 @register.filter
 def has_two_factor(user):
-    return user.totpdevice_set.count() > 0
+    return user.totpdevice_set.exists()
+
+
+@register.filter
+def column_visibility(columns):
+    """
+    Returns a string identifying which of the given columns are shown, to vary cached
+    template fragments on
+    """
+    return "".join("0" if show is False else "1" for _, _, show in columns)
+
+
+@register.simple_tag(takes_context=True)
+def fragment_cache_key(context, scope="user"):
+    """
+    Returns a key to vary cached template fragments on, e.g.
+    `{% fragment_cache_key "role" as key %}{% cache 3600 name key %}`
+
+    If `scope` is "user", the fragment is cached for each user. If `scope` is "role",
+    the fragment is shared by all users of the same type and admin status.
+    The key changes with the language, and whenever permissions or reference data
+    are changed.
+    """
+    user = context["user"]
+    if scope == "role":
+        owner = f"{user.user_type}-{user.is_admin:d}-{user.is_esani_admin:d}"
+    else:
+        owner = str(user.pk)
+    versions = get_namespace_versions([PERMISSIONS_NAMESPACE, REFERENCE_DATA_NAMESPACE])
+    return ":".join(
+        [
+            scope,
+            owner,
+            get_language(),
+            versions[PERMISSIONS_NAMESPACE],
+            versions[REFERENCE_DATA_NAMESPACE],
+        ]
+    )
 
 
 @register.filter
@@ -5,11 +5,14 @@ import json
 from time import sleep
 from unittest.mock import patch
 
+from django.conf import settings
+from django.db import IntegrityError
 from django.test import TestCase
 
 from esani_pantportal.models import Product
 
 from ..models import CompanyBranch, Kiosk, QRBag, QRStatus
+from ..principals import get_principal
 from .conftest import LoginMixin
 
 
@@ -270,6 +273,35 @@ class QRBagTest(LoginMixin, TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    @patch("esani_pantportal.models.QRCodeGenerator.qr_code_exists", mock_qr_exists)
+    def test_update_returns_new_history_date(self):
+        code = "00000000005001d200"
+        response = self.client.patch(
+            f"/api/qrbag/{code}",
+            data=json.dumps({"status": "oprettet"}),
+            content_type="application/json",
+            headers=self.headers,
+        )
+        created = response.json()["updated"]
+
+        response = self.client.patch(
+            f"/api/qrbag/{code}",
+            data=json.dumps({"status": "i brug"}),
+            content_type="application/json",
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        updated = response.json()["updated"]
+        self.assertGreater(updated, created)
+        item = QRBag.objects.get(qr=code)
+        self.assertEqual(
+            updated,
+            self.client.get(f"/api/qrbag/{code}", headers=self.headers).json()[
+                "updated"
+            ],
+        )
+        self.assertEqual(item.history.count(), 2)
+
     def test_history(self):
         code = "00000000005001d201"
 
@@ -394,6 +426,157 @@ class QRBagTest(LoginMixin, TestCase):
         self.assertEqual(h3["status"], "afsluttet")
         self.assertEqual(h3["owner"], self.user.username)
 
+    def _batch_update(self, items: list[dict]):
+        return self.client.patch(
+            "/api/qrbag/batch/upsert",
+            data=json.dumps({"items": items}),
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    def _batch_get(self, qrs: list[str]):
+        return self.client.post(
+            "/api/qrbag/batch/lookup",
+            data=json.dumps({"qrs": qrs}),
+            content_type="application/json",
+            headers=self.headers,
+        )
+
+    @patch(
+        "esani_pantportal.models.QRCodeGenerator.qr_code_exists",
+        lambda qr: qr != "invalid",
+    )
+    def test_batch_update(self):
+        # Arrange
+        QRBag.objects.create(qr="changed", owner=self.user, status="oprettet")
+        QRBag.objects.create(qr="new owner", owner=None, status="oprettet")
+        QRBag.objects.create(qr="unchanged", owner=self.user, status="oprettet")
+        # Arrange: the user was cached by an earlier request
+        get_principal(self.user.pk)
+        # Act
+        with self.assertNumQueries(8):
+            response = self._batch_update(
+                [
+                    {"qr": "created", "status": "oprettet"},
+                    {"qr": "changed", "status": "i brug", "active": False},
+                    {"qr": "new owner", "status": "oprettet"},
+                    {"qr": "unchanged", "status": "oprettet"},
+                    {"qr": "invalid", "status": "oprettet"},
+                    {"qr": "no status"},
+                    {"qr": "created", "status": "i brug"},
+                ]
+            )
+        # Assert: each item has the result a single update would have had
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()["results"]
+        self.assertEqual(
+            [(result["qr"], result["status_code"]) for result in results],
+            [
+                ("created", 201),
+                ("changed", 200),
+                ("new owner", 200),
+                ("unchanged", 204),
+                ("invalid", 400),
+                ("no status", 400),
+                ("created", 400),
+            ],
+        )
+        self.assertEqual(results[0]["item"]["owner"], self.user.username)
+        self.assertIsNotNone(results[0]["item"]["updated"])
+        self.assertEqual(results[1]["item"]["updated"], results[0]["item"]["updated"])
+        self.assertEqual(results[1]["item"]["status"], "i brug")
+        self.assertIsNone(results[4]["item"])
+        self.assertEqual(results[4]["error"], "invalid QR code invalid")
+        # Assert: the changes are saved, with history
+        created = QRBag.objects.get(qr="created")
+        self.assertEqual(created.status, "oprettet")
+        self.assertEqual(created.company_branch, self.user.branch)
+        self.assertEqual(created.history.get().history_user, self.user.user_ptr)
+        changed = QRBag.objects.get(qr="changed")
+        self.assertEqual((changed.status, changed.active), ("i brug", False))
+        self.assertEqual(changed.owner, self.user.user_ptr)
+        self.assertEqual(changed.history.count(), 2)
+        self.assertEqual(QRBag.objects.get(qr="unchanged").history.count(), 1)
+        self.assertFalse(QRBag.objects.filter(qr__in=["invalid", "no status"]))
+
+    @patch("esani_pantportal.models.QRCodeGenerator.qr_code_exists", mock_qr_exists)
+    def test_batch_update_is_atomic(self):
+        # Arrange
+        QRBag.objects.create(qr="existing", owner=self.user, status="oprettet")
+        # Act
+        with patch(
+            "esani_pantportal.api.bulk_create_with_history", side_effect=IntegrityError
+        ):
+            response = self._batch_update(
+                [
+                    {"qr": "existing", "status": "i brug"},
+                    {"qr": "created", "status": "oprettet"},
+                ]
+            )
+        # Assert
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(QRBag.objects.get(qr="existing").status, "oprettet")
+
+    def test_batch_update_limits_number_of_items(self):
+        # Act
+        response = self._batch_update(
+            [{"qr": str(i)} for i in range(settings.QR_BAG_BATCH_SIZE + 1)]
+        )
+        # Assert
+        self.assertEqual(response.status_code, 422)
+
+    def test_batch_requires_authentication(self):
+        # Arrange
+        del self.headers["Authorization"]
+        # Act
+        update_response = self._batch_update([{"qr": "1234", "status": "oprettet"}])
+        get_response = self._batch_get(["1234"])
+        # Assert
+        self.assertEqual(update_response.status_code, 401)
+        self.assertEqual(get_response.status_code, 401)
+
+    def test_batch_get(self):
+        # Arrange
+        bag = QRBag.objects.create(qr="1234", owner=self.user, status="oprettet")
+        get_principal(self.user.pk)
+        # Act
+        with self.assertNumQueries(2):
+            response = self._batch_get(["1234", "5678"])
+        # Assert
+        self.assertEqual(response.status_code, 200, response.content)
+        first, second = response.json()["results"]
+        self.assertEqual(first["status_code"], 200)
+        self.assertEqual(first["item"]["status"], "oprettet")
+        self.assertEqual(
+            first["item"]["updated"],
+            bag.history.get().history_date.isoformat(),
+        )
+        self.assertEqual(second["status_code"], 404)
+        self.assertIsNone(second["item"])
+
+    def test_get_and_history_use_fixed_number_of_queries(self):
+        # Arrange
+        bag = QRBag.objects.create(qr="1234", owner=self.user, status="oprettet")
+        for status in ("i brug", "afsluttet"):
+            bag.status = status
+            bag.save()
+        get_principal(self.user.pk)
+        # Act
+        with self.assertNumQueries(2):
+            get_response = self.client.get(f"/api/qrbag/{bag.qr}", headers=self.headers)
+        with self.assertNumQueries(4):
+            history_response = self.client.get(
+                f"/api/qrbag/{bag.qr}/history?limit=2", headers=self.headers
+            )
+        # Assert
+        self.assertEqual(get_response.json()["status"], "afsluttet")
+        self.assertIsNotNone(get_response.json()["updated"])
+        history = history_response.json()
+        self.assertEqual(history["count"], 3)
+        self.assertEqual(
+            [item["status"] for item in history["items"]], ["oprettet", "i brug"]
+        )
+
     def test_qr_bag_response_allows_empty_company(self):
         # Arrange
         owner = self.login()
@@ -0,0 +1,202 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from unittest_parametrize import ParametrizedTestCase, parametrize
+
+from esani_pantportal.backends import (
+    PERMISSIONS_VERSION_KEY,
+    ProfileModelBackend,
+    _get_permissions_key,
+    get_user_with_profile,
+)
+from esani_pantportal.models import BranchUser, CompanyUser, EsaniUser, KioskUser
+from esani_pantportal.tests.conftest import LoginMixin
+
+
+class GetUserWithProfileTest(LoginMixin, ParametrizedTestCase, TestCase):
+    @parametrize(
+        "group,profile_class,is_admin,is_esani_admin",
+        [
+            ("EsaniAdmins", EsaniUser, True, True),
+            ("BranchAdmins", BranchUser, True, False),
+            ("BranchUsers", BranchUser, False, False),
+            ("CompanyUsers", CompanyUser, False, False),
+            ("KioskAdmins", KioskUser, True, False),
+        ],
+    )
+    def test_get_user_with_profile(
+        self, group, profile_class, is_admin, is_esani_admin
+    ):
+        # Arrange
+        expected = self.login(group)
+        # Act: the user is loaded by a single query
+        with self.assertNumQueries(1):
+            user = get_user_with_profile(expected.pk)
+            user_profile = user.user_profile
+            branch = user.branch
+            company = user.company
+            company_name = getattr(company, "name", None)
+        # Assert
+        self.assertIsInstance(user_profile, profile_class)
+        self.assertEqual(branch, expected.branch)
+        self.assertEqual(company, expected.company)
+        self.assertEqual(company_name, getattr(expected.company, "name", None))
+        self.assertEqual(user.is_admin, is_admin)
+        self.assertEqual(user.is_esani_admin, is_esani_admin)
+
+    def test_get_user_with_profile_returns_none_for_unknown_user(self):
+        self.assertIsNone(get_user_with_profile(-1))
+
+
+class ProfileModelBackendTest(LoginMixin, TestCase):
+    def test_get_user(self):
+        # Arrange
+        expected = self.login("BranchUsers")
+        # Act
+        user = ProfileModelBackend().get_user(expected.pk)
+        # Assert
+        self.assertEqual(user.pk, expected.pk)
+        self.assertEqual(user.branch, expected.branch)
+
+    def test_get_user_returns_none_for_inactive_user(self):
+        # Arrange
+        user = self.login("BranchUsers")
+        user.is_active = False
+        user.save()
+        # Act and assert
+        self.assertIsNone(ProfileModelBackend().get_user(user.pk))
+
+    def test_portal_request_loads_user_with_profile(self):
+        # Arrange
+        self.login("BranchUsers")
+        # Act
+        response = self.client.get("/")
+        # Assert: the user was loaded by `get_user_with_profile`
+        self.assertTrue(hasattr(response.wsgi_request.user, "group_names"))
+
+
+class PermissionCacheTest(LoginMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login("BranchUsers")
+        self.group = Group.objects.get(name="BranchUsers")
+        self.permission = Permission.objects.get(codename="delete_qrbag")
+
+    def _get_all_permissions(self) -> set[str]:
+        # A new instance of the user has no permissions cached on itself
+        return get_user_with_profile(self.user.pk).get_all_permissions()
+
+    def _is_cached(self) -> bool:
+        return cache.get(_get_permissions_key(self.user.pk)) is not None
+
+    def test_permissions_are_cached(self):
+        # Arrange
+        expected = self._get_all_permissions()
+        user = get_user_with_profile(self.user.pk)
+        # Act: the permissions are read by a single cache lookup
+        with self.assertNumQueries(1):
+            permissions = user.get_all_permissions()
+            can_change = user.has_perm("esani_pantportal.change_qrbag")
+            can_delete = user.has_perm("esani_pantportal.delete_qrbag")
+        # Assert
+        self.assertEqual(permissions, expected)
+        self.assertIn("esani_pantportal.change_qrbag", permissions)
+        self.assertTrue(can_change)
+        self.assertFalse(can_delete)
+
+    def test_permissions_are_not_cached_for_objects_or_inactive_users(self):
+        # Arrange
+        user = get_user_with_profile(self.user.pk)
+        user.is_active = False
+        # Act
+        object_permissions = self.user.get_all_permissions(obj=self.user)
+        permissions = user.get_all_permissions()
+        # Assert
+        self.assertEqual(object_permissions, set())
+        self.assertEqual(permissions, set())
+        self.assertFalse(self._is_cached())
+
+    def test_missing_version_is_replaced(self):
+        # Arrange
+        self._get_all_permissions()
+        version = cache.get(PERMISSIONS_VERSION_KEY)
+        cache.delete(PERMISSIONS_VERSION_KEY)
+        # Act
+        self._get_all_permissions()
+        # Assert
+        self.assertNotIn(cache.get(PERMISSIONS_VERSION_KEY), (None, version))
+
+    def test_group_permission_change_invalidates_permissions(self):
+        for change, expected in (
+            (lambda: self.group.permissions.add(self.permission), True),
+            (lambda: self.permission.group_set.remove(self.group), False),
+            (lambda: self.permission.group_set.add(self.group), True),
+            (lambda: self.group.permissions.clear(), False),
+        ):
+            # Arrange
+            self._get_all_permissions()
+            # Act
+            change()
+            # Assert
+            self.assertEqual(
+                "esani_pantportal.delete_qrbag" in self._get_all_permissions(),
+                expected,
+            )
+
+    def test_user_change_invalidates_permissions(self):
+        for change in (
+            lambda: self.user.user_permissions.add(self.permission),
+            lambda: self.permission.user_set.remove(self.user),
+            lambda: self.user.groups.clear(),
+            lambda: self.group.user_set.add(self.user),
+            lambda: self.user.save(),
+        ):
+            # Arrange
+            self._get_all_permissions()
+            # Act
+            change()
+            # Assert
+            self.assertFalse(self._is_cached())
+
+    def test_removing_from_all_users_invalidates_permissions(self):
+        for change in (
+            lambda: self.group.user_set.clear(),
+            lambda: self.permission.user_set.clear(),
+            lambda: Group.objects.filter(pk=self.group.pk).delete(),
+        ):
+            # Arrange
+            self._get_all_permissions()
+            version = cache.get(PERMISSIONS_VERSION_KEY)
+            # Act
+            change()
+            # Assert
+            self.assertNotEqual(cache.get(PERMISSIONS_VERSION_KEY), version)
+        self.assertEqual(self._get_all_permissions(), set())
+
+    def test_create_groups_invalidates_permissions(self):
+        # Arrange
+        self._get_all_permissions()
+        version = cache.get(PERMISSIONS_VERSION_KEY)
+        # Act
+        call_command("create_groups")
+        # Assert
+        self.assertNotEqual(cache.get(PERMISSIONS_VERSION_KEY), version)
+
+    def test_portal_request_reads_cached_permissions(self):
+        # Arrange
+        self.client.get(reverse("pant:qrbag_list"))
+        # Act
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("pant:qrbag_list"))
+        # Assert: no permissions are read from the database
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any("auth_permission" in query["sql"] for query in queries.captured_queries)
+        )
@@ -0,0 +1,58 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase
+
+from esani_pantportal.management.commands.benchmark_tomra_decoding import (
+    DEFAULT_PAYLOAD,
+    Command,
+)
+
+
+class TestBenchmarkTomraDecoding(SimpleTestCase):
+    def test_benchmark(self):
+        # Arrange
+        buf = StringIO()
+        # Act
+        call_command(Command(), stdout=buf, sessions=10, rounds=1)
+        # Assert
+        self.assertIn("Decoding 10 consumer sessions", buf.getvalue())
+        self.assertIn("sessions/s", buf.getvalue())
+        self.assertIn("Speedup", buf.getvalue())
+
+    def test_projection_decodes_same_values_as_full_models(self):
+        # Arrange
+        instance = Command()
+        content = instance._get_page(DEFAULT_PAYLOAD, 4)
+        # Act
+        full = instance._decode_full(content)
+        projected = instance._decode_projected(content)
+        # Assert
+        for full_datum, datum in zip(full.data, projected.data):
+            expected = full_datum.consumer_session
+            actual = datum.consumer_session
+            self.assertEqual(actual.id, expected.id)
+            self.assertEqual(actual.started_at, expected.started_at)
+            self.assertEqual(actual.identity, expected.identity)
+            self.assertEqual(actual.metadata, expected.metadata)
+            self.assertEqual(
+                [(item.product_code, item.count) for item in actual.items],
+                [
+                    (getattr(item, "product_code", None), item.count)
+                    for item in expected.items
+                ],
+            )
+
+    def test_benchmark_raises_on_empty_payload(self):
+        with TemporaryDirectory() as path:
+            payload = os.path.join(path, "empty.json")
+            with open(payload, "w") as f:
+                f.write('{"data": []}')
+            with self.assertRaises(CommandError):
+                call_command(Command(), stdout=StringIO(), payload=payload)
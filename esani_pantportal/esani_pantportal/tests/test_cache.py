@@ -0,0 +1,232 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from unittest.mock import patch
+
+from django.core.cache import cache, caches
+from django.test import TestCase
+from project.cache import (
+    TwoTierCache,
+    bump_namespace_version,
+    get_namespace_version,
+    get_namespace_versions,
+    get_or_set_versioned,
+    get_version_key,
+    make_namespaced_key,
+)
+from prometheus_client import REGISTRY
+
+
+class TwoTierCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = self._get_cache()
+        self.cache.clear_local()
+        self.addCleanup(self.cache.clear_local)
+        self.shared = caches["shared"]
+
+    def _get_cache(self, location="test", **options) -> TwoTierCache:
+        return TwoTierCache(
+            location,
+            {"OPTIONS": {"SHARED_CACHE": "shared", "LOCAL_TIMEOUT": 5, **options}},
+        )
+
+    def _get_count(self, tier: str, result: str) -> float:
+        return (
+            REGISTRY.get_sample_value(
+                "pantportal_cache_requests_total",
+                {"cache": "test", "tier": tier, "result": result},
+            )
+            or 0
+        )
+
+    def test_get_reads_local_tier(self):
+        # Arrange
+        self.shared.set("key", {"value": 1})
+        local_hits = self._get_count("local", "hit")
+        shared_hits = self._get_count("shared", "hit")
+        # Act: the value is read from the shared tier once
+        first = self.cache.get("key")
+        with self.assertNumQueries(0):
+            second = self.cache.get("key")
+        # Assert
+        self.assertEqual(first, {"value": 1})
+        self.assertEqual(second, {"value": 1})
+        self.assertEqual(self._get_count("local", "hit"), local_hits + 1)
+        self.assertEqual(self._get_count("shared", "hit"), shared_hits + 1)
+
+    def test_get_returns_default_for_missing_keys(self):
+        # Arrange
+        shared_misses = self._get_count("shared", "miss")
+        # Act and assert
+        self.assertEqual(self.cache.get("missing", "default"), "default")
+        self.assertEqual(self._get_count("shared", "miss"), shared_misses + 1)
+
+    def test_get_returns_copies(self):
+        # Arrange
+        self.cache.set("key", {"value": 1})
+        # Act
+        self.cache.get("key")["value"] = 2
+        # Assert
+        self.assertEqual(self.cache.get("key"), {"value": 1})
+
+    def test_set_writes_both_tiers(self):
+        # Act
+        self.cache.set("key", "value")
+        # Assert
+        self.assertEqual(self.shared.get("key"), "value")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.cache.get("key"), "value")
+            self.assertTrue(self.cache.has_key("key"))
+
+    def test_local_entries_expire(self):
+        # Arrange
+        with patch("project.cache.time.monotonic", return_value=100):
+            self.cache.set("key", "value", timeout=2)
+            self.cache.set("other", "value", timeout=None)
+        self.shared.set("key", "changed")
+        self.shared.set("other", "changed")
+        # Act
+        with patch("project.cache.time.monotonic", return_value=103):
+            key = self.cache.get("key")
+            other = self.cache.get("other")
+        with patch("project.cache.time.monotonic", return_value=106):
+            other_later = self.cache.get("other")
+        # Assert: the timeout of the local tier is bounded by `LOCAL_TIMEOUT`
+        self.assertEqual(key, "changed")
+        self.assertEqual(other, "value")
+        self.assertEqual(other_later, "changed")
+
+    def test_local_tier_is_bounded(self):
+        # Arrange
+        cache = self._get_cache("bounded", MAX_ENTRIES=2)
+        cache.clear_local()
+        cache.set_many({"a": 1, "b": 2})
+        cache.get("a")
+        # Act: "b" is the least recently used key
+        cache.set("c", 3)
+        # Assert
+        self.assertEqual(list(cache._local._data), [":1:a", ":1:c"])
+
+    def test_local_tier_can_be_disabled(self):
+        # Arrange
+        cache = self._get_cache("disabled", LOCAL_TIMEOUT=0)
+        # Act
+        cache.set("key", "value")
+        # Assert
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.get("key"), "value")
+
+    def test_get_many(self):
+        # Arrange
+        self.cache.set("local", 1)
+        self.shared.set("shared", 2)
+        # Act
+        with self.assertNumQueries(1):
+            values = self.cache.get_many(["local", "shared", "missing"])
+        with self.assertNumQueries(0):
+            local_values = self.cache.get_many(["local", "shared"])
+        # Assert
+        self.assertEqual(values, {"local": 1, "shared": 2})
+        self.assertEqual(local_values, values)
+
+    def test_add(self):
+        # Arrange
+        self.shared.set("existing", "shared")
+        self.cache._set_local("existing", "local")
+        # Act
+        added = self.cache.add("new", "value")
+        not_added = self.cache.add("existing", "value")
+        # Assert
+        self.assertTrue(added)
+        self.assertFalse(not_added)
+        self.assertEqual(self.cache.get("new"), "value")
+        self.assertEqual(self.cache.get("existing"), "shared")
+
+    def test_set_many_skips_failed_keys(self):
+        # Arrange
+        self.cache.set("failed", "old")
+        # Act
+        with patch.object(self.shared, "set_many", return_value=["failed"]):
+            self.cache.set_many({"key": "value", "failed": "value"})
+        # Assert
+        self.assertEqual(self.cache.get("key"), "value")
+        self.assertEqual(self.cache.get("failed"), "old")
+
+    def test_changes_are_written_to_both_tiers(self):
+        # Arrange
+        self.cache.set_many({"a": 1, "b": 2, "c": 3, "d": 4})
+        # Act
+        self.cache.incr("a")
+        self.cache.delete("b")
+        self.cache.delete_many(["c"])
+        touched = self.cache.touch("d", None)
+        # Assert
+        self.assertEqual(self.cache.get_many(["a", "b", "c", "d"]), {"a": 2, "d": 4})
+        self.assertTrue(touched)
+        self.assertFalse(self.cache.has_key("b"))
+
+    def test_version_keys_are_not_held_locally(self):
+        # Arrange
+        key = get_version_key("test")
+        self.cache.set(key, "old")
+        self.cache.get_many([key])
+        local_misses = self._get_count("local", "miss")
+        # Act: the version is changed by another process
+        self.shared.set(key, "new")
+        # Assert
+        self.assertEqual(self.cache.get(key), "new")
+        self.assertEqual(self.cache.get_many([key]), {key: "new"})
+        self.assertTrue(self.cache.has_key(key))
+        self.assertEqual(self._get_count("local", "miss"), local_misses)
+
+    def test_clear(self):
+        # Arrange
+        self.cache.set("key", "value")
+        # Act
+        self.cache.clear()
+        # Assert
+        self.assertIsNone(self.shared.get("key"))
+        self.assertIsNone(self.cache.get("key"))
+
+
+class NamespaceTest(TestCase):
+    def test_make_namespaced_key(self):
+        # Arrange
+        key = make_namespaced_key("test", "key")
+        cache.set(key, "value")
+        # Act
+        bump_namespace_version("test")
+        # Assert
+        self.assertNotEqual(make_namespaced_key("test", "key"), key)
+        self.assertIsNone(cache.get(make_namespaced_key("test", "key")))
+
+    def test_missing_version_is_replaced(self):
+        # Arrange
+        version = get_namespace_version("test")
+        cache.delete(get_version_key("test"))
+        # Act and assert
+        self.assertNotIn(get_namespace_version("test"), (None, version))
+
+    def test_get_namespace_versions(self):
+        # Arrange
+        get_namespace_versions(["a", "b"])
+        # Act: the versions are read by a single query
+        with self.assertNumQueries(1):
+            versions = get_namespace_versions(["a", "b"])
+        # Assert
+        self.assertEqual(versions["a"], get_namespace_version("a"))
+        self.assertEqual(versions["b"], get_namespace_version("b"))
+        self.assertNotEqual(versions["a"], versions["b"])
+
+    def test_get_or_set_versioned(self):
+        # Arrange
+        values = iter([1, 2])
+        first = get_or_set_versioned("test", "key", lambda: next(values))
+        # Act: the value is read by a single query
+        with self.assertNumQueries(1):
+            second = get_or_set_versioned("test", "key", lambda: next(values))
+        bump_namespace_version("test")
+        third = get_or_set_versioned("test", "key", lambda: next(values))
+        # Assert
+        self.assertEqual([first, second, third], [1, 1, 2])
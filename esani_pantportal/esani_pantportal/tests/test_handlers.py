@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase
+from ninja_jwt.tokens import AccessToken
+from project.handlers import RoutingWSGIHandler, get_wsgi_application
+
+from esani_pantportal.management.commands.benchmark_middleware import Command
+from esani_pantportal.models import QRBag
+from esani_pantportal.tests.conftest import LoginMixin
+
+
+class RoutingWSGIHandlerTest(LoginMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.handler = RoutingWSGIHandler()
+
+    def test_lean_paths_skip_portal_middleware(self):
+        # Arrange
+        request = RequestFactory().get("/metrics/health/database")
+        # Act
+        response = self.handler.get_response(request)
+        # Assert: there is no session, and the user is anonymous
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(request, "session"))
+        self.assertFalse(request.user.is_authenticated)
+
+    def test_other_paths_use_portal_middleware(self):
+        # Arrange
+        request = RequestFactory().get("/")
+        # Act
+        self.handler.get_response(request)
+        # Assert
+        self.assertTrue(hasattr(request, "session"))
+
+    def test_api_records_history_user(self):
+        # Arrange
+        user = self.login("BranchUsers")
+        qr_bag = QRBag.objects.create(qr="00000000005001d200", status="oprettet")
+        token = AccessToken.for_user(user)
+        request = RequestFactory().patch(
+            f"/api/qrbag/{qr_bag.qr}",
+            data={"status": "i brug"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+        # Act
+        response = self.handler.get_response(request)
+        # Assert
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(qr_bag.history.latest().history_user.pk, user.pk)
+
+    def test_get_wsgi_application(self):
+        self.assertIsInstance(get_wsgi_application(), RoutingWSGIHandler)
+
+    def test_middleware_is_not_repeated(self):
+        self.assertEqual(len(settings.MIDDLEWARE), len(set(settings.MIDDLEWARE)))
+
+
+class BenchmarkMiddlewareTest(TestCase):
+    def test_benchmark(self):
+        # Arrange
+        buf = StringIO()
+        # Act
+        call_command(Command(), stdout=buf, host="testserver", requests=5, rounds=1)
+        # Assert
+        self.assertIn("Full middleware", buf.getvalue())
+        self.assertIn("Lean middleware", buf.getvalue())
+        self.assertIn("Saved", buf.getvalue())
+
+    def test_benchmark_raises_on_failed_requests(self):
+        with self.assertRaises(CommandError):
+            call_command(Command(), stdout=StringIO(), path="/metrics/unknown")
@@ -8,25 +8,27 @@ from unittest.mock import Mock, patch
 
 from django.conf import settings
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.models import Count
 from django.test import TestCase
 from django.utils import timezone
 from unittest_parametrize import ParametrizedTestCase, parametrize
 
 from esani_pantportal.clients.tomra.api import ConsumerSessionCollection, TomraAPI
-from esani_pantportal.clients.tomra.data_models import (
-    ConsumerSession,
-    Datum,
-    Identity,
-    Item1,
-    Location,
-    Metadata,
-    Rvm,
+from esani_pantportal.clients.tomra.data_models import Identity, Location, Metadata, Rvm
+from esani_pantportal.clients.tomra.projections import (
+    ConsumerSessionProjection,
+    DatumProjection,
+    ItemProjection,
+)
+from esani_pantportal.management.commands.import_deposit_payouts_qrbag import (
+    Command,
+    ResolvedSource,
 )
-from esani_pantportal.management.commands.import_deposit_payouts_qrbag import Command
 from esani_pantportal.models import (
     Company,
     CompanyBranch,
+    ConsumerSessionCheckpoint,
     DepositPayout,
     DepositPayoutItem,
     Kiosk,
@@ -56,8 +58,6 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
     consumer_session_id = uuid.uuid4()
     consumer_session_id_unknown = uuid.uuid4()
     started_at = datetime(2020, 1, 1, 12, 0, tzinfo=timezone.get_current_timezone())
-    item1_type = "single"
-    item1_refund = 0
 
     _mock_api_path = (
         "esani_pantportal.management.commands.import_deposit_payouts_qrbag."
@@ -183,18 +183,270 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                 to_date="2020-01-31",
             )
             # Assert
-            mock_api.get_consumer_sessions.assert_called_once_with(
+            mock_api.get_consumer_session_pages.assert_called_once_with(
                 datetime(2020, 1, 1),
                 datetime(2020, 1, 31),
+                next=None,
             )
 
+    def test_handle_saves_checkpoint_after_each_page(self):
+        # Arrange: the API fails after the first page
+        def pages(*args, **kwargs):
+            yield self._get_page(self._get_datum(), next="page2")
+            raise ConnectionError()
+
+        mock_api = Mock(spec=TomraAPI)
+        mock_api.get_consumer_session_pages = Mock(side_effect=pages)
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            with self.assertRaises(ConnectionError):
+                call_command(
+                    Command(),
+                    stdout=StringIO(),
+                    from_date="2020-01-01",
+                    to_date="2020-01-31",
+                )
+        # Assert: the first page is imported, and the checkpoint points to the second
+        self.assertEqual(
+            DepositPayoutItem.objects.filter(
+                consumer_session_id=self.consumer_session_id
+            ).count(),
+            1,
+        )
+        self.assertQuerySetEqual(
+            ConsumerSessionCheckpoint.objects.all(),
+            [(date(2020, 1, 1), date(2020, 1, 31), "page2", 1)],
+            transform=lambda obj: (
+                obj.from_date,
+                obj.to_date,
+                obj.next,
+                obj.page_count,
+            ),
+        )
+
+    def test_handle_resumes_from_checkpoint(self):
+        # Arrange
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 1),
+            to_date=date(2020, 1, 31),
+            next="page2",
+            page_count=1,
+        )
+        mock_api = self._get_mock_api(
+            pages=[
+                self._get_page(self._get_datum(), next="page3"),
+                self._get_page(next=None),
+            ]
+        )
+        with patch(self._mock_api_path, return_value=mock_api):
+            buf = StringIO()
+            # Act: resume without giving any dates
+            call_command(Command(), stdout=buf)
+            # Assert: the remaining pages of the checkpoint's period are imported
+            mock_api.get_consumer_session_pages.assert_called_once_with(
+                datetime(2020, 1, 1),
+                datetime(2020, 1, 31),
+                next="page2",
+            )
+            self.assertIn(
+                "Resuming after 1 previously imported page(s)", buf.getvalue()
+            )
+            self.assertTrue(
+                DepositPayoutItem.objects.filter(
+                    consumer_session_id=self.consumer_session_id
+                ).exists()
+            )
+            # Assert: the checkpoint is deleted after the last page
+            self.assertFalse(ConsumerSessionCheckpoint.objects.exists())
+
+    def test_handle_resumes_from_checkpoint_matching_dates(self):
+        # Arrange
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 1), to_date=date(2020, 1, 31), next="page2"
+        )
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 2, 1), to_date=date(2020, 2, 29), next="other"
+        )
+        mock_api = self._get_mock_api()
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            call_command(
+                Command(),
+                stdout=StringIO(),
+                from_date="2020-01-01",
+                to_date="2020-01-31",
+            )
+            # Assert
+            mock_api.get_consumer_session_pages.assert_called_once_with(
+                datetime(2020, 1, 1),
+                datetime(2020, 1, 31),
+                next="page2",
+            )
+            self.assertQuerySetEqual(
+                ConsumerSessionCheckpoint.objects.values_list("next", flat=True),
+                ["other"],
+            )
+
+    def test_handle_retrieves_days_concurrently(self):
+        # Arrange: the second day fails
+        def shards(after, before, shard_size, max_workers):
+            yield self._get_page(
+                self._get_datum(), from_date=after, to_date=after + shard_size
+            )
+            raise ConnectionError()
+
+        mock_api = Mock(spec=TomraAPI)
+        mock_api.get_consumer_session_shards = Mock(side_effect=shards)
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            with self.assertRaises(ConnectionError):
+                call_command(
+                    Command(),
+                    stdout=StringIO(),
+                    from_date="2020-01-01",
+                    to_date="2020-01-31",
+                    workers=4,
+                )
+        # Assert
+        mock_api.get_consumer_session_shards.assert_called_once_with(
+            datetime(2020, 1, 1),
+            datetime(2020, 1, 31),
+            shard_size=timedelta(days=1),
+            max_workers=4,
+        )
+        # Assert: the first day is imported, and the rest of the period can be resumed
+        self.assertQuerySetEqual(
+            DepositPayout.objects.exclude(source_identifier="ImportTest"),
+            [(date(2020, 1, 1), date(2020, 1, 2))],
+            transform=lambda obj: (obj.from_date, obj.to_date),
+        )
+        self.assertQuerySetEqual(
+            ConsumerSessionCheckpoint.objects.all(),
+            [(date(2020, 1, 2), date(2020, 1, 31), "", 1)],
+            transform=lambda obj: (
+                obj.from_date,
+                obj.to_date,
+                obj.next,
+                obj.page_count,
+            ),
+        )
+
+    def test_handle_advances_checkpoint_after_each_day(self):
+        # Arrange: a checkpoint of the period, and one left behind by an earlier run
+        checkpoint = ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 1), to_date=date(2020, 1, 31), next="", page_count=3
+        )
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 3), to_date=date(2020, 1, 31), next=""
+        )
+
+        # Arrange: the third day fails
+        def shards(after, before, shard_size, max_workers):
+            yield self._get_page(from_date=after, to_date=after + shard_size)
+            yield self._get_page(
+                from_date=after + shard_size, to_date=after + 2 * shard_size
+            )
+            raise ConnectionError()
+
+        mock_api = Mock(spec=TomraAPI)
+        mock_api.get_consumer_session_shards = Mock(side_effect=shards)
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            with self.assertRaises(ConnectionError):
+                call_command(
+                    Command(),
+                    stdout=StringIO(),
+                    from_date="2020-01-01",
+                    to_date="2020-01-31",
+                    workers=4,
+                )
+        # Assert: the checkpoint is moved past the imported days, and counts them
+        self.assertQuerySetEqual(
+            ConsumerSessionCheckpoint.objects.all(),
+            [(checkpoint.pk, date(2020, 1, 3), date(2020, 1, 31), "", 5)],
+            transform=lambda obj: (
+                obj.pk,
+                obj.from_date,
+                obj.to_date,
+                obj.next,
+                obj.page_count,
+            ),
+        )
+
+    def test_handle_imports_all_days(self):
+        # Arrange
+        mock_api = Mock(spec=TomraAPI)
+        mock_api.get_consumer_session_shards = Mock(
+            return_value=[
+                self._get_page(
+                    from_date=datetime(2020, 1, 1), to_date=datetime(2020, 1, 2)
+                ),
+                self._get_page(
+                    self._get_datum(),
+                    from_date=datetime(2020, 1, 2),
+                    to_date=datetime(2020, 1, 3),
+                ),
+            ]
+        )
+        with patch(self._mock_api_path, return_value=mock_api):
+            buf = StringIO()
+            # Act
+            call_command(
+                Command(),
+                stdout=buf,
+                from_date="2020-01-01",
+                to_date="2020-01-03",
+                workers=2,
+            )
+        # Assert
+        self.assertIn("Done.", buf.getvalue())
+        self.assertFalse(ConsumerSessionCheckpoint.objects.exists())
+
+    def test_handle_resumes_empty_continuation_token_from_start(self):
+        # Arrange
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 2), to_date=date(2020, 1, 31), next=""
+        )
+        mock_api = self._get_mock_api()
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            call_command(Command(), stdout=StringIO())
+            # Assert
+            mock_api.get_consumer_session_pages.assert_called_once_with(
+                datetime(2020, 1, 2),
+                datetime(2020, 1, 31),
+                next=None,
+            )
+            self.assertFalse(ConsumerSessionCheckpoint.objects.exists())
+
+    def test_handle_resumes_continuation_token_page_by_page(self):
+        # Arrange
+        ConsumerSessionCheckpoint.objects.create(
+            from_date=date(2020, 1, 1), to_date=date(2020, 1, 31), next="page2"
+        )
+        mock_api = self._get_mock_api()
+        with patch(self._mock_api_path, return_value=mock_api):
+            # Act
+            call_command(Command(), stdout=StringIO(), workers=4)
+            # Assert
+            mock_api.get_consumer_session_shards.assert_not_called()
+            mock_api.get_consumer_session_pages.assert_called_once_with(
+                datetime(2020, 1, 1),
+                datetime(2020, 1, 31),
+                next="page2",
+            )
+
+    def test_handle_raises_on_invalid_workers(self):
+        with self.assertRaises(CommandError):
+            call_command(Command(), workers=0)
+
     def test_import_creates_expected_objects(self):
         # Arrange
         data = [
             # First datum uses a consumer identity matching our QR bag, and contains
             # two items both with a known product barcode.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id,
                     identity=Identity(consumer_identity=self.bag_qr),
                     metadata=Metadata(
@@ -203,25 +455,21 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_2,
                             count=self.product_count_2,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Second datum uses an unknown consumer identity and contains one item with
             # an unknown product barcode.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id,
                     identity=Identity(consumer_identity="unknown_bag_qr"),
                     metadata=Metadata(
@@ -230,19 +478,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code="product_code",
                             count=0,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Third datum uses a 10-digit consumer identity containing an
             # external customer ID.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id,
                     identity=Identity(
                         consumer_identity=self.consumer_identity_ext_id,
@@ -253,19 +499,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Fourth datum uses a consumer identity matching our QR bag, and contains
             # one item, which has no barcode.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id,
                     identity=Identity(consumer_identity=self.bag_qr),
                     metadata=Metadata(
@@ -274,19 +518,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=None,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Fifth datum contains our QR bag ID split across the fields
             # `consumer_identity` and `bag_identity`.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id,
                     identity=Identity(
                         consumer_identity=self.bag_qr[0:10],
@@ -298,25 +540,21 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_2,
                             count=self.product_count_2,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Sixth datum uses a consumer identity matching the QR bag with manually
             # entered deposit payout data.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id_unknown,
                     identity=Identity(consumer_identity=self.bag_qr_manual),
                     metadata=Metadata(
@@ -325,19 +563,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Seventh datum uses a consumer identity matching the QR bag with manually
             # entered deposit payout data which has already been exported.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id_unknown,
                     identity=Identity(consumer_identity=self.bag_qr_manual_exported),
                     metadata=Metadata(
@@ -346,19 +582,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Eighth datum uses a consumer identity matching the QR bag with manually
             # entered deposit payout data.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id_unknown,
                     identity=Identity(consumer_identity=self.bag_qr_manual),
                     metadata=Metadata(
@@ -367,19 +601,17 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
             ),
             # Ninth datum uses a consumer identity matching the QR bag with manually
             # entered deposit payout data which has already been exported.
-            Datum(
-                consumer_session=ConsumerSession(
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
                     id=self.consumer_session_id_unknown,
                     identity=Identity(consumer_identity=self.bag_qr_manual_exported),
                     metadata=Metadata(
@@ -388,11 +620,9 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                     ),
                     started_at=self.started_at,
                     items=[
-                        Item1(
+                        ItemProjection(
                             product_code=self.product_barcode_1,
                             count=self.product_count_1,
-                            type=self.item1_type,
-                            refund=self.item1_refund,
                         ),
                     ],
                 ),
@@ -416,18 +646,49 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
             self.qr_bag.refresh_from_db()
             self.assertEqual(self.qr_bag.status, "esani_optalt")
 
-    def _get_mock_api(self, data=None):
+    def _get_mock_api(self, data=None, pages=None):
         mock_api = Mock(spec=TomraAPI)
-        mock_api.get_consumer_sessions = Mock(
-            return_value=ConsumerSessionCollection(
-                url="url",
-                from_date=datetime(2020, 1, 1),
-                to_date=datetime(2020, 2, 1),
-                data=[] if data is None else data,
+        mock_api.get_consumer_session_pages = Mock(
+            side_effect=lambda *args, **kwargs: iter(
+                pages or [self._get_page(*(data or []))]
             ),
         )
         return mock_api
 
+    def _get_page(
+        self,
+        *data,
+        next=None,
+        from_date=datetime(2020, 1, 1),
+        to_date=datetime(2020, 2, 1),
+    ):
+        return ConsumerSessionCollection(
+            url="url",
+            from_date=from_date,
+            to_date=to_date,
+            data=list(data),
+            next=next,
+        )
+
+    def _get_datum(self):
+        return DatumProjection(
+            consumer_session=ConsumerSessionProjection(
+                id=self.consumer_session_id,
+                identity=Identity(consumer_identity=self.bag_qr),
+                metadata=Metadata(
+                    location=Location(customer_id=self.location_customer_id),
+                    rvm=Rvm(serial_number=self.rvm_serial_number),
+                ),
+                started_at=self.started_at,
+                items=[
+                    ItemProjection(
+                        product_code=self.product_barcode_1,
+                        count=self.product_count_1,
+                    ),
+                ],
+            ),
+        )
+
     def _assert_objects_created(self):
         # Assert we create exactly the same `DepositPayout` (even though we run the same
         # import twice.)
@@ -580,31 +841,130 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
             [],
         )
 
-    def test_get_product_from_barcode_returns_none_on_unknown_barcode(self):
-        # Arrange
-        cmd = Command()
-        # Act and assert
-        self.assertIsNone(cmd._get_product_from_barcode("unknown_barcode"))
+    def test_preprocess_consumer_sessions_uses_two_queries(self):
+        # Arrange: a page of already imported, manual, new and ID-less sessions
+        self._add_deposit_payout_item(self.qr_bag, count=1)
+        DepositPayoutItem.objects.filter(qr_bag=self.qr_bag).update(
+            consumer_session_id=self.consumer_session_id, rvm_serial=1
+        )
+        new_id = uuid.uuid4()
+        data = [
+            DatumProjection(
+                consumer_session=ConsumerSessionProjection(
+                    id=session_id, identity=Identity(consumer_identity=identity)
+                )
+            )
+            for session_id, identity in [
+                (self.consumer_session_id, self.bag_qr),
+                (self.consumer_session_id_unknown, self.bag_qr_manual),
+                (new_id, self.bag_qr),
+                (new_id, None),
+                (None, self.bag_qr),
+            ]
+        ]
+        data.append(DatumProjection(consumer_session=None))
+        # Act
+        with self.assertNumQueries(2):
+            normal, manual = Command()._preprocess_consumer_sessions(
+                self._get_page(*data)
+            )
+        # Assert
+        self.assertEqual(
+            [(session.id, session.identity.consumer_identity) for session in normal],
+            [(new_id, self.bag_qr), (new_id, None)],
+        )
+        self.assertEqual(
+            [session.id for session in manual], [self.consumer_session_id_unknown]
+        )
 
-    def test_get_product_from_barcode_ignores_deleted_products(self):
+    def test_get_products_ignores_unknown_and_deleted_products(self):
         # Arrange
         cmd = Command()
         # Act
-        product = cmd._get_product_from_barcode(self.product_2_deleted.barcode)
+        products = cmd._get_products({self.product_barcode_2, "unknown_barcode"})
         # Assert: we find the product that is *not* deleted
-        self.assertEqual(product.pk, self.product_2.pk)
+        self.assertEqual(products, {self.product_barcode_2: self.product_2.pk})
 
     def test_get_consumer_identity_returns_none_on_absent_identity(self):
         # Arrange
         cmd = Command()
         # Act and assert
-        self.assertIsNone(cmd._get_consumer_identity(ConsumerSession()))
+        self.assertIsNone(cmd._get_consumer_identity(ConsumerSessionProjection()))
 
-    def test_get_source_returns_none_on_absent_identity(self):
+    def test_resolve_returns_unresolved_source_on_absent_identity(self):
         # Arrange
-        cmd = Command()
-        # Act and assert
-        self.assertIsNone(cmd._get_source(ConsumerSession(), Kiosk))
+        cmd = Command(stdout=StringIO())
+        # Act
+        resolved = cmd._resolve([ConsumerSessionProjection()])
+        # Assert
+        self.assertEqual(dict(resolved.sources), {})
+        self.assertEqual(resolved.get_source(None), ResolvedSource())
+        self.assertEqual(resolved.get_source("unknown"), ResolvedSource())
+
+    def test_resolve_uses_bulk_queries(self):
+        # Arrange: sessions referring to a QR bag, a kiosk by its external customer
+        # ID, and two products.
+        consumer_sessions = [
+            ConsumerSessionProjection(
+                identity=Identity(consumer_identity=identity),
+                items=[
+                    ItemProjection(product_code=self.product_barcode_1, count=1),
+                    ItemProjection(product_code=self.product_barcode_2, count=1),
+                ],
+            )
+            for identity in (self.bag_qr, self.consumer_identity_ext_id) * 10
+        ]
+        cmd = Command(stdout=StringIO())
+        # Act: one query for QR bags, kiosks and products each
+        with self.assertNumQueries(3):
+            resolved = cmd._resolve(consumer_sessions)
+        # Assert
+        self.assertEqual(
+            resolved.get_source(self.bag_qr),
+            ResolvedSource(qr_bag=self.qr_bag, kiosk=self.kiosk),
+        )
+        self.assertEqual(
+            resolved.get_source(self.consumer_identity_ext_id),
+            ResolvedSource(kiosk=self.kiosk),
+        )
+        self.assertEqual(
+            dict(resolved.products),
+            {
+                self.product_barcode_1: self.product_1.pk,
+                self.product_barcode_2: self.product_2.pk,
+            },
+        )
+        with self.assertRaises(TypeError):
+            resolved.sources["foo"] = ResolvedSource()  # type: ignore
+
+    def test_build_deposit_payout_items_uses_no_queries(self):
+        # Arrange
+        consumer_session = ConsumerSessionProjection(
+            id=self.consumer_session_id,
+            identity=Identity(consumer_identity=self.bag_qr),
+            metadata=Metadata(
+                location=Location(customer_id=self.location_customer_id),
+                rvm=Rvm(serial_number=self.rvm_serial_number),
+            ),
+            started_at=self.started_at,
+            items=[ItemProjection(product_code=self.product_barcode_1, count=2)],
+        )
+        cmd = Command(stdout=StringIO())
+        resolved = cmd._resolve([consumer_session])
+        deposit_payout = DepositPayout(source_type=DepositPayout.SOURCE_TYPE_API)
+        # Act
+        with self.assertNumQueries(0):
+            items = cmd._build_deposit_payout_items(
+                deposit_payout, [consumer_session], resolved
+            )
+        # Assert
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0].qr_bag, self.qr_bag)
+        self.assertEqual(items[0].kiosk, self.kiosk)
+        self.assertIsNone(items[0].company_branch)
+        self.assertEqual(items[0].product_id, self.product_1.pk)
+        self.assertEqual(items[0].count, 2)
+        self.assertEqual(items[0].consumer_identity, self.bag_qr)
 
     @parametrize(
         "lookup,db_value,expected",
@@ -621,12 +981,24 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                 f"1{EXAMPLE_QR_ID}deadbeef",
                 True,
             ),
+            # 10-digit QR code with another prefix
+            (
+                f"2{EXAMPLE_QR_ID}",
+                f"1{EXAMPLE_QR_ID}deadbeef",
+                False,
+            ),
             # 18-digit QR code
             (
                 f"1{EXAMPLE_QR_ID}deadbeef",
                 f"1{EXAMPLE_QR_ID}deadbeef",
                 True,
             ),
+            # QR code of recognized length, but not consisting of digits
+            (
+                "x" * (1 + len(EXAMPLE_QR_ID)),
+                f"1{EXAMPLE_QR_ID}deadbeef",
+                False,
+            ),
             # QR code of unrecognized length
             (
                 "1",
@@ -641,31 +1013,22 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
             ),
         ],
     )
-    def test_get_from_qr(self, lookup, db_value, expected):
+    def test_get_qr_bags(self, lookup, db_value, expected):
         # Arrange
-        QRBag.objects.update_or_create(qr=db_value, kiosk=self.kiosk)
-        cmd = Command()
+        qr_bag, _ = QRBag.objects.update_or_create(qr=db_value, kiosk=self.kiosk)
+        cmd = Command(stdout=StringIO())
         # Act
-        result = cmd._get_from_qr(lookup, Kiosk)
+        result = cmd._get_qr_bags({lookup})
+        single_result = cmd._get_qr_bag_from_qr(lookup)
         # Assert
         if expected:
-            self.assertEqual(result, self.kiosk)
+            self.assertEqual(result, {lookup: qr_bag})
+            self.assertEqual(single_result, qr_bag)
         else:
-            self.assertIsNone(result)
-
-    def test_get_from_qr_raises_on_invalid_source_type(self):
-        # Arrange
-        QRBag.objects.update_or_create(
-            qr=f"1{EXAMPLE_QR_ID}deadbeef",
-            kiosk=self.kiosk,
-        )
-        cmd = Command()
-        # Assert
-        with self.assertRaises(ValueError):
-            # Act
-            cmd._get_from_qr(EXAMPLE_QR_ID, Company)
+            self.assertEqual(result, {})
+            self.assertIsNone(single_result)
 
-    def test_get_from_qr_handles_multiple_objects_returned(self):
+    def test_get_qr_bags_handles_multiple_objects_returned(self):
         # Looking up via 10-digit QR code can encounter multiple matching `QRBag`
         # objects if their hashes differ.
 
@@ -675,44 +1038,42 @@ class TestImportDepositPayoutsQRBag(LoginMixin, ParametrizedTestCase, TestCase):
                 qr=f"1{EXAMPLE_QR_ID}{hash}",
                 kiosk=self.kiosk,
             )
-
-        # Act
-        cmd = Command()
-        result = cmd._get_from_qr(f"1{EXAMPLE_QR_ID}", Kiosk)
-        # Assert
-        self.assertIsNone(result)
-
-    def test_get_direct_company_branch(self):
-        # Arrange
-        cmd = Command()
-        # Act
-        result = cmd._get_direct(f"80002{self.company_branch.id:05}", CompanyBranch)
-        # Assert
-        self.assertEqual(result, self.company_branch)
-
-    def test_get_direct_kiosk(self):
-        # Arrange
-        cmd = Command()
+        cmd = Command(stdout=StringIO())
         # Act
-        result = cmd._get_direct(f"90003{self.kiosk.id:05}", Kiosk)
+        result = cmd._get_qr_bags({f"1{EXAMPLE_QR_ID}"})
+        single_result = cmd._get_qr_bag_from_qr(f"1{EXAMPLE_QR_ID}")
         # Assert
-        self.assertEqual(result, self.kiosk)
+        self.assertEqual(result, {})
+        self.assertIsNone(single_result)
 
-    def test_get_direct_returns_none_on_no_match(self):
+    def test_get_qr_bags_does_not_query_without_valid_codes(self):
         # Arrange
-        cmd = Command()
-        # Act
-        result = cmd._get_direct("9000299999", CompanyBranch)
-        # Assert
-        self.assertIsNone(result)
+        cmd = Command(stdout=StringIO())
+        # Act and assert
+        with self.assertNumQueries(0):
+            self.assertEqual(cmd._get_qr_bags({"1", ""}), {})
 
-    def test_get_direct_returns_none_on_unexpected_source_type(self):
+    def test_get_direct_sources(self):
         # Arrange
-        cmd = Command()
+        branch_identity = f"80002{self.company_branch.id:05}"
+        kiosk_identity = f"90003{self.kiosk.id:05}"
+        company_identity = f"90001{self.company.id:05}"
+        cmd = Command(stdout=StringIO())
         # Act
-        result = cmd._get_direct(f"90002{self.company_branch.id:05}", Company)
+        result = cmd._get_direct_sources(
+            {
+                branch_identity,
+                kiosk_identity,
+                company_identity,  # not a company branch or kiosk
+                "9000299999",  # no such company branch
+                self.bag_qr,  # not an external customer ID
+            }
+        )
         # Assert
-        self.assertIsNone(result)
+        self.assertEqual(
+            result,
+            {branch_identity: self.company_branch, kiosk_identity: self.kiosk},
+        )
 
     def test_get_qr_bag_always_returns_none(self):
         # Arrange
@@ -2,6 +2,7 @@
 #
 # SPDX-License-Identifier: MPL-2.0
 from datetime import date
+from unittest.mock import patch
 from uuid import uuid4
 
 from django.conf import settings
@@ -9,6 +10,7 @@ from django.core.exceptions import ValidationError
 from django.db import connection
 from django.db.utils import IntegrityError, ProgrammingError
 from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import isolate_apps
 from unittest_parametrize import ParametrizedTestCase, parametrize
 
 from esani_pantportal.models import (
@@ -18,16 +20,21 @@ from esani_pantportal.models import (
     Company,
     CompanyBranch,
     CompanyUser,
+    ConsumerSessionCheckpoint,
     DepositPayout,
     DepositPayoutItem,
     ERPCreditNoteExport,
     ERPProductMapping,
     EsaniUser,
+    IngestedFile,
     Kiosk,
     KioskUser,
     Product,
+    QRBag,
     QRCodeGenerator,
+    QRCodeIndex,
     QRCodeInterval,
+    qr_code_index,
     validate_barcode_length,
     validate_digit,
 )
@@ -74,7 +81,7 @@ class ValidationTest(SimpleTestCase):
 
 
 @override_settings(QR_URL_PREFIX="http://pant.gl?QR=")
-class QRCodeGeneratorTest(TestCase):
+class QRCodeGeneratorTest(ParametrizedTestCase, TestCase):
     @classmethod
     def setUpTestData(cls):
         QRCodeGenerator.objects.create(name="Små sække", prefix=0)
@@ -122,6 +129,99 @@ class QRCodeGeneratorTest(TestCase):
         ok = QRCodeGenerator.qr_code_exists("00000000004cd04636")
         self.assertEqual(ok, False)
 
+    def test_qr_code_exists_for_generated_qr_codes(self):
+        generator = QRCodeGenerator.objects.get(prefix=1)
+        qr_codes = generator.generate_qr_codes(3, salt="foo")
+        qr_codes += generator.generate_qr_codes(3, salt="bar")
+        # The index is loaded once, and then used without any queries
+        QRCodeGenerator.qr_code_exists("1000000000ffffffff")
+        with (
+            patch.object(QRCodeIndex, "reload_interval", 3600),
+            self.assertNumQueries(0),
+        ):
+            for qr_code in qr_codes:
+                qr = qr_code.removeprefix(settings.QR_URL_PREFIX)
+                self.assertTrue(QRCodeGenerator.qr_code_exists(qr))
+            # Right ID, but control code of another generator or salt
+            self.assertFalse(QRCodeGenerator.qr_code_exists("0" + qr[1:]))
+            self.assertFalse(QRCodeGenerator.qr_code_exists(qr[:-1] + "0"))
+            # No generator with this prefix
+            self.assertFalse(QRCodeGenerator.qr_code_exists("9" + qr[1:]))
+
+    @parametrize(
+        "qr",
+        [
+            ("x000000000deadbeef",),
+            ("01000000000deadbeef",),
+            ("1x00000000deadbeef",),
+            ("",),
+        ],
+    )
+    def test_qr_code_exists_rejects_malformed_qr_codes(self, qr):
+        with self.assertNumQueries(0):
+            self.assertFalse(QRCodeGenerator.qr_code_exists(qr))
+
+
+class QRCodeIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.generator = QRCodeGenerator.objects.create(name="Små sække", prefix=0)
+        cls.generator.generate_qr_codes(10, salt="foo")
+        cls.generator.generate_qr_codes(10, salt="bar")
+
+    def setUp(self):
+        super().setUp()
+        self.index = QRCodeIndex()
+
+    def test_get_salt(self):
+        self.assertEqual(self.index.get_salt(0, 0), "foo")
+        self.assertEqual(self.index.get_salt(0, 9), "foo")
+        self.assertEqual(self.index.get_salt(0, 10), "bar")
+        self.assertEqual(self.index.get_salt(0, 19), "bar")
+        self.assertEqual(self.index.get_salt(0, 20), "")
+        self.assertIsNone(self.index.get_salt(1, 0))
+
+    def test_load(self):
+        # Act
+        self.index.load()
+        # Assert: the index is not loaded again
+        with self.assertNumQueries(0):
+            self.assertEqual(self.index.get_salt(0, 10), "bar")
+
+    def test_get_salt_outside_intervals(self):
+        QRCodeInterval.objects.get(salt="foo").delete()
+        self.assertEqual(self.index.get_salt(0, 0), "")
+
+    def test_reloads_when_generated_elsewhere(self):
+        # Arrange: load the index, then add an interval without invalidating it (as if
+        # by another process)
+        self.index.get_salt(0, 0)
+        QRCodeGenerator.objects.filter(pk=self.generator.pk).update(count=30)
+        QRCodeInterval.objects.bulk_create(
+            [
+                QRCodeInterval(
+                    generator=self.generator, start=20, increment=10, salt="baz"
+                )
+            ]
+        )
+        # Act and assert: the index is only reloaded after `reload_interval`
+        with patch.object(QRCodeIndex, "reload_interval", 3600):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.index.get_salt(0, 25), "")
+        with patch.object(QRCodeIndex, "reload_interval", 0):
+            self.assertEqual(self.index.get_salt(0, 25), "baz")
+
+    def test_invalidated_on_changes(self):
+        # Arrange
+        qr_code_index.get_salt(0, 0)
+        # Act
+        self.generator.generate_qr_codes(1, salt="baz")
+        # Assert
+        self.assertIsNone(qr_code_index._generators)
+        qr_code_index.get_salt(0, 0)
+        self.generator.delete()
+        self.assertIsNone(qr_code_index._generators)
+
 
 class QRCodeIntervalTest(TestCase):
     @classmethod
@@ -134,12 +234,39 @@ class QRCodeIntervalTest(TestCase):
         self.assertIn("foo", str(qr_interval))
 
 
+class QRBagTest(ParametrizedTestCase, TestCase):
+    @parametrize(
+        "qr,expected",
+        [
+            ("1000000123deadbeef", (1, 123, "deadbeef")),
+            ("0000001234deadbeef", (0, 1234, "deadbeef")),
+            ("1000001234", (None, None, None)),
+            ("100000123deadbeef", (None, None, None)),
+            ("x000001234deadbeef", (None, None, None)),
+            ("", (None, None, None)),
+        ],
+    )
+    def test_parse_qr(self, qr, expected):
+        self.assertEqual(QRBag.parse_qr(qr), expected)
+
+    def test_save_sets_qr_parts(self):
+        qr_bag = QRBag.objects.create(qr="0000004321feedfeed")
+        qr_bag.refresh_from_db()
+        self.assertEqual(qr_bag.qr_prefix, 0)
+        self.assertEqual(qr_bag.qr_seq, 4321)
+        self.assertEqual(qr_bag.qr_hash, "feedfeed")
+
+
 class TestAbstractCompany(ParametrizedTestCase, LoginMixin, _AbstractModelTestCase):
     # This test creates a model deriving from `AbstractCompany` in order to be able to
-    # test its properties, methods, etc.
+    # test its properties, methods, etc. The model is registered in an app registry of
+    # its own, so it is not related to `City` (and its table is not needed when other
+    # tests delete cities.)
 
-    class DerivedCompanyModel(AbstractCompany):
-        pass
+    with isolate_apps("esani_pantportal"):
+
+        class DerivedCompanyModel(AbstractCompany):
+            pass
 
     @classmethod
     def setUpTestData(cls):
@@ -216,8 +343,10 @@ class TestAbstractCompany(ParametrizedTestCase, LoginMixin, _AbstractModelTestCa
 
 
 class TestBranch(_AbstractModelTestCase):
-    class DerivedBranchModel(Branch):
-        pass
+    with isolate_apps("esani_pantportal"):
+
+        class DerivedBranchModel(Branch):
+            pass
 
     @classmethod
     def get_derived_model(cls):
@@ -350,6 +479,20 @@ class DepositPayoutItemTest(TestCase):
         self.assertNotEqual(str(self.deposit_payout_item), "Hello world!")
 
 
+class ConsumerSessionCheckpointTest(SimpleTestCase):
+    def test_str(self):
+        checkpoint = ConsumerSessionCheckpoint(
+            from_date=date(2020, 1, 1), to_date=date(2020, 1, 31), page_count=2
+        )
+        self.assertEqual(str(checkpoint), "2020-01-01 - 2020-01-31 (2)")
+
+
+class IngestedFileTest(SimpleTestCase):
+    def test_str(self):
+        entry = IngestedFile(name="foo.csv", status=IngestedFile.STATUS_FAILED)
+        self.assertEqual(str(entry), "foo.csv (Fejlet)")
+
+
 class UserTest(LoginMixin, TestCase):
     @classmethod
     def setUpTestData(cls) -> None:
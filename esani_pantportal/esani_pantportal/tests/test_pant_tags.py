@@ -1,12 +1,20 @@
 # SPDX-FileCopyrightText: 2024 Magenta ApS <info@magenta.dk>
 #
 # SPDX-License-Identifier: MPL-2.0
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import translation
 from django.utils.translation import gettext
 from unittest_parametrize import ParametrizedTestCase, parametrize
 
-from esani_pantportal.models import Company
-from esani_pantportal.templatetags.pant_tags import get_display_name
+from esani_pantportal.backends import bump_permissions_version
+from esani_pantportal.models import BranchUser, City, Company
+from esani_pantportal.templatetags.pant_tags import column_visibility, get_display_name
 
+from .conftest import LoginMixin
 from .helpers import ProductFixtureMixin
 
 
@@ -33,3 +41,69 @@ class TestGetDisplayName(ParametrizedTestCase, ProductFixtureMixin):
         """Passing a valid annotation should return its value"""
         result = get_display_name(self.prod1, "approved")
         self.assertEqual(result, gettext("Nej"))
+
+
+class TestColumnVisibility(TestCase):
+    def test_column_visibility(self):
+        columns = [["a", "A", True], ["b", "B", False], ["c", "C", None]]
+        self.assertEqual(column_visibility(columns), "101")
+
+
+class TestFragmentCache(LoginMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login("BranchUsers")
+
+    def _render(self, template: str, user=None, **context) -> str:
+        template = Template("{% load pant_tags %}" + template)
+        return template.render(Context({"user": user or self.user, **context}))
+
+    def test_fragment_cache_key(self):
+        # Arrange
+        other_user = BranchUser.objects.create_user(
+            username="other", password="12345", branch=self.user.branch
+        )
+        user_key = self._render("{% fragment_cache_key %}")
+        role_key = self._render('{% fragment_cache_key "role" %}')
+        # Act and assert: the role key is shared by users of the same type
+        self.assertNotEqual(
+            self._render("{% fragment_cache_key %}", other_user), user_key
+        )
+        self.assertEqual(
+            self._render('{% fragment_cache_key "role" %}', other_user), role_key
+        )
+        with translation.override("en"):
+            self.assertNotEqual(self._render("{% fragment_cache_key %}"), user_key)
+        bump_permissions_version()
+        self.assertNotEqual(self._render("{% fragment_cache_key %}"), user_key)
+        user_key = self._render("{% fragment_cache_key %}")
+        City.objects.create(name="new city")
+        self.assertNotEqual(self._render("{% fragment_cache_key %}"), user_key)
+
+    def test_layout_caches_navigation(self):
+        # Arrange
+        url = reverse("pant:product_list")
+        first = self.client.get(url)
+        # Act
+        second = self.client.get(url)
+        # Assert: the navigation is cached, but the nonces are not
+        role_key = self._render('{% fragment_cache_key "role" %}')
+        fragment_key = make_template_fragment_key(
+            "layout_navigation", [role_key, "development"]
+        )
+        self.assertIsNotNone(cache.get(fragment_key))
+        for response in (first, second):
+            self.assertContains(response, reverse("pant:product_list"))
+            self.assertContains(response, f'nonce="{response.wsgi_request.csp_nonce}"')
+
+    def test_filter_button_varies_on_column_visibility(self):
+        # Arrange
+        request = RequestFactory().get("/")
+        request.user = self.user
+        template = '{% include "esani_pantportal/list_view_filter_button.html" %}'
+        # Act
+        shown = self._render(template, request=request, columns=[["a", "A", True]])
+        hidden = self._render(template, request=request, columns=[["a", "A", False]])
+        # Assert
+        self.assertIn('id="aToggle" checked', shown)
+        self.assertNotIn('id="aToggle" checked', hidden)
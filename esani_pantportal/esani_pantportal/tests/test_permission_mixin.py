@@ -13,6 +13,7 @@ from esani_pantportal.models import (
     EsaniUser,
     Kiosk,
     KioskUser,
+    User,
 )
 from esani_pantportal.tests.conftest import LoginMixin
 from esani_pantportal.view_mixins import PermissionRequiredMixin
@@ -102,11 +103,15 @@ class PermissionTest(LoginMixin, TestCase):
         self.mixin.request.user.is_superuser = True
         self.assertTrue(self.mixin.has_permissions)
 
+    def _get_users_in_same_company(self) -> list[int]:
+        users = User.objects.filter(self.mixin.users_in_same_company)
+        return list(users.order_by("pk").values_list("pk", flat=True))
+
     def test_users_in_same_company(self):
         # Branch admins are in the same company as others in the same branch.
         self.mixin.request.user = self.facebook_branch_admin
         self.assertEqual(
-            self.mixin.users_in_same_company, [self.facebook_branch_admin.id]
+            self._get_users_in_same_company(), [self.facebook_branch_admin.id]
         )
 
         # Company admins are considered in the same company as other company users
@@ -114,14 +119,26 @@ class PermissionTest(LoginMixin, TestCase):
         # company
         self.mixin.request.user = self.facebook_admin
         self.assertEqual(
-            self.mixin.users_in_same_company,
+            self._get_users_in_same_company(),
             [self.facebook_admin.id, self.facebook_branch_admin.id],
         )
 
         # Kiosk admins are in the same company as other users working in their kiosk
         self.mixin.request.user = self.kiosk_admin
-        self.assertEqual(self.mixin.users_in_same_company, [self.kiosk_admin.id])
+        self.assertEqual(self._get_users_in_same_company(), [self.kiosk_admin.id])
+
+        # ESANI admins do not have a company so no filter is returned.
+        self.mixin.request.user = self.esani_admin
+        self.assertIsNone(self.mixin.users_in_same_company)
+
+    def test_is_in_same_company(self):
+        # Arrange
+        self.mixin.request.user = self.facebook_admin
+        # Act and assert: the check is a single query
+        with self.assertNumQueries(1):
+            self.assertTrue(self.mixin.is_in_same_company(self.facebook_branch_admin))
+        self.assertFalse(self.mixin.is_in_same_company(self.kiosk_admin))
 
-        # ESANI admins do not have a company so an empty list is returned.
+        # ESANI admins are not in any company
         self.mixin.request.user = self.esani_admin
-        self.assertEqual(self.mixin.users_in_same_company, [])
+        self.assertFalse(self.mixin.is_in_same_company(self.facebook_admin))
@@ -0,0 +1,93 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from django.db import connection, connections
+from django.test import TestCase
+from project.postgresql.base import DatabaseWrapper
+from prometheus_client import REGISTRY
+
+
+class DatabaseWrapperTest(TestCase):
+    def _get_sample(self, name: str, alias: str) -> float:
+        return REGISTRY.get_sample_value(name, {"alias": alias}) or 0
+
+    def test_backend(self):
+        self.assertIsInstance(connections["default"], DatabaseWrapper)
+
+    def test_connection_metrics(self):
+        # Arrange: connections used by the tests are kept open
+        wrapper = connections.create_connection("default")
+        self.addCleanup(wrapper.close)
+        waits = self._get_sample(
+            "pantportal_db_connection_wait_seconds_count", "default"
+        )
+        lifetimes = self._get_sample(
+            "pantportal_db_connection_lifetime_seconds_count", "default"
+        )
+        # Act
+        wrapper.ensure_connection()
+        wrapper.close()
+        wrapper.close()
+        # Assert
+        self.assertEqual(
+            self._get_sample("pantportal_db_connection_wait_seconds_count", "default"),
+            waits + 1,
+        )
+        self.assertEqual(
+            self._get_sample(
+                "pantportal_db_connection_lifetime_seconds_count", "default"
+            ),
+            lifetimes + 1,
+        )
+
+    def test_pool_metrics(self):
+        # Arrange
+        wrapper = DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                "CONN_MAX_AGE": 0,
+                "OPTIONS": {"pool": {"min_size": 1, "max_size": 1}},
+            },
+            alias="pool",
+        )
+        self.addCleanup(wrapper.close_pool)
+        # Act
+        wrapper.ensure_connection()
+        wrapper.close()
+        # Assert: the connection is returned to the pool
+        self.assertEqual(
+            self._get_sample("pantportal_db_pool_max_connections", "pool"), 1
+        )
+        self.assertEqual(self._get_sample("pantportal_db_pool_connections", "pool"), 1)
+        self.assertEqual(
+            self._get_sample("pantportal_db_pool_available_connections", "pool"), 1
+        )
+        self.assertEqual(
+            self._get_sample("pantportal_db_pool_waiting_requests", "pool"), 0
+        )
+        self.assertGreaterEqual(
+            self._get_sample("pantportal_db_pool_wait_seconds_total", "pool"), 0
+        )
+        self.assertEqual(self._get_sample("pantportal_db_pool_errors_total", "pool"), 0)
+
+    def test_closed_pool_metrics(self):
+        # Arrange
+        wrapper = DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                "CONN_MAX_AGE": 0,
+                "OPTIONS": {"pool": {"min_size": 1, "max_size": 1}},
+            },
+            alias="closed_pool",
+        )
+        wrapper.ensure_connection()
+        wrapper.close()
+        # Act
+        wrapper.close_pool()
+        # Assert
+        self.assertEqual(
+            self._get_sample("pantportal_db_pool_connections", "closed_pool"), 0
+        )
+        self.assertEqual(
+            self._get_sample("pantportal_db_pool_max_connections", "closed_pool"), 0
+        )
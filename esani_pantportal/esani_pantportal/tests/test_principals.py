@@ -0,0 +1,186 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import pickle
+
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.test import TestCase
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.tokens import AccessToken
+
+from esani_pantportal.models import Company, CompanyBranch, CompanyUser
+from esani_pantportal.principals import PrincipalJWTAuth, _get_key, get_principal
+from esani_pantportal.tests.conftest import LoginMixin
+
+
+class PrincipalTest(LoginMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.login("BranchUsers")
+        self.group = Group.objects.get(name="BranchUsers")
+
+    def _is_cached(self, user=None) -> bool:
+        return cache.get(_get_key((user or self.user).pk)) is not None
+
+    def test_get_principal(self):
+        # Arrange
+        get_principal(self.user.pk)
+        # Act: the cached principal is used, without loading anything else
+        with self.assertNumQueries(1):
+            principal = get_principal(self.user.pk)
+            branch = principal.branch
+            company = principal.company
+            can_change = principal.has_perm("esani_pantportal.change_qrbag")
+            is_admin = principal.is_admin
+        # Assert
+        self.assertEqual(principal.pk, self.user.pk)
+        self.assertEqual(branch, self.user.branch)
+        self.assertEqual(company, self.user.branch.company)
+        self.assertTrue(can_change)
+        self.assertFalse(is_admin)
+
+    def test_get_principal_does_not_cache_password(self):
+        # Act
+        principal = get_principal(self.user.pk)
+        # Assert: the password hash is not cached, and is loaded when accessed
+        cached = pickle.dumps(cache.get(_get_key(self.user.pk)))
+        self.assertNotIn(self.user.password.encode(), cached)
+        self.assertIn("password", principal.get_deferred_fields())
+        with self.assertNumQueries(1):
+            self.assertEqual(principal.password, self.user.password)
+
+    def test_get_principal_returns_none_for_unknown_user(self):
+        self.assertIsNone(get_principal(-1))
+
+    def test_user_change_invalidates_principal(self):
+        # Arrange
+        get_principal(self.user.pk)
+        # Act
+        self.user.is_active = False
+        self.user.save()
+        # Assert
+        self.assertFalse(self._is_cached())
+        self.assertFalse(get_principal(self.user.pk).is_active)
+
+    def test_group_membership_change_invalidates_principal(self):
+        for change in (
+            lambda: self.user.groups.remove(self.group),
+            lambda: self.user.groups.add(self.group),
+            lambda: self.group.user_set.remove(self.user),
+            lambda: self.group.user_set.add(self.user),
+            lambda: self.group.user_set.clear(),
+        ):
+            # Arrange
+            get_principal(self.user.pk)
+            # Act
+            change()
+            # Assert
+            self.assertFalse(self._is_cached())
+
+    def test_user_permission_change_invalidates_principal(self):
+        # Arrange
+        permission = Permission.objects.get(codename="delete_qrbag")
+        for change in (
+            lambda: self.user.user_permissions.add(permission),
+            lambda: permission.user_set.clear(),
+        ):
+            get_principal(self.user.pk)
+            # Act
+            change()
+            # Assert
+            self.assertFalse(self._is_cached())
+
+    def test_group_permission_change_invalidates_principal(self):
+        # Arrange
+        permission = Permission.objects.get(codename="delete_qrbag")
+        for change in (
+            lambda: self.group.permissions.add(permission),
+            lambda: permission.group_set.remove(self.group),
+            lambda: permission.group_set.add(self.group),
+            lambda: permission.group_set.clear(),
+        ):
+            self.assertFalse(get_principal(self.user.pk).has_perm("foo.bar"))
+            # Act
+            change()
+            # Assert
+            self.assertFalse(self._is_cached())
+        # Assert: the permission is read again
+        self.assertFalse(
+            get_principal(self.user.pk).has_perm("esani_pantportal.delete_qrbag")
+        )
+
+    def test_group_change_invalidates_principal(self):
+        # Arrange
+        Group.objects.filter(name="BranchAdmins").delete()
+        get_principal(self.user.pk)
+        # Act
+        self.group.name = "BranchAdmins"
+        self.group.save()
+        # Assert
+        self.assertFalse(self._is_cached())
+        self.assertTrue(get_principal(self.user.pk).is_admin)
+
+    def test_group_deletion_invalidates_principal(self):
+        # Arrange
+        get_principal(self.user.pk)
+        # Act
+        self.group.delete()
+        # Assert
+        self.assertFalse(self._is_cached())
+
+    def test_branch_change_invalidates_principal(self):
+        # Arrange
+        branch = CompanyBranch.objects.get(pk=self.user.branch.pk)
+        get_principal(self.user.pk)
+        # Act
+        branch.name = "Renamed"
+        branch.save()
+        # Assert
+        self.assertFalse(self._is_cached())
+        self.assertEqual(get_principal(self.user.pk).branch.name, "Renamed")
+
+    def test_company_change_invalidates_principal(self):
+        # Arrange
+        company = Company.objects.get(pk=self.user.branch.company.pk)
+        company_user = CompanyUser.objects.create_user(
+            username="company user", password="12345", company=company
+        )
+        get_principal(self.user.pk)
+        get_principal(company_user.pk)
+        # Act
+        company.name = "Renamed"
+        company.save()
+        # Assert
+        self.assertFalse(self._is_cached(self.user))
+        self.assertFalse(self._is_cached(company_user))
+        self.assertEqual(get_principal(self.user.pk).company.name, "Renamed")
+
+
+class PrincipalJWTAuthTest(LoginMixin, TestCase):
+    def test_get_user(self):
+        # Arrange
+        user = self.login("BranchUsers")
+        token = AccessToken.for_user(user)
+        # Act
+        principal = PrincipalJWTAuth().get_user(token)
+        # Assert
+        self.assertEqual(principal.pk, user.pk)
+
+    def test_get_user_raises_on_invalid_tokens(self):
+        # Arrange
+        user = self.login("BranchUsers")
+        token = AccessToken.for_user(user)
+        without_user = AccessToken.for_user(user)
+        del without_user["user_id"]
+        unknown_user = AccessToken.for_user(user)
+        unknown_user["user_id"] = -1
+        user.is_active = False
+        user.save()
+        # Act and assert
+        with self.assertRaises(InvalidToken):
+            PrincipalJWTAuth().get_user(without_user)
+        with self.assertRaises(AuthenticationFailed):
+            PrincipalJWTAuth().get_user(unknown_user)
+        with self.assertRaises(AuthenticationFailed):
+            PrincipalJWTAuth().get_user(token)
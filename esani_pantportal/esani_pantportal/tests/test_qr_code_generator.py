@@ -2,21 +2,51 @@
 #
 # SPDX-License-Identifier: MPL-2.0
 
+import csv
 import io
 import os
+import tempfile
+import zipfile
+from unittest.mock import patch
 
 import pandas as pd
 from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase, override_settings
 from django.urls import reverse
+from openpyxl import load_workbook
 
+from esani_pantportal.exports.qr_codes import (
+    FORMAT_CSV,
+    FORMAT_XLSX,
+    FORMAT_ZIP,
+    HEADER,
+    _XLSXWriter,
+    export_qr_codes,
+    iter_rows,
+)
 from esani_pantportal.models import QRCodeGenerator
 
 from .conftest import LoginMixin
 
 
-class QRCodeGeneratorTests(LoginMixin, TestCase):
-    @override_settings(QR_OUTPUT_DIR=".")
+class _OutputDirMixin:
+    def setUp(self):
+        super().setUp()
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        self.output_dir = output_dir.name
+        settings_override = override_settings(QR_OUTPUT_DIR=self.output_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _read_csv(self, path: str) -> list[list[str]]:
+        with open(path, newline="") as f:
+            return list(csv.reader(f, delimiter=";"))
+
+
+class QRCodeGeneratorTests(_OutputDirMixin, LoginMixin, TestCase):
     def test_generate_qr_code_view(self):
         self.login()
         url = reverse("pant:qr_generate")
@@ -24,12 +54,14 @@ class QRCodeGeneratorTests(LoginMixin, TestCase):
         for bag_type in settings.QR_GENERATOR_SERIES.keys():
             data = {"number_of_codes": 2, "bag_type": bag_type}
             response = self.client.post(url, data=data)
-            df = pd.read_excel(io.BytesIO(response.content))
+            content = b"".join(response.streaming_content)
+            df = pd.read_excel(io.BytesIO(content))
             self.assertEqual(len(df), 2)
 
             # Generate more qrs; the ID should increment with respect to the last batch
             response = self.client.post(url, data=data)
-            df = pd.read_excel(io.BytesIO(response.content))
+            content = b"".join(response.streaming_content)
+            df = pd.read_excel(io.BytesIO(content))
             self.assertGreater(df.Id.astype(float).max(), 1)
 
             qr_generator = QRCodeGenerator.objects.get(
@@ -39,6 +71,138 @@ class QRCodeGeneratorTests(LoginMixin, TestCase):
             for qr in df.loc[:, "QR-kode"]:
                 self.assertNotEqual(qr_generator.check_qr_code(qr), None)
 
-        for file in os.listdir(settings.QR_OUTPUT_DIR):
-            if file.endswith(".csv") and "codes" in file:
-                os.remove(file)
+        # The CSV files are kept in the output directory
+        csv_files = [f for f in os.listdir(self.output_dir) if f.endswith(".csv")]
+        self.assertEqual(len(csv_files), 2 * len(settings.QR_GENERATOR_SERIES))
+
+    def test_generate_qr_code_view_limits_number_of_codes(self):
+        # Arrange
+        self.login()
+        url = reverse("pant:qr_generate")
+        # Act
+        with patch(
+            "esani_pantportal.views.export_qr_codes", wraps=export_qr_codes
+        ) as mock_export:
+            response = self.client.post(
+                url,
+                data={
+                    "number_of_codes": settings.QR_GENERATE_MAX_CODES + 1,
+                    "bag_type": "small",
+                },
+            )
+            self.client.post(
+                url, data={"number_of_codes": 1, "bag_type": "small"}
+            ).close()
+        # Assert: the form is shown again, and the codes are computed in process
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("number_of_codes", response.context["form"].errors)
+        mock_export.assert_called_once_with(
+            "small", 1, formats=[FORMAT_CSV, FORMAT_XLSX], max_workers=1
+        )
+
+
+class ExportQRCodesTest(_OutputDirMixin, TestCase):
+    def test_export_qr_codes(self):
+        # Act
+        paths = export_qr_codes(
+            "small", 5, formats=[FORMAT_CSV, FORMAT_XLSX, FORMAT_ZIP]
+        )
+        # Assert: all files contain the same, valid QR codes
+        generator = QRCodeGenerator.objects.get(prefix=0)
+        csv_rows = self._read_csv(paths[FORMAT_CSV])
+        self.assertEqual(tuple(csv_rows[0]), HEADER)
+        self.assertEqual(len(csv_rows), 6)
+        for qr_code, qr_id, control_code in csv_rows[1:]:
+            self.assertIsNotNone(generator.check_qr_code(qr_code))
+            self.assertTrue(qr_code.endswith(f"{qr_id}{control_code}"))
+
+        with zipfile.ZipFile(paths[FORMAT_ZIP]) as archive:
+            [name] = archive.namelist()
+            zip_rows = list(
+                csv.reader(io.TextIOWrapper(archive.open(name)), delimiter=";")
+            )
+        self.assertEqual(zip_rows, csv_rows)
+
+        worksheet = load_workbook(paths[FORMAT_XLSX]).active
+        xlsx_rows = [list(row) for row in worksheet.iter_rows(values_only=True)]
+        self.assertEqual(xlsx_rows, csv_rows)
+        self.assertEqual(worksheet.title, "Små sække x 5")
+
+    def test_export_qr_codes_does_not_reuse_codes(self):
+        # Act
+        first = export_qr_codes("small", 3)
+        second = export_qr_codes("small", 3)
+        # Assert
+        first_codes = {row[0] for row in self._read_csv(first[FORMAT_CSV])[1:]}
+        second_codes = {row[0] for row in self._read_csv(second[FORMAT_CSV])[1:]}
+        self.assertEqual(len(first_codes | second_codes), 6)
+        self.assertEqual(QRCodeGenerator.objects.get(prefix=0).count, 6)
+
+    def test_export_qr_codes_splits_worksheets(self):
+        # Act: allow a header and two QR codes per worksheet
+        with patch("esani_pantportal.exports.qr_codes.XLSX_MAX_ROWS", 3):
+            paths = export_qr_codes("small", 5, formats=[FORMAT_XLSX])
+        # Assert
+        workbook = load_workbook(paths[FORMAT_XLSX])
+        self.assertEqual(
+            workbook.sheetnames,
+            ["Små sække x 5", "Små sække x 5 (2)", "Små sække x 5 (3)"],
+        )
+        self.assertEqual(
+            [worksheet.max_row for worksheet in workbook.worksheets], [3, 3, 2]
+        )
+
+    def test_export_qr_codes_raises_on_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export_qr_codes("small", 1, formats=["pdf"])
+
+    def test_xlsx_writer_without_rows(self):
+        # Arrange
+        path = os.path.join(self.output_dir, "empty.xlsx")
+        writer = _XLSXWriter(path, "Empty")
+        # Act
+        writer.close()
+        # Assert: the workbook contains the header
+        worksheet = load_workbook(path).active
+        self.assertEqual(list(worksheet.iter_rows(values_only=True)), [HEADER])
+
+    def test_iter_rows_uses_process_pool(self):
+        # Arrange
+        generator = QRCodeGenerator.objects.create(name="Test", prefix=8)
+        interval = generator.reserve_interval(25)
+        # Act
+        chunks = list(iter_rows(interval, chunk_size=4, max_workers=2))
+        # Assert: the chunks are returned in order
+        self.assertEqual([len(chunk) for chunk in chunks], [4, 4, 4, 4, 4, 4, 1])
+        qr_codes = [row[0] for chunk in chunks for row in chunk]
+        self.assertEqual(qr_codes, interval.get_qr_codes())
+
+    def test_iter_rows_in_process(self):
+        # Arrange
+        generator = QRCodeGenerator.objects.create(name="Test", prefix=8)
+        interval = generator.reserve_interval(5)
+        # Act
+        chunks = list(iter_rows(interval, chunk_size=2, max_workers=1))
+        # Assert
+        qr_codes = [row[0] for chunk in chunks for row in chunk]
+        self.assertEqual(qr_codes, interval.get_qr_codes())
+
+
+class GenerateQRCodesCommandTest(_OutputDirMixin, TestCase):
+    def test_generate_qr_codes(self):
+        # Act
+        path = call_command(
+            "generate_qr_codes", "large", "3", "--format", "zip", "--format", "csv"
+        )
+        # Assert
+        self.assertTrue(path.endswith(".zip"))
+        self.assertEqual(
+            sorted(os.path.splitext(f)[1] for f in os.listdir(self.output_dir)),
+            [".csv", ".zip"],
+        )
+
+    def test_raises_on_invalid_arguments(self):
+        for args in (["unknown", "3"], ["small", "0"], ["small", "3", "--workers=0"]):
+            with self.subTest(args=args):
+                with self.assertRaises(CommandError):
+                    call_command("generate_qr_codes", *args)
@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from django.test import TestCase
+
+from esani_pantportal.forms import QRBagFilterForm, UserFilterForm
+from esani_pantportal.models import City, EsaniUser, QRStatus
+from esani_pantportal.reference_data import get_city_names, get_qr_status_names
+
+
+class ReferenceDataTest(TestCase):
+    def test_get_city_names(self):
+        # Arrange
+        City.objects.create(name="Test city")
+        get_city_names()
+        # Act: the cached names are read by a single query
+        with self.assertNumQueries(1):
+            names = get_city_names()
+        # Assert
+        self.assertIn("Test city", names)
+
+    def test_city_change_invalidates_city_names(self):
+        # Arrange
+        city = City.objects.create(name="Test city")
+        get_city_names()
+        # Act
+        city.name = "Renamed city"
+        city.save()
+        # Assert
+        self.assertIn("Renamed city", get_city_names())
+        # Act
+        city.delete()
+        # Assert
+        self.assertNotIn("Renamed city", get_city_names())
+
+    def test_qr_status_change_invalidates_qr_status_names(self):
+        # Arrange
+        get_qr_status_names()
+        # Act
+        status = QRStatus.objects.create(code="test", name_da="Test", name_kl="Test")
+        # Assert
+        self.assertEqual(get_qr_status_names()["test"], "Test")
+        # Act
+        status.delete()
+        # Assert
+        self.assertNotIn("test", get_qr_status_names())
+
+    def test_filter_forms_use_cached_reference_data(self):
+        # Arrange
+        City.objects.create(name="Test city")
+        user = EsaniUser.objects.create_user(username="esani", password="12345")
+        user.is_esani_admin = True
+        # Act
+        user_form = UserFilterForm()
+        qr_bag_form = QRBagFilterForm(user=user)
+        # Assert
+        self.assertIn(("Test city", "Test city"), user_form.fields["city"].choices)
+        self.assertEqual(
+            qr_bag_form.fields["status"].widget.attrs["size"],
+            QRStatus.objects.count() + 1,
+        )
@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import subprocess
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, override_settings
+
+from esani_pantportal.management.commands.report_import_time import (
+    Command,
+    ImportTime,
+    parse_import_times,
+)
+
+IMPORT_TIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |   encodings.aliases
+import time:       200 |        300 | encodings
+import time:      1000 |       1000 |     pandas.core
+import time:       500 |       1500 |   pandas
+import time:      2000 |       3500 | esani_pantportal.views
+"""
+
+
+class ReportImportTimeTest(SimpleTestCase):
+    def _call_command(self, **kwargs) -> str:
+        stdout = StringIO()
+        call_command(Command(), stdout=stdout, **kwargs)
+        return stdout.getvalue()
+
+    def _patch_output(self, stderr: str, returncode: int = 0):
+        return patch(
+            "esani_pantportal.management.commands.report_import_time.subprocess.run",
+            return_value=subprocess.CompletedProcess([], returncode, "", stderr),
+        )
+
+    def test_parse_import_times(self):
+        import_times = parse_import_times(IMPORT_TIME_OUTPUT)
+        self.assertEqual(len(import_times), 5)
+        self.assertEqual(import_times[3], ImportTime("pandas", 500, 1500, depth=1))
+        self.assertEqual(import_times[2].package, "pandas")
+
+    @override_settings(IMPORT_TIME_DEFERRED_PACKAGES=[])
+    def test_report(self):
+        # Act
+        with self._patch_output(IMPORT_TIME_OUTPUT):
+            output = self._call_command(budget=10, top=2)
+        # Assert: the total is the sum of the top level imports, and the time spent
+        # in each package is the sum of the time spent in its own modules
+        lines = output.splitlines()
+        self.assertEqual(lines[0], "Importing project.urls: 3.8 ms")
+        self.assertEqual(lines[1].split(), ["2.0", "ms", "esani_pantportal"])
+        self.assertEqual(lines[2].split(), ["1.5", "ms", "pandas"])
+        self.assertEqual(len(lines), 3)
+
+    @override_settings(IMPORT_TIME_DEFERRED_PACKAGES=["pandas"])
+    def test_deferred_packages(self):
+        with self._patch_output(IMPORT_TIME_OUTPUT):
+            with self.assertRaisesMessage(CommandError, "imported: pandas"):
+                self._call_command(budget=10)
+
+    @override_settings(IMPORT_TIME_DEFERRED_PACKAGES=[])
+    def test_budget(self):
+        with self._patch_output(IMPORT_TIME_OUTPUT):
+            with self.assertRaisesMessage(CommandError, "budget of 3 ms"):
+                self._call_command(budget=3)
+
+    @override_settings(IMPORT_TIME_DEFERRED_PACKAGES=[])
+    def test_without_budget(self):
+        with self._patch_output(IMPORT_TIME_OUTPUT):
+            self._call_command(budget=None)
+
+    def test_import_error(self):
+        with self._patch_output("ModuleNotFoundError", returncode=1):
+            with self.assertRaisesMessage(CommandError, "Could not import"):
+                self._call_command()
+
+    def test_project_does_not_import_deferred_packages(self):
+        # Act: the project is imported by a new interpreter
+        output = self._call_command(budget=60000)
+        # Assert
+        self.assertIn("django", output)
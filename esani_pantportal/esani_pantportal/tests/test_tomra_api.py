@@ -1,33 +1,40 @@
 # SPDX-FileCopyrightText: 2023 Magenta ApS <info@magenta.dk>
 #
 # SPDX-License-Identifier: MPL-2.0
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
+from uuid import uuid4
 
+from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from django.test import SimpleTestCase
 from django.test.utils import override_settings
 from django.utils import timezone
+from requests.adapters import HTTPAdapter
 
 from esani_pantportal.clients.tomra.api import (
     ConsumerSessionCollection,
     TomraAPI,
     _APIResponse,
 )
-from esani_pantportal.clients.tomra.data_models import (
-    ConsumerSession,
-    ConsumerSessionQueryResponse,
-    Datum,
+from esani_pantportal.clients.tomra.projections import (
+    ConsumerSessionProjection,
+    DatumProjection,
 )
 
 
 @override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
     TOMRA_API_ENV="env",
     TOMRA_API_KEY="api_key",
     TOMRA_API_CLIENT_ID="client_id",
     TOMRA_API_CLIENT_SECRET="client_secret",
 )
 class TestTomraAPI(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
     def test_from_settings(self):
         # Act
         instance = TomraAPI.from_settings()
@@ -43,35 +50,131 @@ class TestTomraAPI(SimpleTestCase):
         # Assert
         self.assertEqual(url, "https://env.subdomain.developer.tomra.cloud/path")
 
-    def test_get_access_token(self):
+    @override_settings(TOMRA_API_URL="http://localhost:8102")
+    def test_get_url_uses_url_setting(self):
+        # Act
+        url = TomraAPI.from_settings()._get_url("/path", subdomain="subdomain")
+        # Assert
+        self.assertEqual(url, "http://localhost:8102/path")
+
+    def test_session(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        # Act
+        adapter = instance._session.get_adapter("https://env.api.developer.tomra.cloud")
+        # Assert: connections are pooled, and failed requests are retried
+        self.assertIsInstance(adapter, HTTPAdapter)
+        self.assertEqual(adapter._pool_maxsize, instance._pool_maxsize)
+        self.assertIs(adapter.max_retries, instance._retry)
+        self.assertEqual(instance._session.headers["User-Agent"], instance._user_agent)
+
+    def test_retry_policy(self):
+        # Arrange
+        retry = TomraAPI._retry
+        # Assert: rate limits and server errors are retried
+        for status in (429, 500, 502, 503, 504):
+            self.assertTrue(retry.is_retry("GET", status, has_retry_after=True))
+            self.assertTrue(retry.is_retry("POST", status))
+        self.assertFalse(retry.is_retry("GET", 400))
+        self.assertTrue(retry.respect_retry_after_header)
+        self.assertGreater(retry.backoff_factor, 0)
+
+    def test_close(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        with patch.object(instance._session, "close") as mock_close:
+            # Act
+            instance.close()
+            # Assert
+            mock_close.assert_called_once_with()
+
+    def test_request_access_token(self):
         # Arrange
         instance = TomraAPI.from_settings()
         mock_response = MagicMock()
-        with patch("requests.post", return_value=mock_response) as mock_post:
+        mock_response.json.return_value = {"access_token": "token", "expires_in": 600}
+        with patch.object(
+            instance._session, "post", return_value=mock_response
+        ) as mock_post:
             # Act
-            instance._get_access_token()
+            result = instance._request_access_token()
             # Assert
             mock_post.assert_called_once_with(
                 "https://env.auth.developer.tomra.cloud/oauth2/token",
                 auth=("client_id", "client_secret"),
                 data=instance._oauth2_scope_and_grant,
-                headers={"User-Agent": instance._user_agent},
             )
             mock_response.raise_for_status.assert_called_once()
-            mock_response.json.assert_called_once()
+            self.assertEqual(
+                result, ("token", 600 - instance._access_token_expiry_margin)
+            )
 
-    def test_api_request(self):
+    def test_request_access_token_default_expiry(self):
         # Arrange
         instance = TomraAPI.from_settings()
         mock_response = MagicMock()
-        with patch("requests.request", return_value=mock_response) as mock_request:
+        mock_response.json.return_value = {"access_token": "token"}
+        with patch.object(instance._session, "post", return_value=mock_response):
+            # Act
+            result = instance._request_access_token()
+            # Assert
+            self.assertEqual(
+                result, ("token", 3600 - instance._access_token_expiry_margin)
+            )
+
+    def test_get_access_token_is_cached(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        with patch.object(
+            instance, "_request_access_token", return_value=("token", 600)
+        ) as mock_request_access_token:
+            # Act
+            results = [instance._get_access_token() for _ in range(3)]
+            # Assert
+            self.assertEqual(results, ["token"] * 3)
+            mock_request_access_token.assert_called_once_with()
+
+    def test_get_access_token_is_shared_between_instances(self):
+        # Arrange
+        with patch.object(
+            TomraAPI, "_request_access_token", return_value=("token", 600)
+        ) as mock_request_access_token:
+            TomraAPI.from_settings()._get_access_token()
+            # Act
+            result = TomraAPI.from_settings()._get_access_token()
+            # Assert
+            self.assertEqual(result, "token")
+            mock_request_access_token.assert_called_once_with()
+
+    def test_get_access_token_renews_expired_token(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        with patch.object(
+            instance,
+            "_request_access_token",
+            side_effect=[("token1", 0), ("token2", 600)],
+        ):
+            # Act
+            result1 = instance._get_access_token()
+            result2 = instance._get_access_token()
+            # Assert
+            self.assertEqual(result1, "token1")
+            self.assertEqual(result2, "token2")
+
+    def test_api_request(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        mock_response = MagicMock(status_code=200, content=b'{"foo": "bar"}')
+        with patch.object(
+            instance._session, "request", return_value=mock_response
+        ) as mock_request:
             with patch.object(
                 instance,
                 "_get_access_token",
                 return_value="access_token",
             ) as mock_get_access_token:
                 # Act
-                instance._api_request("GET", "/resource", query={"foo": "bar"})
+                result = instance._api_request("GET", "/resource", query={"foo": "bar"})
                 # Assert
                 mock_request.assert_called_once_with(
                     "GET",
@@ -80,12 +183,30 @@ class TestTomraAPI(SimpleTestCase):
                     headers={
                         "X-Api-Key": "api_key",
                         "Authorization": "Bearer access_token",
-                        "User-Agent": instance._user_agent,
                     },
                 )
                 mock_get_access_token.assert_called_once()
                 mock_response.raise_for_status.assert_called_once()
-                mock_response.json.assert_called_once()
+                self.assertEqual(result.doc, {"foo": "bar"})
+
+    def test_api_request_renews_rejected_access_token(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        mock_responses = [
+            MagicMock(status_code=401),
+            MagicMock(status_code=200, content=b"{}"),
+        ]
+        with patch.object(instance._session, "request", side_effect=mock_responses):
+            with patch.object(
+                instance,
+                "_request_access_token",
+                side_effect=[("revoked", 600), ("token", 600)],
+            ):
+                # Act
+                instance._api_request("GET", "/resource")
+                # Assert
+                self.assertEqual(instance._get_access_token(), "token")
+                mock_responses[1].raise_for_status.assert_called_once()
 
     def test_to_iso8601_in_utc(self):
         # Arrange
@@ -119,31 +240,137 @@ class TestTomraAPI(SimpleTestCase):
             # Assert
             self.assertEqual(mock_request.call_count, 2)
 
+    def test_get_consumer_session_pages(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        mock_responses = [
+            _APIResponse(url="", doc={"next": "page3", "data": []}),
+            _APIResponse(url="", doc={"next": None}),
+        ]
+        with patch.object(
+            instance, "_api_request", side_effect=mock_responses
+        ) as mock_request:
+            # Act: resume from the second page
+            pages = instance.get_consumer_session_pages(
+                datetime(2020, 1, 1),
+                datetime(2020, 2, 1),
+                next="page2",
+            )
+            # Assert: each page carries the continuation token of the following page
+            self.assertEqual([page.next for page in pages], ["page3", None])
+            self.assertEqual(
+                [call.kwargs["query"]["next"] for call in mock_request.call_args_list],
+                ["page2", "page3"],
+            )
+
     def test_get_consumer_sessions_collects_data(self):
         # Arrange
         instance = TomraAPI.from_settings()
-        mock_parsed_data = ConsumerSessionQueryResponse(
-            data=[Datum(consumer_session=ConsumerSession())]
-        )
+        session_id = uuid4()
+        doc = {
+            "data": [
+                {
+                    "consumerSession": {
+                        "id": str(session_id),
+                        "startedAt": "2020-01-01T12:00:00Z",
+                        "identity": {"consumerIdentity": "0123456789"},
+                        "items": [
+                            {
+                                "productCode": "1122",
+                                "count": 10,
+                                "type": "single",
+                                "refund": 2000,
+                            }
+                        ],
+                        "rejectedItems": [{"count": 1, "type": "single"}],
+                        "metadata": {"rvm": {"serialNumber": "2000"}},
+                    }
+                }
+            ],
+            "next": None,
+        }
         with patch.object(
             instance,
             "_api_request",
-            side_effect=[_APIResponse(url="url", doc={"next": None})],
+            side_effect=[_APIResponse(url="url", doc=doc)],
         ):
-            with patch(
-                "esani_pantportal.clients.tomra.api.parse_obj_as",
-                return_value=mock_parsed_data,
-            ):
-                # Act
-                result = instance.get_consumer_sessions(
+            # Act
+            result = instance.get_consumer_sessions(
+                datetime(2020, 1, 1),
+                datetime(2020, 2, 1),
+            )
+        # Assert
+        self.assertIsInstance(result, ConsumerSessionCollection)
+        # URL without continuation token (`next`)
+        self.assertTrue(
+            result.url.startswith(
+                "https://env.api.developer.tomra.cloud/consumer-sessions"
+                "?receivedBefore="
+            )
+        )
+        self.assertNotIn("next=", result.url)
+        self.assertEqual(len(result.data), 1)
+        self.assertIsInstance(result.data[0], DatumProjection)
+        # Assert: only the fields used by the importer are decoded
+        consumer_session = result.data[0].consumer_session
+        self.assertEqual(consumer_session.id, session_id)
+        self.assertEqual(consumer_session.identity.consumer_identity, "0123456789")
+        self.assertEqual(consumer_session.items[0].product_code, "1122")
+        self.assertEqual(consumer_session.items[0].count, 10)
+        self.assertEqual(consumer_session.metadata.rvm.serial_number, "2000")
+        self.assertFalse(hasattr(consumer_session, "rejected_items"))
+
+    def test_get_consumer_session_shards(self):
+        # Arrange: session `b` is received on the boundary, and appears in two shards
+        a, b, c = uuid4(), uuid4(), uuid4()
+        sessions_by_day = {1: [a, b], 2: [b, c], 3: [None, None]}
+
+        def get_consumer_sessions(after, before, rvm_serials):
+            return ConsumerSessionCollection(
+                url="url",
+                from_date=after,
+                to_date=before,
+                data=[
+                    DatumProjection(consumer_session=ConsumerSessionProjection(id=id))
+                    for id in sessions_by_day[after.day]
+                ],
+            )
+
+        instance = TomraAPI.from_settings()
+        with patch.object(
+            instance, "get_consumer_sessions", side_effect=get_consumer_sessions
+        ):
+            # Act
+            shards = list(
+                instance.get_consumer_session_shards(
                     datetime(2020, 1, 1),
-                    datetime(2020, 2, 1),
+                    datetime(2020, 1, 3, 12),
+                    max_workers=2,
                 )
-                self.assertIsInstance(result, ConsumerSessionCollection)
-                self.assertEqual(result.url, "url")
-                self.assertEqual(len(result.data), 1)
-                self.assertIsInstance(result.data, list)
-                self.assertIsInstance(result.data[0], Datum)
+            )
+        # Assert: the shards are returned in order, without duplicate sessions
+        self.assertEqual(
+            [(shard.from_date, shard.to_date) for shard in shards],
+            [
+                (datetime(2020, 1, 1), datetime(2020, 1, 2)),
+                (datetime(2020, 1, 2), datetime(2020, 1, 3)),
+                (datetime(2020, 1, 3), datetime(2020, 1, 3, 12)),
+            ],
+        )
+        self.assertEqual(
+            [[datum.consumer_session.id for datum in shard.data] for shard in shards],
+            [[a, b], [c], [None, None]],
+        )
+
+    def test_split_window_returns_single_window_for_empty_period(self):
+        # Arrange
+        instance = TomraAPI.from_settings()
+        # Act
+        result = instance._split_window(
+            datetime(2020, 1, 1), datetime(2020, 1, 1), timedelta(days=1)
+        )
+        # Assert
+        self.assertEqual(result, [(datetime(2020, 1, 1), datetime(2020, 1, 1))])
 
 
 class TestTomraAPINoCredentials(SimpleTestCase):
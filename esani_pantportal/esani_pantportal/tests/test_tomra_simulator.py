@@ -0,0 +1,263 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+from datetime import UTC, datetime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from esani_pantportal.clients.tomra.api import TomraAPI
+from esani_pantportal.clients.tomra.simulator import (
+    ConsumerSessionGenerator,
+    SimulatorConfig,
+    TomraSimulator,
+    _RateLimiter,
+    decode_token,
+    encode_token,
+)
+from esani_pantportal.models import DepositPayoutItem, Kiosk, QRBag
+from esani_pantportal.tests.conftest import LoginMixin
+
+_day = datetime(2024, 5, 1, tzinfo=UTC)
+
+_cache_settings = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
+
+
+class TestConsumerSessionGenerator(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.generator = ConsumerSessionGenerator(
+            SimulatorConfig(sessions_per_day=24, page_size=10, bags=5, rvms=3)
+        )
+
+    def test_get_range(self):
+        # Act
+        numbers = self.generator.get_range(_day, _day + timedelta(hours=1))
+        # Assert: one session per hour
+        self.assertEqual(len(numbers), 1)
+        self.assertEqual(
+            self.generator.get_session(numbers.start)["consumerSession"]["startedAt"],
+            "2024-05-01T00:00:00+00:00",
+        )
+
+    def test_get_session_is_deterministic(self):
+        # Act and assert
+        self.assertEqual(self.generator.get_session(1), self.generator.get_session(1))
+        self.assertNotEqual(
+            self.generator.get_session(1)["consumerSession"]["id"],
+            self.generator.get_session(2)["consumerSession"]["id"],
+        )
+
+    def test_get_page_follows_continuation_tokens(self):
+        # Act
+        pages = [self.generator.get_page(_day, _day + timedelta(days=1))]
+        while "next" in pages[-1]:
+            pages.append(
+                self.generator.get_page(
+                    _day, _day + timedelta(days=1), next=pages[-1]["next"]
+                )
+            )
+        # Assert
+        self.assertEqual([len(page["data"]) for page in pages], [10, 10, 4])
+
+    def test_get_page_filters_rvm_serials(self):
+        # Act
+        page = self.generator.get_page(
+            _day, _day + timedelta(days=1), rvm_serials={"100001"}
+        )
+        # Assert
+        serials = {
+            datum["consumerSession"]["metadata"]["rvm"]["serialNumber"]
+            for datum in page["data"]
+        }
+        self.assertEqual(serials, {"100001"})
+
+    def test_token_roundtrip(self):
+        self.assertEqual(decode_token(encode_token(1234)), 1234)
+
+
+class TestRateLimiter(SimpleTestCase):
+    def test_acquire(self):
+        # Arrange
+        rate_limiter = _RateLimiter(2)
+        # Act and assert: the bucket holds two requests
+        self.assertTrue(rate_limiter.acquire())
+        self.assertTrue(rate_limiter.acquire())
+        self.assertFalse(rate_limiter.acquire())
+
+
+@override_settings(CACHES=_cache_settings)
+class TestTomraSimulator(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def _get_api(self, simulator: TomraSimulator) -> TomraAPI:
+        return TomraAPI("env", "key", "id", "secret", url=simulator.url)
+
+    def _get_token(self, simulator: TomraSimulator) -> str:
+        response = requests.post(
+            f"{simulator.url}/oauth2/token", auth=("id", "secret"), timeout=5
+        )
+        return response.json()["access_token"]
+
+    def _get(self, simulator: TomraSimulator, path: str, **headers):
+        return requests.get(
+            f"{simulator.url}{path}",
+            params={
+                "receivedAfter": _day.isoformat(),
+                "receivedBefore": (_day + timedelta(days=1)).isoformat(),
+            },
+            headers=headers,
+            timeout=5,
+        )
+
+    def test_get_consumer_sessions(self):
+        # Arrange
+        config = SimulatorConfig(sessions_per_day=25, page_size=10)
+        with TomraSimulator(config) as simulator:
+            api = self._get_api(simulator)
+            # Act
+            pages = list(api.get_consumer_session_pages(_day, _day + timedelta(days=1)))
+            api.close()
+        # Assert: all sessions are retrieved page by page, using one access token
+        self.assertEqual([len(page.data) for page in pages], [10, 10, 5])
+        self.assertEqual(len(simulator.server.access_tokens), 1)
+        self.assertEqual(simulator.server.request_count, 4)
+
+    def test_access_token_requires_credentials(self):
+        with TomraSimulator(SimulatorConfig()) as simulator:
+            # Act
+            response = requests.post(f"{simulator.url}/oauth2/token", timeout=5)
+        # Assert
+        self.assertEqual(response.status_code, 401)
+
+    def test_consumer_sessions_require_api_key_and_access_token(self):
+        with TomraSimulator(SimulatorConfig()) as simulator:
+            # Act
+            without_key = self._get(simulator, "/consumer-sessions")
+            without_token = self._get(
+                simulator, "/consumer-sessions", **{"X-Api-Key": "key"}
+            )
+        # Assert
+        self.assertEqual(without_key.status_code, 403)
+        self.assertEqual(without_token.status_code, 401)
+
+    def test_bad_request_and_unknown_paths(self):
+        with TomraSimulator(SimulatorConfig()) as simulator:
+            token = self._get_token(simulator)
+            headers = {"X-Api-Key": "key", "Authorization": f"Bearer {token}"}
+            # Act
+            bad_request = requests.get(
+                f"{simulator.url}/consumer-sessions", headers=headers, timeout=5
+            )
+            unknown_get = self._get(simulator, "/unknown", **headers)
+            unknown_post = requests.post(f"{simulator.url}/unknown", timeout=5)
+        # Assert
+        self.assertEqual(bad_request.status_code, 400)
+        self.assertEqual(unknown_get.status_code, 404)
+        self.assertEqual(unknown_post.status_code, 404)
+
+    def test_error_injection(self):
+        # Arrange
+        config = SimulatorConfig(error_rate=1, error_status=502)
+        with TomraSimulator(config) as simulator:
+            token = self._get_token(simulator)
+            # Act
+            response = self._get(
+                simulator,
+                "/consumer-sessions",
+                **{"X-Api-Key": "key", "Authorization": f"Bearer {token}"},
+            )
+        # Assert
+        self.assertEqual(response.status_code, 502)
+
+    def test_rate_limit_and_latency(self):
+        # Arrange
+        config = SimulatorConfig(rate_limit=1, latency=0.01)
+        with TomraSimulator(config) as simulator:
+            # Act
+            first = requests.post(f"{simulator.url}/oauth2/token", timeout=5)
+            second = requests.post(f"{simulator.url}/oauth2/token", timeout=5)
+        # Assert
+        self.assertEqual(first.status_code, 401)
+        self.assertEqual(second.status_code, 429)
+        self.assertEqual(second.headers["Retry-After"], "1")
+
+
+@override_settings(
+    CACHES=_cache_settings,
+    TOMRA_API_ENV="env",
+    TOMRA_API_KEY="key",
+    TOMRA_API_CLIENT_ID="id",
+    TOMRA_API_CLIENT_SECRET="secret",
+)
+class TestImportFromTomraSimulator(LoginMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_import(self):
+        # Arrange: a kiosk owning all the QR bags used by the simulator
+        config = SimulatorConfig(sessions_per_day=48, page_size=20, bags=10)
+        kiosk = Kiosk.objects.create(cvr=1234, city=self._test_city)
+        for bag in range(config.bags):
+            QRBag.objects.create(qr=f"0{bag:09}deadbeef", kiosk=kiosk)
+        generator = ConsumerSessionGenerator(config)
+        # The importer requests periods in local time
+        from_date = datetime(2024, 5, 1).astimezone()
+        expected = sum(
+            item["count"]
+            for number in generator.get_range(from_date, from_date + timedelta(days=2))
+            for item in generator.get_session(number)["consumerSession"]["items"]
+        )
+        with TomraSimulator(config) as simulator:
+            with override_settings(TOMRA_API_URL=simulator.url):
+                # Act
+                call_command(
+                    "import_deposit_payouts_qrbag",
+                    from_date="2024-05-01",
+                    to_date="2024-05-03",
+                    workers=2,
+                    stdout=StringIO(),
+                )
+        # Assert: all items are imported, and attributed to the kiosk
+        items = DepositPayoutItem.objects.all()
+        self.assertEqual(items.aggregate(total=Sum("count"))["total"], expected)
+        self.assertFalse(items.filter(kiosk__isnull=True).exists())
+
+
+class TestRunTomraSimulatorCommand(SimpleTestCase):
+    _server_path = (
+        "esani_pantportal.management.commands.run_tomra_simulator.TomraSimulatorServer"
+    )
+
+    def test_serves_until_interrupted(self):
+        with patch(self._server_path) as mock_server:
+            mock_server.return_value.url = "http://127.0.0.1:8102"
+            mock_server.return_value.serve_forever.side_effect = KeyboardInterrupt
+            stdout = StringIO()
+            # Act
+            call_command("run_tomra_simulator", "--rate-limit", "5", stdout=stdout)
+        # Assert
+        config = mock_server.call_args.args[1]
+        self.assertEqual(config.rate_limit, 5)
+        self.assertIn("http://127.0.0.1:8102", stdout.getvalue())
+        mock_server.return_value.server_close.assert_called_once()
+
+    def test_raises_on_invalid_arguments(self):
+        with self.assertRaises(CommandError):
+            call_command("run_tomra_simulator", "--page-size", "0")
+
+    @override_settings(ENVIRONMENT="production")
+    def test_raises_in_production(self):
+        with self.assertRaises(CommandError):
+            call_command("run_tomra_simulator")
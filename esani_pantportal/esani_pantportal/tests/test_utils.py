@@ -1,9 +1,12 @@
 # SPDX-FileCopyrightText: 2023 Magenta ApS <info@magenta.dk>
 #
 # SPDX-License-Identifier: MPL-2.0
+import sys
+from types import ModuleType
+
 from django.core.exceptions import ValidationError
 from django.test import SimpleTestCase
-from project.util import json_dump
+from project.util import json_dump, lazy_import
 
 from esani_pantportal.migrations.utils.utils import clean_phone_no
 from esani_pantportal.util import (
@@ -27,6 +30,23 @@ class UtilTest(SimpleTestCase):
         with self.assertRaises(TypeError):
             json_dump({"foo": NonSerializable()})
 
+    def test_lazy_import(self):
+        # Arrange
+        sys.modules.pop("colorsys", None)
+        self.addCleanup(sys.modules.pop, "colorsys", None)
+        # Act
+        module = lazy_import("colorsys")
+        # Assert: the module is executed when its attributes are accessed
+        self.assertIs(sys.modules["colorsys"], module)
+        self.assertIsNot(type(module), ModuleType)
+        self.assertEqual(module.rgb_to_hsv(1, 0, 0), (0, 1, 1))
+        self.assertIs(type(module), ModuleType)
+        self.assertIs(lazy_import("colorsys"), module)
+
+    def test_lazy_import_missing_module(self):
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import("esani_pantportal.missing")
+
     def test_import_unreadable_csv_file(self):
         with self.assertRaises(ValidationError):
             read_csv(None)
@@ -0,0 +1,154 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+import gc
+import importlib
+import os
+from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+from django.core.cache import caches
+from django.db import connections
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import clear_url_caches, get_resolver
+from project.cache import get_version_key
+from project.warm_start import freeze, warm_up
+
+from esani_pantportal.models import qr_code_index
+from esani_pantportal.reference_data import REFERENCE_DATA_NAMESPACE
+
+
+class WarmStartTest(TestCase):
+    def test_warm_up(self):
+        # Arrange
+        loader = engines["django"].engine.template_loaders[0]
+        loader.reset()
+        clear_url_caches()
+        qr_code_index.invalidate()
+        # Act
+        warm_up()
+        # Assert: the URL resolvers are populated for each language, the templates
+        # are compiled, the QR code index is loaded, and the reference data is cached
+        self.assertEqual(set(get_resolver()._reverse_dict), {"da", "kl"})
+        self.assertIn("esani_pantportal/layout.html", loader.get_template_cache)
+        self.assertIsNotNone(qr_code_index._generators)
+        cache = caches["default"]
+        self.assertTrue(cache.has_key(get_version_key(REFERENCE_DATA_NAMESPACE)))
+        self.assertTrue(cache.has_key(f"{REFERENCE_DATA_NAMESPACE}:city_names"))
+
+    def test_warm_up_skips_invalid_templates(self):
+        with TemporaryDirectory() as path:
+            # Arrange
+            for name, source in (
+                ("valid.html", "{{ x }}"),
+                ("invalid.html", "{% if %}"),
+            ):
+                with open(os.path.join(path, name), "w") as f:
+                    f.write(source)
+            templates = [
+                {
+                    "BACKEND": "django.template.backends.django.DjangoTemplates",
+                    "DIRS": [path],
+                }
+            ]
+            # Act
+            with (
+                override_settings(TEMPLATES=templates),
+                patch("project.warm_start.logger") as logger,
+            ):
+                warm_up()
+        # Assert
+        logger.exception.assert_called_once_with(
+            "Could not compile template invalid.html"
+        )
+        logger.info.assert_called_once_with("Warmed up URL resolvers and 1 templates")
+
+    def test_freeze(self):
+        # Arrange
+        cache = caches["default"]
+        # Act
+        with (
+            patch.object(connections, "close_all") as close_all,
+            patch.object(cache, "close") as close,
+            patch("project.warm_start.gc.freeze") as gc_freeze,
+        ):
+            freeze()
+        # Assert
+        close_all.assert_called_once()
+        close.assert_called_once()
+        gc_freeze.assert_called_once()
+
+
+class GunicornConfTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        # The configuration disables the garbage collector until the workers are
+        # forked
+        self.conf = importlib.import_module("project.gunicorn_conf")
+        self.addCleanup(gc.enable)
+
+    def _get_server(self, preload_app=True):
+        return SimpleNamespace(cfg=SimpleNamespace(preload_app=preload_app), log=Mock())
+
+    @patch("project.warm_start.freeze")
+    @patch("project.warm_start.warm_up")
+    def test_when_ready(self, warm_up, freeze):
+        # Act
+        self.conf.when_ready(self._get_server())
+        # Assert
+        warm_up.assert_called_once()
+        freeze.assert_called_once()
+        self.assertTrue(gc.isenabled())
+
+    @patch("project.warm_start.freeze")
+    @patch("project.warm_start.warm_up", side_effect=ValueError)
+    def test_when_ready_logs_errors(self, warm_up, freeze):
+        # Arrange
+        server = self._get_server()
+        # Act
+        self.conf.when_ready(server)
+        # Assert: the workers are still forked
+        server.log.exception.assert_called_once()
+        freeze.assert_called_once()
+
+    @patch("project.warm_start.freeze", side_effect=ValueError)
+    @patch("project.warm_start.warm_up")
+    def test_when_ready_enables_gc_if_freeze_fails(self, warm_up, freeze):
+        # Arrange
+        gc.disable()
+        # Act
+        with self.assertRaises(ValueError):
+            self.conf.when_ready(self._get_server())
+        # Assert
+        self.assertTrue(gc.isenabled())
+
+    @patch("project.warm_start.warm_up")
+    def test_when_ready_without_preload(self, warm_up):
+        self.conf.when_ready(self._get_server(preload_app=False))
+        warm_up.assert_not_called()
+
+    def test_on_starting_removes_metrics_of_earlier_runs(self):
+        with TemporaryDirectory() as path:
+            # Arrange
+            for name in ("counter_1.db", f"counter_{os.getpid()}.db"):
+                open(os.path.join(path, name), "w").close()
+            # Act
+            with patch.object(self.conf, "prometheus_multiproc_dir", path):
+                self.conf.on_starting(self._get_server())
+            # Assert: the metrics of the master are kept
+            self.assertEqual(os.listdir(path), [f"counter_{os.getpid()}.db"])
+
+    def test_child_exit_removes_live_gauges(self):
+        with TemporaryDirectory() as path:
+            # Arrange
+            for name in ("gauge_liveall_1.db", "gauge_liveall_2.db", "counter_1.db"):
+                open(os.path.join(path, name), "w").close()
+            # Act
+            with patch.object(self.conf, "prometheus_multiproc_dir", path):
+                self.conf.child_exit(self._get_server(), SimpleNamespace(pid=1))
+            # Assert
+            self.assertEqual(
+                sorted(os.listdir(path)), ["counter_1.db", "gauge_liveall_2.db"]
+            )
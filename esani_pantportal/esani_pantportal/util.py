@@ -4,15 +4,16 @@
 
 
 import locale
+from typing import TYPE_CHECKING
 from urllib.parse import parse_qs, unquote, urlencode, urlparse, urlunparse
 
-import pandas as pd
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.http import HttpRequest
 from django.utils.translation import get_language
 from django.utils.translation import gettext as _
 from django.utils.translation import to_locale
+from project.util import lazy_import
 
 from esani_pantportal.models import (
     DANISH_PANT_CHOICES,
@@ -20,6 +21,11 @@ from esani_pantportal.models import (
     PRODUCT_SHAPE_CHOICES,
 )
 
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_import("pandas")
+
 
 def read_csv(*args, **kwargs):
     """
@@ -41,7 +47,7 @@ def read_excel(*args, **kwargs):
         raise ValidationError(e)
 
 
-def default_dataframe() -> pd.DataFrame:
+def default_dataframe() -> "pd.DataFrame":
     """
     Returns a dataframe with default column titles and some example values
     """
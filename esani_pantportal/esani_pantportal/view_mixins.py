@@ -6,6 +6,7 @@ from typing import Iterable
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import AnonymousUser
+from django.db.models import Q
 from django.http import HttpRequest, HttpResponse, HttpResponseRedirect
 from django.template.response import TemplateResponse
 from django.views.generic import FormView, UpdateView
@@ -15,9 +16,7 @@ from esani_pantportal.models import (
     COMPANY_USER,
     ESANI_USER,
     KIOSK_USER,
-    BranchUser,
-    CompanyUser,
-    KioskUser,
+    User,
 )
 
 
@@ -84,41 +83,37 @@ class PermissionRequiredMixin(LoginRequiredMixin):
         return self.check_permissions() or super().form_valid(form, *args, **kwargs)
 
     @property
-    def users_in_same_company(self):
+    def users_in_same_company(self) -> Q | None:
         """
-        Return a list of IDs of users in the same company as the user calling this
-        method.
+        Return a filter selecting the users in the same company as the user calling
+        this method.
 
-        - For company users all users in the same company are returned. Including
+        - For company users all users in the same company are selected. Including
           branches which report to the user's company.
-        - For branch users only users in the same branch are returned.
-        - For Kiosk users only users in the same kiosk are returned
-        - For ESANI users nothing is returned.
-        """
-        username = self.request.user.username
-        if self.request.user.user_type == BRANCH_USER:
-            branch_id = BranchUser.objects.get(username=username).branch.id
-            user_ids = [u.id for u in BranchUser.objects.filter(branch__id=branch_id)]
-
-        elif self.request.user.user_type == COMPANY_USER:
-            company_id = CompanyUser.objects.get(username=username).company.id
-            company_user_ids = [
-                u.id for u in CompanyUser.objects.filter(company__id=company_id)
-            ]
-
-            branch_user_ids = [
-                u.id for u in BranchUser.objects.filter(branch__company__id=company_id)
-            ]
+        - For branch users only users in the same branch are selected.
+        - For Kiosk users only users in the same kiosk are selected.
+        - For ESANI users None is returned, as they are not limited to a company.
 
-            user_ids = company_user_ids + branch_user_ids
-
-        elif self.request.user.user_type == KIOSK_USER:
-            branch_id = KioskUser.objects.get(username=username).branch.id
-            user_ids = [u.id for u in KioskUser.objects.filter(branch__id=branch_id)]
+        The filter refers to the branch or company of the calling user, so it can be
+        applied to any queryset of users without listing the users first.
+        """
+        user: User = self.request.user  # type: ignore[assignment]
+        if user.user_type == BRANCH_USER:
+            return Q(branchuser__branch=user.branch)
+        elif user.user_type == COMPANY_USER:
+            return Q(companyuser__company=user.company) | Q(
+                branchuser__branch__company=user.company
+            )
+        elif user.user_type == KIOSK_USER:
+            return Q(kioskuser__branch=user.branch)
         else:
-            user_ids = []
+            return None
 
-        return user_ids
+    def is_in_same_company(self, user: User) -> bool:
+        users_in_same_company = self.users_in_same_company
+        return users_in_same_company is not None and (
+            User.objects.filter(users_in_same_company, pk=user.pk).exists()
+        )
 
     @property
     def same_branch(self):
@@ -7,11 +7,10 @@ import os
 import sys
 from functools import cache, cached_property
 from io import BytesIO
-from typing import Any
+from typing import TYPE_CHECKING, Any
 from urllib.parse import quote
 from uuid import UUID
 
-import pandas as pd
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import update_session_auth_hash
@@ -20,7 +19,6 @@ from django.contrib.auth.models import Group
 from django.contrib.auth.views import LogoutView, PasswordChangeView
 from django.core.exceptions import ValidationError
 from django.core.mail import EmailMultiAlternatives
-from django.core.management import call_command
 from django.db import IntegrityError, transaction
 from django.db.models import (
     Aggregate,
@@ -46,6 +44,7 @@ from django.db.models import (
 from django.db.models.functions import Coalesce, Concat
 from django.forms import model_to_dict
 from django.http import (
+    FileResponse,
     HttpResponse,
     HttpResponseForbidden,
     HttpResponseNotFound,
@@ -72,11 +71,11 @@ from django_fsm import can_proceed
 from django_otp import devices_for_user
 from django_stubs_ext import StrPromise
 from project.settings import DEFAULT_FROM_EMAIL
+from project.util import lazy_import
 from simple_history.utils import bulk_update_with_history
 from two_factor.views import LoginView, SetupView
-from xlsxwriter import Workbook
-from xlsxwriter.worksheet import Worksheet
 
+from esani_pantportal.exports.qr_codes import FORMAT_CSV, FORMAT_XLSX, export_qr_codes
 from esani_pantportal.exports.uniconta.exports import CreditNoteExport, DebtorExport
 from esani_pantportal.forms import (
     ChangePasswordForm,
@@ -159,6 +158,14 @@ from esani_pantportal.view_mixins import (
     UpdateViewMixin,
 )
 
+if TYPE_CHECKING:
+    import pandas as pd
+    import xlsxwriter
+    from xlsxwriter.worksheet import Worksheet
+else:
+    pd = lazy_import("pandas")
+    xlsxwriter = lazy_import("xlsxwriter")
+
 logger = logging.getLogger(__name__)
 
 
@@ -646,7 +653,7 @@ class SearchView(LoginRequiredMixin, FormView):
     def get_queryset_as_excel_file_download(self, queryset: QuerySet) -> HttpResponse:
         view_name: str = self.get_view_name()
         buf: BytesIO = BytesIO()
-        workbook: Workbook = Workbook(
+        workbook: xlsxwriter.Workbook = xlsxwriter.Workbook(
             buf,
             {
                 "strings_to_urls": False,
@@ -656,7 +663,7 @@ class SearchView(LoginRequiredMixin, FormView):
                 "constant_memory": True,
             },
         )
-        worksheet: Worksheet = workbook.add_worksheet(view_name)
+        worksheet: "Worksheet" = workbook.add_worksheet(view_name)
 
         # Add handler for writing `UUID` values to Excel sheet
         def write_uuid(worksheet, row, col, uuid, cell_format=None):
@@ -1387,9 +1394,9 @@ class UserSearchView(PermissionRequiredMixin, SearchView):
         qs = super().get_queryset()
 
         # Only allow branch/company/kiosk users to see users of their own branch/company
-        user_ids = self.users_in_same_company
-        if user_ids:
-            qs = qs.filter(pk__in=user_ids)
+        users_in_same_company = self.users_in_same_company
+        if users_in_same_company is not None:
+            qs = qs.filter(users_in_same_company)
         return qs
 
     def get_view_name(self) -> str:
@@ -1893,8 +1900,7 @@ class SameCompanyMixin(PermissionRequiredMixin):
     def check_permissions(self):
         user = self.get_object()
         if not self.request.user.is_esani_admin:
-            user_ids = self.users_in_same_company
-            if user.id not in user_ids:
+            if not self.is_in_same_company(user):
                 return self.access_denied
 
         user_model_name = user.user_profile._meta.model_name
@@ -2580,35 +2586,23 @@ class GenerateQRView(FormView):
 
     def form_valid(self, form):
         bag_type = form.cleaned_data["bag_type"]
-        bag_name = settings.QR_GENERATOR_SERIES[bag_type]["name"]
         number_of_codes = form.cleaned_data["number_of_codes"]
 
-        csv_file = call_command("generate_qr_codes", bag_type, number_of_codes)
-        df = pd.read_csv(csv_file, sep=";", dtype=str)
-
-        with BytesIO() as b:
-            sheet_name = f"{bag_name} x {number_of_codes}"
-
-            writer = pd.ExcelWriter(
-                b,
-                engine="xlsxwriter",
-                engine_kwargs={"options": {"strings_to_urls": False}},
-            )
-            df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-            # Set column-widths
-            writer.sheets[sheet_name].set_column(0, 0, 45)
-            writer.sheets[sheet_name].set_column(1, 1, 10)
-            writer.sheets[sheet_name].set_column(2, 2, 15)
-            writer.close()
-
-            excel_filename = os.path.basename(csv_file).replace(".csv", ".xlsx")
-            content_type = (
+        # The QR codes are streamed to files on disk, and the Excel file is then sent
+        # from disk, so the codes are never held in memory all at once. They are
+        # computed in this process, as forking the (threaded) worker process is unsafe.
+        paths = export_qr_codes(
+            bag_type, number_of_codes, formats=[FORMAT_CSV, FORMAT_XLSX], max_workers=1
+        )
+        excel_path = paths[FORMAT_XLSX]
+        return FileResponse(
+            open(excel_path, "rb"),
+            as_attachment=True,
+            filename=os.path.basename(excel_path),
+            content_type=(
                 "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-            response = HttpResponse(b.getvalue(), content_type=content_type)
-            response["Content-Disposition"] = f"attachment; filename={excel_filename}"
-            return response
+            ),
+        )
 
 
 class CsvUsersView(CsvTemplateView):
@@ -2,9 +2,13 @@
 #
 # SPDX-License-Identifier: MPL-2.0
 
+import os
+from tempfile import TemporaryDirectory
 from unittest.mock import MagicMock, patch
 
+from django.core.cache import cache
 from django.test import TestCase
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
 
 
 class MetricsTest(TestCase):
@@ -33,3 +37,28 @@ class MetricsTest(TestCase):
         resp = self.client.get("/metrics/health/database")
         self.assertEqual(resp.status_code, 500)
         self.assertEqual(resp.content, b"ERROR")
+
+    def test_prometheus_metrics(self):
+        # Arrange: count a cache lookup
+        cache.get("test")
+
+        resp = self.client.get("/metrics/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"pantportal_cache_requests_total", resp.content)
+
+    def test_prometheus_metrics_of_all_processes(self):
+        with TemporaryDirectory() as path:
+            # Arrange: a counter written by another process
+            counter = MmapedDict(os.path.join(path, "counter_1234.db"))
+            key = mmap_key(
+                "pantportal_test", "pantportal_test_total", [], [], "Test counter"
+            )
+            counter.write_value(key, 3, 0)
+            counter.close()
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": path}):
+                # Act
+                resp = self.client.get("/metrics/")
+        # Assert: the metrics are read from the files of all processes
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"pantportal_test_total 3.0", resp.content)
+        self.assertNotIn(b"pantportal_cache_requests_total", resp.content)
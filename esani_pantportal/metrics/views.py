@@ -3,11 +3,19 @@
 # SPDX-License-Identifier: MPL-2.0
 
 import logging
+import os
 import tempfile
 
 from django.conf import settings
 from django.db import connection
 from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    generate_latest,
+    multiprocess,
+)
 
 log = logging.getLogger(__name__)
 
@@ -44,3 +52,14 @@ def health_check_database(request):
     except Exception:
         log.exception("Database health check failed")
         return HttpResponse("ERROR", status=500)
+
+
+def prometheus_metrics(request):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # Report the metrics of all gunicorn workers, rather than only the worker
+        # handling this request (see `project/gunicorn_conf.py`)
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
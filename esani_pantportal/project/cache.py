@@ -0,0 +1,303 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Two-tier cache backend.
+
+`TwoTierCache` keeps a small, bounded LRU cache in the memory of each process in front
+of a shared cache (by default the database cache). Reads are served from memory when
+possible, and only go to the shared cache when the key is not held locally. Writes and
+deletions go to both tiers.
+
+Entries are held in memory for at most `LOCAL_TIMEOUT` seconds, which bounds how long
+a process may serve a value which has been changed or deleted by another process.
+
+Related keys can be invalidated together by putting them in a namespace (see
+`make_namespaced_key`, `get_or_set_versioned` and `bump_namespace_version`). The
+versions of the namespaces are never held in memory, so invalidating a namespace takes
+effect in all processes at once.
+"""
+
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+from prometheus_client import Counter
+
+CACHE_REQUESTS = Counter(
+    "pantportal_cache_requests",
+    "Number of cache lookups, by cache, tier and result",
+    ["cache", "tier", "result"],
+)
+
+_MISSING = object()
+
+VERSION_KEY_PREFIX = "version:"
+"""Prefix of the keys holding the versions of namespaces, which are only held by the
+shared cache"""
+
+
+class _LocalTier:
+    """Thread-safe LRU cache of pickled values, each with its own expiry time"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+        # Values are pickled, so changes made by one request are not seen by others
+        return pickle.loads(pickled)
+
+    def set(self, key: str, value: Any, timeout: float):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, pickled)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Like `LocMemCache`, the local tiers are shared by all threads of the process
+_local_tiers: dict[str, _LocalTier] = {}
+
+
+class TwoTierCache(BaseCache):
+    """Cache backend with a per-process LRU cache in front of a shared cache.
+
+    Options:
+        SHARED_CACHE: Alias of the shared cache (default: "shared")
+        LOCAL_TIMEOUT: Maximum number of seconds entries are held in memory. Use 0 to
+            disable the local tier. (default: 5)
+        MAX_ENTRIES: Maximum number of entries held in memory (default: 300)
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._name = location or DEFAULT_CACHE_ALIAS
+        self._shared_alias = options.get("SHARED_CACHE", "shared")
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 5)
+        self._local = _local_tiers.setdefault(self._name, _LocalTier(self._max_entries))
+
+    @property
+    def shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    def _count(self, tier: str, result: str, amount: int = 1):
+        if amount:
+            CACHE_REQUESTS.labels(self._name, tier, result).inc(amount)
+
+    def _get_local_timeout(self, timeout) -> float:
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def _set_local(self, key: str, value: Any, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_key(key, version)
+        local_timeout = self._get_local_timeout(timeout)
+        if local_timeout > 0 and not self._is_shared_only(key):
+            self._local.set(local_key, value, local_timeout)
+        else:
+            self._local.delete(local_key)
+
+    def _delete_local(self, key: str, version=None):
+        self._local.delete(self.make_key(key, version))
+
+    @staticmethod
+    def _is_shared_only(key: str) -> bool:
+        return key.startswith(VERSION_KEY_PREFIX)
+
+    def _get_local(self, key: str, version=None) -> Any:
+        if self._is_shared_only(key):
+            return _MISSING
+        return self._local.get(self.make_key(key, version))
+
+    def get(self, key, default=None, version=None):
+        if not self._is_shared_only(key):
+            value = self._local.get(self.make_key(key, version))
+            if value is not _MISSING:
+                self._count("local", "hit")
+                return value
+            self._count("local", "miss")
+
+        value = self.shared.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count("shared", "miss")
+            return default
+        self._count("shared", "hit")
+        self._set_local(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        result = {}
+        missing = []
+        for key in keys:
+            value = self._get_local(key, version)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                result[key] = value
+        self._count("local", "hit", len(result))
+        self._count(
+            "local",
+            "miss",
+            len([key for key in missing if not self._is_shared_only(key)]),
+        )
+
+        if missing:
+            shared = self.shared.get_many(missing, version)
+            self._count("shared", "hit", len(shared))
+            self._count("shared", "miss", len(missing) - len(shared))
+            for key, value in shared.items():
+                self._set_local(key, value, version=version)
+            result.update(shared)
+        return result
+
+    def has_key(self, key, version=None):
+        if self._get_local(key, version) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version)
+        self._set_local(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version)
+        if added:
+            self._set_local(key, value, timeout, version)
+        else:
+            # The key is held by the shared cache, and must be read from there
+            self._delete_local(key, version)
+        return added
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key in failed:
+                self._delete_local(key, version)
+            else:
+                self._set_local(key, value, timeout, version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version)
+
+    def incr(self, key, delta=1, version=None):
+        self._delete_local(key, version)
+        return self.shared.incr(key, delta, version)
+
+    def delete(self, key, version=None):
+        self._delete_local(key, version)
+        return self.shared.delete(key, version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._delete_local(key, version)
+        self.shared.delete_many(keys, version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def clear_local(self):
+        """Clear the local tier of this process"""
+        self._local.clear()
+
+
+def get_version_key(namespace: str) -> str:
+    """Return the cache key holding the current version of the namespace"""
+    return f"{VERSION_KEY_PREFIX}{namespace}"
+
+
+def get_namespace_versions(
+    namespaces: Iterable[str], cache_alias=DEFAULT_CACHE_ALIAS
+) -> dict[str, str]:
+    """Return the current version of each namespace, read by a single lookup"""
+    cache = caches[cache_alias]
+    keys = {namespace: get_version_key(namespace) for namespace in namespaces}
+    cached = cache.get_many(keys.values())
+    versions = {}
+    for namespace, key in keys.items():
+        if key not in cached:
+            # A version must never be reused, even if the cache was cleared, so the
+            # keys of a namespace cannot refer to entries from before it was
+            # invalidated
+            cache.add(key, uuid.uuid4().hex, None)
+            cached[key] = cache.get(key)
+        versions[namespace] = cached[key]
+    return versions
+
+
+def get_namespace_version(namespace: str, cache_alias=DEFAULT_CACHE_ALIAS) -> str:
+    return get_namespace_versions([namespace], cache_alias)[namespace]
+
+
+def bump_namespace_version(namespace: str, cache_alias=DEFAULT_CACHE_ALIAS):
+    """Invalidate all keys of the namespace"""
+
+    def bump():
+        caches[cache_alias].set(get_version_key(namespace), uuid.uuid4().hex, None)
+
+    bump()
+    # A request may have cached the old values again before the change was committed
+    transaction.on_commit(bump)
+
+
+def make_namespaced_key(
+    namespace: str, key: str, cache_alias=DEFAULT_CACHE_ALIAS
+) -> str:
+    """Return a cache key which is invalidated by `bump_namespace_version`"""
+    return f"{namespace}:{get_namespace_version(namespace, cache_alias)}:{key}"
+
+
+def get_or_set_versioned(
+    namespace: str,
+    key: str,
+    default: Callable[[], Any],
+    timeout=DEFAULT_TIMEOUT,
+    cache_alias=DEFAULT_CACHE_ALIAS,
+) -> Any:
+    """Like `cache.get_or_set`, but the value is invalidated by
+    `bump_namespace_version`. The value is stored along with the version of the
+    namespace, so both are read by a single lookup."""
+    cache = caches[cache_alias]
+    version_key = get_version_key(namespace)
+    value_key = f"{namespace}:{key}"
+    cached = cache.get_many([version_key, value_key])
+    version = cached.get(version_key)
+    if version is not None and cached.get(value_key, (None,))[0] == version:
+        return cached[value_key][1]
+
+    version = version or get_namespace_version(namespace, cache_alias)
+    value = default()
+    cache.set(value_key, (version, value), timeout)
+    return value
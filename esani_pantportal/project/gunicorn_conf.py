@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Gunicorn configuration, used by `gunicorn -c project/gunicorn_conf.py`.
+
+Unless `GUNICORN_PRELOAD` is false, the application is loaded and warmed up by the
+master before the workers are forked (see `project.warm_start`.)
+
+The Prometheus metrics of the workers are shared through files in
+`PROMETHEUS_MULTIPROC_DIR`, so `/metrics/` reports the metrics of all workers.
+"""
+
+import gc
+import glob
+import os
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "True").lower() in ("true", "1")
+
+prometheus_multiproc_dir = os.environ.get(
+    "PROMETHEUS_MULTIPROC_DIR", "/tmp/prometheus_multiproc"
+)
+
+# Set before the application (and `prometheus_client`) is loaded
+raw_env = [f"PROMETHEUS_MULTIPROC_DIR={prometheus_multiproc_dir}"]
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+if preload_app:
+    # Avoid freeing objects in the master until the workers are forked, as the freed
+    # memory would be reused by new objects on pages otherwise shared with the workers
+    gc.disable()
+
+
+def on_starting(server):
+    # The metrics of earlier runs must not be reported. The files of the master may
+    # have been created by loading the application already.
+    for path in glob.glob(os.path.join(prometheus_multiproc_dir, "*.db")):
+        if not path.endswith(f"_{os.getpid()}.db"):
+            os.remove(path)
+
+
+def when_ready(server):
+    # Called by the master after loading the application and before forking workers
+    if server.cfg.preload_app:
+        from project.warm_start import freeze, warm_up
+
+        try:
+            warm_up()
+        except Exception:
+            # The workers can still start, and do the work themselves
+            server.log.exception("Could not warm up the application")
+        try:
+            freeze()
+        finally:
+            gc.enable()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    # Stop reporting the live gauges of the worker
+    multiprocess.mark_process_dead(worker.pid, prometheus_multiproc_dir)
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+WSGI handler running the API through a smaller middleware stack than the portal.
+
+The API is called often by the apps, and authenticates each request by its JWT. It
+has no use for the sessions, CSRF protection, messages, two-factor authentication and
+debugging tools the portal needs, so requests to `settings.LEAN_MIDDLEWARE_PATHS` are
+run through `settings.LEAN_MIDDLEWARE` instead of `settings.MIDDLEWARE`.
+"""
+
+import django
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+
+class _LeanHandler(BaseHandler):
+    def load_middleware(self, is_async=False):
+        # `BaseHandler.load_middleware` always loads `settings.MIDDLEWARE`. This only
+        # happens while the handler is created, before any requests are handled.
+        middleware = settings.MIDDLEWARE
+        settings.MIDDLEWARE = settings.LEAN_MIDDLEWARE
+        try:
+            super().load_middleware(is_async)
+        finally:
+            settings.MIDDLEWARE = middleware
+
+
+class RoutingWSGIHandler(WSGIHandler):
+    """WSGI handler running requests to `settings.LEAN_MIDDLEWARE_PATHS` through
+    `settings.LEAN_MIDDLEWARE`, and all other requests through `settings.MIDDLEWARE`"""
+
+    def load_middleware(self, is_async=False):
+        super().load_middleware(is_async)
+        self._lean_handler = _LeanHandler()
+        self._lean_handler.load_middleware(is_async)
+        self._lean_paths = tuple(settings.LEAN_MIDDLEWARE_PATHS)
+
+    def get_response(self, request):
+        if request.path_info.startswith(self._lean_paths):
+            return self._lean_handler.get_response(request)
+        return super().get_response(request)
+
+
+def get_wsgi_application() -> RoutingWSGIHandler:
+    """Like `django.core.wsgi.get_wsgi_application`, using `RoutingWSGIHandler`"""
+    django.setup(set_prefix=False)
+    return RoutingWSGIHandler()
@@ -0,0 +1,17 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+from django.contrib.auth.models import AnonymousUser
+
+
+def AnonymousUserMiddleware(get_response):
+    """Set `request.user` to an anonymous user, to be replaced when the request is
+    authenticated by its JWT. Used instead of `AuthenticationMiddleware` where there
+    are no sessions, as the permission classes of the API expect `request.user`."""
+
+    def middleware(request):
+        request.user = AnonymousUser()
+        return get_response(request)
+
+    return middleware
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+PostgreSQL backend reporting how long it takes to get a database connection, how long
+each connection is used, and the state of the connection pools.
+
+Without a pool (`DATABASE_POOL`), getting a connection means connecting to the
+database, and a connection is used until it is closed, i.e. for up to `CONN_MAX_AGE`
+seconds. With a pool, getting a connection includes waiting for the pool, and a
+connection is used until it is returned to the pool at the end of the request.
+"""
+
+import time
+
+from django.db.backends.postgresql import base
+from prometheus_client import Counter, Gauge, Histogram
+
+CONNECTION_WAIT = Histogram(
+    "pantportal_db_connection_wait_seconds",
+    "Time spent getting a database connection, by database alias",
+    ["alias"],
+)
+CONNECTION_LIFETIME = Histogram(
+    "pantportal_db_connection_lifetime_seconds",
+    "Time each database connection is used, by database alias",
+    ["alias"],
+    buckets=(0.01, 0.1, 1, 10, 60, 300, 900, 3600, float("inf")),
+)
+
+# Each process has its own pools, so their state is reported for each live process
+# when metrics are collected from several processes (see `metrics.views`)
+POOL_MAX_SIZE = Gauge(
+    "pantportal_db_pool_max_connections",
+    "Maximum number of connections in the pool, by database alias",
+    ["alias"],
+    multiprocess_mode="liveall",
+)
+POOL_SIZE = Gauge(
+    "pantportal_db_pool_connections",
+    "Number of connections in the pool, by database alias",
+    ["alias"],
+    multiprocess_mode="liveall",
+)
+POOL_AVAILABLE = Gauge(
+    "pantportal_db_pool_available_connections",
+    "Number of idle connections in the pool, by database alias",
+    ["alias"],
+    multiprocess_mode="liveall",
+)
+POOL_WAITING = Gauge(
+    "pantportal_db_pool_waiting_requests",
+    "Number of requests waiting for a connection, by database alias",
+    ["alias"],
+    multiprocess_mode="liveall",
+)
+POOL_WAIT_TIME = Counter(
+    "pantportal_db_pool_wait_seconds",
+    "Total time spent waiting for a connection, by database alias",
+    ["alias"],
+)
+POOL_ERRORS = Counter(
+    "pantportal_db_pool_errors",
+    "Number of requests for a connection which failed (e.g. timed out), "
+    "by database alias",
+    ["alias"],
+)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _opened_at: float | None = None
+
+    def get_new_connection(self, conn_params):
+        start = time.monotonic()
+        try:
+            connection = super().get_new_connection(conn_params)
+        finally:
+            self._report_pool_stats()
+        self._opened_at = time.monotonic()
+        CONNECTION_WAIT.labels(self.alias).observe(self._opened_at - start)
+        return connection
+
+    def _close(self):
+        try:
+            super()._close()
+        finally:
+            self._report_pool_stats()
+            if self._opened_at is not None:
+                CONNECTION_LIFETIME.labels(self.alias).observe(
+                    time.monotonic() - self._opened_at
+                )
+                self._opened_at = None
+
+    def close_pool(self):
+        super().close_pool()
+        # E.g. the pool of the gunicorn master, closed before forking the workers
+        for gauge in (POOL_MAX_SIZE, POOL_SIZE, POOL_AVAILABLE, POOL_WAITING):
+            gauge.labels(self.alias).set(0)
+
+    def _report_pool_stats(self):
+        """Report the state of the pool of this process, if any, whenever a connection
+        is taken from or returned to it"""
+        # Unlike `self.pool`, this does not open a pool which has been closed
+        pool = self._connection_pools.get(self.alias)
+        if pool is None:
+            return
+        # Returns the counters accumulated since the last call, and resets them
+        stats = pool.pop_stats()
+        POOL_MAX_SIZE.labels(self.alias).set(stats.get("pool_max", 0))
+        POOL_SIZE.labels(self.alias).set(stats.get("pool_size", 0))
+        POOL_AVAILABLE.labels(self.alias).set(stats.get("pool_available", 0))
+        POOL_WAITING.labels(self.alias).set(stats.get("requests_waiting", 0))
+        POOL_WAIT_TIME.labels(self.alias).inc(stats.get("requests_wait_ms", 0) / 1000)
+        POOL_ERRORS.labels(self.alias).inc(stats.get("requests_errors", 0))
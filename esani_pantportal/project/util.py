@@ -3,7 +3,10 @@
 # SPDX-License-Identifier: MPL-2.0
 
 import base64
+import importlib.util
+import sys
 from decimal import Decimal
+from types import ModuleType
 
 import orjson
 from django.core.files import File
@@ -42,3 +45,22 @@ def strtobool(val):
         return 0
     else:
         raise ValueError("invalid truth value %r" % (val,))
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Return the module `name`, which is not executed until one of its attributes is
+    accessed. Used for heavy dependencies which are only needed by a few views and
+    commands, so they are not loaded by every worker and management command.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: 2026 Magenta ApS <info@magenta.dk>
+#
+# SPDX-License-Identifier: MPL-2.0
+
+"""
+Warm start of the gunicorn workers (see `project/gunicorn_conf.py`.)
+
+The application is loaded by the gunicorn master, which also does the work each worker
+would otherwise do when handling its first requests: populating the URL resolvers,
+compiling the templates and loading the index of QR code intervals. The workers are
+then forked from the master, and share its memory until they write to it.
+"""
+
+import gc
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import get_resolver
+from django.utils import translation
+
+from esani_pantportal.models import qr_code_index
+from esani_pantportal.reference_data import get_city_names, get_qr_status_names
+
+logger = logging.getLogger(__name__)
+
+
+def _compile_templates() -> int:
+    """Compile the HTML templates found by each template engine. Compiled templates
+    are kept by the cached template loader, which is used when `DEBUG` is off.
+    Templates which cannot be compiled are logged and skipped, and fail when they are
+    used instead."""
+    count = 0
+    for engine in engines.all():
+        dirs = [
+            directory
+            for loader in engine.engine.template_loaders
+            for directory in loader.get_dirs()
+        ]
+        for directory in dirs:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    if name.endswith(".html"):
+                        path = os.path.join(root, name)
+                        template_name = os.path.relpath(path, directory)
+                        try:
+                            engine.get_template(template_name)
+                        except (TemplateDoesNotExist, TemplateSyntaxError):
+                            logger.exception(
+                                f"Could not compile template {template_name}"
+                            )
+                        else:
+                            count += 1
+    return count
+
+
+def warm_up():
+    """Populate the URL resolvers, compile the templates, and load the QR code index
+    and the reference data"""
+    # URL resolvers are populated for each language
+    for language, _ in settings.LANGUAGES:
+        with translation.override(language):
+            get_resolver()._populate()
+    count = _compile_templates()
+    # The index is reloaded by each worker as QR codes are generated
+    qr_code_index.load()
+    get_city_names()
+    get_qr_status_names()
+    logger.info(f"Warmed up URL resolvers and {count} templates")
+
+
+def freeze():
+    """Prepare the process for forking: close its connections and connection pools,
+    which must not be shared with the forked processes, and move all objects into the
+    permanent generation of the garbage collector. Collecting garbage in the forked
+    processes then does not touch (and copy) the memory of the objects created so
+    far."""
+    connections.close_all()
+    for connection in connections.all(initialized_only=True):
+        if connection.vendor == "postgresql":
+            # Pools have threads and connections of their own
+            connection.close_pool()
+    for cache in caches.all(initialized_only=True):
+        cache.close()
+    gc.freeze()